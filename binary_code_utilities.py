@@ -3,24 +3,16 @@
 Various utilities for dealing with binary codes: representation, reading from a file, calculating the bit sum, Hamming distances, comparing values within sets, etc.  See individual function docstrings for details.
 """
 
-import sys
-from collections import defaultdict
+import sys, os
+import struct
+import hashlib
+import zlib
+from collections import defaultdict, Counter, OrderedDict
 import itertools
+import numpy
 from numpy import array, dot
 import random
 import unittest
-import bitstring
-
-# test bitstring module BitArray.bin behavior!  It changed at some point between early 2012 and early 2013...
-_b = bitstring.BitArray(bin='111').bin
-if _b == '111':         _bitstring_behavior = 'NEW'
-elif _b == '0b111':     _bitstring_behavior = 'OLD'
-else:                     
-    sys.exit("Unexpected bitstring module behavior!  bitstring.BitArray(bin='111') should be '111' or '0b111', is %s!"%_bin)
-
-# two functions to get binary string from BitArray, depending on bitstring module version
-def _get_Bc_string_old(binary_codeword):    return binary_codeword.codeword.bin[2:]
-def _get_Bc_string_new(binary_codeword):    return binary_codeword.codeword.bin
 
 # my modules
 from general_utilities import invert_dict_tolists, invert_listdict_tolists
@@ -32,73 +24,122 @@ class BinaryCodeError(Exception):
 
 ######### Binary string representations
 
-class Binary_codeword:
+class Binary_codeword(object):
     """ A binary string representation (like '01101'), with a defined length. Supports |, &, ^, ~ bitwise operators.
 
     Can be made from string, int, list.  
     Not just a binary representation of an integer: '001' and '01' are distinct. 
 
     Not actually represented as strings internally - that would be insanely slow.
-    Implemented using the bistring package: 
-        http://pypi.python.org/pypi/bitstring/2.2.0 , http://code.google.com/p/python-bitstring/ """
+    Represented as a (length, value) pair, where value is a plain python int whose binary representation, 
+     left-padded with 0s to length, is the codeword (so the leftmost bit of the codeword is the highest bit of value).
+    Instances should be treated as immutable: there are no methods that change them, all the bitwise operators 
+     return new instances, and the hash is calculated once and cached.  
+    Uses __slots__ to keep the per-instance memory low, since codes can contain many thousands of codewords. """
     #  see http://stackoverflow.com/questions/142812/does-python-have-a-bitfield-type for more implementation options
+    # (previously implemented using the bitstring package - an order of magnitude slower and bigger than plain ints)
+
+    __slots__ = ('length', 'value', '_hash')
 
     def __init__(self,val,length=None,check_length=False):
-        """ Generate the self.codeword binary word based on val; pad with 0s on the left to desired length if specified.
+        """ Generate the codeword based on val; pad with 0s on the left to desired length if specified.
         If check_length is True, instead of padding make sure the length is as specified, raise BinaryCodeError if not.
         If val is a 0/1 string, strip spaces/newlines and convert straight to a binary string.
         If val is an int, act as if the builtin bin() function was used to convert to a string (stripping initial 0b).
-        If val is a list of 0/1 or True/False values, treat it as the corresponding 0/1 string.
-        If val is a Binary_codeword instance, just copy it.
-        How other argument types will behave is not guaranteed - depends on the package used for the representation."""
-        # for binary strings just specify it's bin: '110' and '0b110' and '  110\n' and '11 0' all give the same result
-        if isinstance(val,str):   
-            self.codeword = bitstring.BitArray(bin=val)
-        # for ints, use the uint method if we know the length, otherwise have to convert to string
-        elif isinstance(val,int):
-            if length is not None:  self.codeword = bitstring.BitArray(uint=val,length=length)
-            else:                   self.codeword = bitstring.BitArray(bin(val))
-        # for Binary_codeword instances, make a new one with the same bitstring
+        If val is a list of 0/1 or True/False values, treat it as the corresponding 0/1 string 
+         (any other sequence, like a tuple or a numpy array, is treated the same way, based on the truth of each element).
+        If val is a Binary_codeword instance, just copy it."""
+        # for binary strings: '110' and '0b110' and '  110\n' and '11 0' all give the same result
+        if isinstance(val,basestring):   
+            val_string = ''.join(val.split())
+            if val_string.startswith('0b'):     val_string = val_string[2:]
+            if val_string.strip('01'):
+                raise BinaryCodeError("Can't make a binary codeword from string %s - only 0/1 allowed!"%repr(val))
+            val_length = len(val_string)
+            value = int(val_string,2) if val_string else 0
+        # for ints, the length is the bin() length unless we know the length
+        elif isinstance(val,(int,long)):
+            if val<0:
+                raise BinaryCodeError("Can't make a binary codeword from negative integer %s!"%val)
+            value = val
+            # (if the length is given and the value fits in it, use it directly - 0 is a valid length-0 value, too)
+            if length is not None and length >= 0 and not val >> length:    val_length = length
+            else:                                                           val_length = len(bin(val))-2
+        # for Binary_codeword instances, make a new one with the same value
         elif isinstance(val,Binary_codeword):
-            self.codeword = bitstring.BitArray(val.codeword)
-        # lists of 0/1 or True/False values natively work as expected; I don't know or care what happens with other types.
-        else:                       self.codeword = bitstring.BitArray(val)   
+            value, val_length = val.value, val.length
+        # lists of 0/1 or True/False values (or other sequences) - each element is a bit, based on its truth value
+        else:
+            val_string = ''.join(['1' if x else '0' for x in val])
+            val_length = len(val_string)
+            value = int(val_string,2) if val_string else 0
         # pad to given length or check the length if necessary
-        if length is not None and not length==len(self):
+        if length is not None and not length==val_length:
             # if only checking the length, raise an error
             if check_length:
                 raise BinaryCodeError("The created binary codeword didn't match the expected length!")
-            # otherwise pad with 0s on the left to the given length (does nothing if length < len(self)
-            self.codeword.prepend((length-len(self))*[0])
-            # unless it's already too long, then raise an error
-            if length-len(self) < 0:
-                raise BinaryCodeError("Can't pad the codeword %s to length %s, "%(self.codeword,length)
+            # if it's already too long, raise an error; otherwise the padding with 0s on the left is implicit
+            if length-val_length < 0:
+                raise BinaryCodeError("Can't pad the codeword %s to length %s, "%(bin(value)[2:].zfill(val_length),length)
                                       + "since that's lower than its current length!")
+            val_length = length
+        self.length = val_length
+        self.value = value
+        # NOTE: comparison and hashing are related and need to match!  See notes in __cmp__
+        self._hash = hash((val_length, value))
+
+    @classmethod
+    def _from_int(cls, value, length):
+        """ Fast internal constructor: make a new instance directly from an int value and length, with no checking. """
+        new = object.__new__(cls)
+        new.length = length
+        new.value = value
+        new._hash = hash((length, value))
+        return new
 
     # TODO this should be a property, really!  Same for a lot of the below.
     def weight(self):
         """ Return the number of 1's in the codeword (i.e. the Hamming weight or bitwise sum)."""
-        return self.codeword.count(1)
+        return bin(self.value).count('1')
 
-    # string function depends on bitstring module version/behavior (it changed on me at some point)
-    #  (I'm doing it this way instead of putting a test inside the string function for speed)
-    if _bitstring_behavior == 'NEW':        string = _get_Bc_string_new
-    elif _bitstring_behavior == 'OLD':      string = _get_Bc_string_old
-    string.__doc__ = """ Return a plain 0/1 string representation. """
+    def string(self):
+        """ Return a plain 0/1 string representation. """
+        if not self.length:     return ''
+        return format(self.value, '0%sb'%self.length)
 
     def list(self):
         """ Return a representation as a list of ints (0 or 1). """
-        return [int(x) for x in list(self.codeword)]
+        return [int(x) for x in self.string()]
 
     def __len__(self):
         """ Return the length of the codeword."""
-        return self.codeword.length
-
-    # Bitwise and, or, xor, not operators - just passed on to the underlying bitstring objects.
-    def __and__(self,other):    return Binary_codeword(self.codeword & other.codeword)
-    def __or__(self,other):     return Binary_codeword(self.codeword | other.codeword)
-    def __xor__(self,other):    return Binary_codeword(self.codeword ^ other.codeword)
-    def __invert__(self):       return Binary_codeword(~self.codeword)
+        return self.length
+
+    # Bitwise and, or, xor, not operators - done directly on the int values, only allowed for same-length codewords.
+    def _check_other_length(self,other):
+        if not self.length==other.length:
+            raise ValueError("Can't do bitwise operations on binary codewords of different lengths (%s and %s)!"%(
+                                self.length, other.length))
+    def __and__(self,other):    
+        if not self.length==other.length:    self._check_other_length(other)
+        return Binary_codeword._from_int(self.value & other.value, self.length)
+    def __or__(self,other):     
+        if not self.length==other.length:    self._check_other_length(other)
+        return Binary_codeword._from_int(self.value | other.value, self.length)
+    def __xor__(self,other):    
+        if not self.length==other.length:    self._check_other_length(other)
+        return Binary_codeword._from_int(self.value ^ other.value, self.length)
+    def __invert__(self):       
+        return Binary_codeword._from_int(self.value ^ ((1 << self.length) - 1), self.length)
+
+    def __eq__(self,other):
+        """ Two instances with the same length and value are equal; instances are never equal to other types."""
+        if not isinstance(other,Binary_codeword):   return False
+        return self.value == other.value and self.length == other.length
+
+    def __ne__(self,other):
+        if not isinstance(other,Binary_codeword):   return True
+        return self.value != other.value or self.length != other.length
 
     def __cmp__(self,other):
         """ Comparison/sorting based on string representation: Two instances with the same bitstring should be equal."""
@@ -109,20 +150,22 @@ class Binary_codeword:
         #   If I implement __cmp__ but not __hash__, the objects are considered unhashable, because otherwise
         #     there can be cases where x==y but hash(x)!=hash(y), which is BAD for hashing.  
         #   See http://docs.python.org/reference/datamodel.html#object.__hash__ for more on this.
-        # MAYBE-TODO in order to make this absolutely right, I should make sure the bitstrings are immutable... How?
-        #   Apparently newer version of bistring has an immutable Bits type - could use that instead of BitArray?
+        # The values are immutable by convention (nothing ever modifies an existing instance), so caching the hash is safe.
         # MAYBE-TODO is string comparison really what I want here?  How about when the lengths are different? Should 
         #   bitstrings with different lengths even be comparable?  I suppose they should just so I can sort stuff and 
         #   get a consistent result. Possibly just sorting by length first would be better, but it doesn't matter much.
         #   As long as identity works correctly and there's SOME reproducible sorting, we're fine.
-        # MAYBE-TODO should I also implement comparison to strings and such, by doing binary_codeword(other).string()?
-        #   That conversion should probably be taken care of in the function performing the comparison.
+        # For same-length codewords, comparing the int values gives the same result as comparing the strings.
+        if self.length == other.length:     return cmp(self.value,other.value)
         return cmp(self.string(),other.string())
 
     def __hash__(self):
-        """ Hashing based on the string representation."""
+        """ Hashing based on the length and value (calculated once, on creation)."""
         # NOTE: comparison and hashing are related and need to match!  See notes in __cmp__
-        return hash(self.string())
+        return self._hash
+
+    # new-style class with __slots__ and no __dict__ - need to say explicitly how to pickle it
+    def __reduce__(self):   return (Binary_codeword, (self.value, self.length))
 
     # This is exactly as it should be: __repr__ gives the full evaluatable definition, __str__ gives something readable.
     def __repr__(self):     return "Binary_codeword('%s')"%self.string()
@@ -166,52 +209,1923 @@ def _change_all_position_combinations(val, max_N_changes, allowed_change_positio
     return new_value_set
 
 
+# Mutation engine: all the codewords within a given number of bit changes of a codeword are generated by XORing it 
+#  with precomputed flip masks (ints with at most that many 1 bits), rather than by changing lists position by position.
+# The mask tables only depend on (length, radius), so they're kept in a small LRU cache.
+
+_FLIP_MASK_TABLE_CACHE = OrderedDict()
+_FLIP_MASK_TABLE_CACHE_SIZE = 16
+
+def flip_mask_table(length, radius):
+    """ Return a tuple of all the ints of the given bit length with at most radius bits set (i.e. all the flip masks 
+    for at most radius changes), ordered by weight, and the same as a uint64 numpy array (or None for length>64).
+    Results are kept in an LRU cache keyed by (length, radius) - don't modify them. """
+    key = (length, radius)
+    try:
+        tables = _FLIP_MASK_TABLE_CACHE.pop(key)
+    except KeyError:
+        masks = [0] if radius>=0 else []
+        for N_changes in range(1, min(radius,length)+1):
+            for positions in itertools.combinations(range(length), N_changes):
+                masks.append(sum(1<<pos for pos in positions))
+        masks = tuple(masks)
+        tables = (masks, array(masks, dtype=numpy.uint64) if length<=64 else None)
+        if len(_FLIP_MASK_TABLE_CACHE) >= _FLIP_MASK_TABLE_CACHE_SIZE:
+            _FLIP_MASK_TABLE_CACHE.popitem(last=False)
+    _FLIP_MASK_TABLE_CACHE[key] = tables
+    return tables
+
+def _check_N_permitted_changes(N_permitted_changes):
+    if isinstance(N_permitted_changes,int):
+        return
+    if isinstance(N_permitted_changes,tuple) and len(N_permitted_changes)==2:
+        return
+    raise ValueError("N_permitted_changes must be an int or a tuple of two ints!")
+
+def iter_mutation_value_chunks(value, length, N_permitted_changes):
+    """ Iterate over the values (ints) of all the codewords that are too close to the given codeword value 
+    (see expand_by_all_mutations for details), without repeats.  Yields the values in chunks, as lists (or arrays). 
+
+    For the (N_1_to_0_changes, N_0_to_1_changes) tuple form, the mask tables are filtered to the ones that only 
+     touch the 1 positions or only the 0 positions of value, and all combinations of those are used. """
+    _check_N_permitted_changes(N_permitted_changes)
+    if isinstance(N_permitted_changes,int):
+        masks, mask_array = flip_mask_table(length, N_permitted_changes)
+        if mask_array is not None:  yield (mask_array ^ numpy.uint64(value)).tolist()
+        else:                       yield [value^mask for mask in masks]
+        return
+    (permitted_1_to_0_changes,permitted_0_to_1_changes) = N_permitted_changes
+    zeros = ~value & ((1<<length)-1)
+    masks_1_to_0, mask_array_1_to_0 = flip_mask_table(length, permitted_1_to_0_changes)
+    masks_0_to_1, mask_array_0_to_1 = flip_mask_table(length, permitted_0_to_1_changes)
+    if mask_array_1_to_0 is not None:
+        masks_1_to_0 = mask_array_1_to_0[(mask_array_1_to_0 & numpy.uint64(zeros))==0] ^ numpy.uint64(value)
+        masks_0_to_1 = mask_array_0_to_1[(mask_array_0_to_1 & numpy.uint64(value))==0]
+        for halfway_value in masks_1_to_0:
+            yield (masks_0_to_1 ^ halfway_value).tolist()
+    else:
+        masks_0_to_1 = [mask for mask in masks_0_to_1 if not mask & value]
+        for mask_1_to_0 in masks_1_to_0:
+            if not mask_1_to_0 & zeros:
+                halfway_value = value ^ mask_1_to_0
+                yield [halfway_value ^ mask for mask in masks_0_to_1]
+
+def iter_mutations(codeword, N_permitted_changes):
+    """ Iterate over all the codewords that are too close to the given Binary_codeword, without repeats 
+    (see expand_by_all_mutations for details).  Includes the codeword itself if the number of changes isn't negative. """
+    length = codeword.length
+    for values in iter_mutation_value_chunks(codeword.value, length, N_permitted_changes):
+        for value in values:
+            yield Binary_codeword._from_int(value, length)
+
 def expand_by_all_mutations(codeword_set, N_permitted_changes):
     """ Return set of all codewords that are too close to codeword_set (distant by at most the given number of changes).
     N_permitted_changes can be given either as a single value, or as a (N_1_to_0_changes, N_0_to_1_changes) tuple."""
-    codewords_as_lists = [codeword.list() for codeword in codeword_set]
+    _check_N_permitted_changes(N_permitted_changes)
     expanded_codeword_set = set()
-
-    if isinstance(N_permitted_changes,int):
-        for codeword in codewords_as_lists:
-            # change all possible combinations of positions (0s or 1s, all positions are allowed)
-            new_val_full_set = _change_all_position_combinations(codeword,N_permitted_changes)
-            expanded_codeword_set.update([Binary_codeword(new_val) for new_val in new_val_full_set])
-
-    elif isinstance(N_permitted_changes,tuple) and len(N_permitted_changes)==2:
-        (permitted_1_to_0_changes,permitted_0_to_1_changes) = N_permitted_changes
-        for codeword in codewords_as_lists:
-            # change all possible combinations of 1s to 0s up to the allowed limit
-            list_of_1_positions = [x for x in range(len(codeword)) if codeword[x]==1]
-            new_val_halfway_set = _change_all_position_combinations(codeword,permitted_1_to_0_changes,list_of_1_positions)
-            # now take each of the resulting values and change all possible combinations of 0s up to the allowed limit
-            for new_val in new_val_halfway_set:
-                list_of_0_positions = [x for x in range(len(new_val)) if new_val[x]==0]
-                new_val_full_set = _change_all_position_combinations(new_val, permitted_0_to_1_changes,list_of_0_positions)
-                expanded_codeword_set.update([Binary_codeword(new_val) for new_val in new_val_full_set])
-    else:
-        raise ValueError("N_permitted_changes must be an int or a tuple of two ints!")
-
+    for codeword in codeword_set:
+        expanded_codeword_set.update(iter_mutations(codeword, N_permitted_changes))
     return expanded_codeword_set
 
 
 def expand_by_all_mutations_dict(codeword_set, N_permitted_changes):
     """ Return a dictionary with the keys being all the codeword too close to codeword_set, 
-     and the values being the list of base codewords that that particular result codeword was too close to.
+     and the values being the set of base codewords that that particular result codeword was too close to.
     (See expand_by_all_mutations docstring for details on what "too close" means.) """
-    codeword_to_expanded_set = dict()
+    _check_N_permitted_changes(N_permitted_changes)
+    expanded_codeword_to_base_codewords = defaultdict(set)
     for C in codeword_set:
-        codeword_to_expanded_set[C] = expand_by_all_mutations([C], N_permitted_changes)
-    return invert_listdict_tolists(codeword_to_expanded_set)
+        for expanded_codeword in iter_mutations(C, N_permitted_changes):
+            expanded_codeword_to_base_codewords[expanded_codeword].add(C)
+    return dict(expanded_codeword_to_base_codewords)
+
+
+######### Packed numpy representation of many same-length codewords (for vectorized operations on whole codes)
+
+_UINT64_MASK = 2**64-1
+_native_bitwise_count = getattr(numpy, 'bitwise_count', None)
+# constants for the bit-parallel popcount: alternating bits, bit pairs and nibbles, and the byte-summing multiplier
+_POPCOUNT_MASKS = [numpy.uint64(x) for x in (0x5555555555555555, 0x3333333333333333, 0x0f0f0f0f0f0f0f0f, 
+                                             0x0101010101010101)]
+
+def _popcount_uint64(words):
+    """ Return the number of 1 bits in each element of a uint64 numpy array (of any shape), as an int array. 
+    Uses numpy's native popcount (numpy.bitwise_count, numpy 2.0+) if available, otherwise the bit-parallel method
+     (adding up bit pairs, then nibbles, then bytes - about twice as fast as a byte lookup table). """
+    words = numpy.asarray(words, dtype=numpy.uint64)
+    if words.size==0:   return numpy.zeros(words.shape, dtype=numpy.int64)
+    if _native_bitwise_count is not None:   return _native_bitwise_count(words).astype(numpy.int64)
+    bits, bit_pairs, nibbles, byte_sum = _POPCOUNT_MASKS
+    counts = words - ((words >> numpy.uint64(1)) & bits)
+    counts = (counts & bit_pairs) + ((counts >> numpy.uint64(2)) & bit_pairs)
+    counts = (counts + (counts >> numpy.uint64(4))) & nibbles
+    return ((counts * byte_sum) >> numpy.uint64(56)).astype(numpy.int64)
+
+def _words_per_codeword(length):
+    """ Number of uint64 words needed to store one codeword of the given length (always at least 1). """
+    return max(1, (length+63)//64)
+
+def _int_to_words(value, N_words):
+    """ Split an int into N_words 64-bit chunks, highest bits first. """
+    return [(value >> (64*(N_words-1-i))) & _UINT64_MASK for i in range(N_words)]
+
+def _words_to_int(words):
+    """ Join a sequence of 64-bit chunks (highest bits first) back into one int. """
+    value = 0
+    for word in words:  value = (value << 64) | int(word)
+    return value
+
+
+class Packed_binary_code(object):
+    """ A set of same-length codewords, stored as a numpy uint64 array rather than a set of Binary_codeword objects.
+
+    For codeword lengths up to 64, self.words is a 1D array with one uint64 per codeword (the Binary_codeword.value); 
+     for longer codewords it's an N x ceil(length/64) 2D array, with the highest (leftmost) bits in the first column.
+    The rows are always unique and sorted by value, so a given set of codewords has exactly one packed representation.
+
+    Provides vectorized versions of the Binary_code summary methods (size, find_bit_sum_counts, total_bit_sum, 
+     bit_sums_across_digits, choose_codewords_by_bit_sum, give_N_codewords_random) - this is what Binary_code uses 
+     for those internally, through Binary_code.packed().  Convert back to codewords with codeword_list/codewords, 
+     or to a full Binary_code with to_binary_code.
+    """
+
+    def __init__(self, length, words=(), already_sorted=False):
+        """ Make a packed code from a uint64 array (or anything numpy can make one from) - see class docstring for shape.
+        The rows are sorted and deduplicated, unless already_sorted is True (then it's up to the caller!). """
+        try: 
+            self.length = int(length)
+        except (ValueError,TypeError):  
+            raise BinaryCodeError('Packed_binary_code length argument "%s" is not an int!'%length)
+        self.N_words = _words_per_codeword(self.length)
+        words = numpy.asarray(words, dtype=numpy.uint64)
+        if self.N_words==1:     words = words.reshape(-1)
+        else:                   words = words.reshape(-1, self.N_words)
+        if not already_sorted and len(words):
+            if self.N_words==1:     words = numpy.unique(words)
+            else:                   words = numpy.unique(words, axis=0)
+        if len(words) and self.length<64:
+            if (words >> numpy.uint64(self.length)).any():
+                raise BinaryCodeError("Packed_binary_code values don't fit in codeword length %s!"%self.length)
+        self.words = words
+
+    @classmethod
+    def from_codewords(cls, length, codewords):
+        """ Make a packed code from a sequence/set of Binary_codeword objects (or anything Binary_codeword accepts). """
+        N_words = _words_per_codeword(length)
+        values = [Binary_codeword(c,length=length,check_length=True).value for c in codewords]
+        if N_words==1:  return cls(length, array(values, dtype=numpy.uint64))
+        else:           return cls(length, array([_int_to_words(v,N_words) for v in values], dtype=numpy.uint64))
+
+    def size(self):
+        """ Return the number of codewords. """
+        return len(self.words)
+
+    def __len__(self):  return len(self.words)
+
+    def values(self):
+        """ Return a list of the codeword int values (Binary_codeword.value), in sorted order. """
+        if self.N_words==1:     return [int(x) for x in self.words]
+        else:                   return [_words_to_int(row) for row in self.words]
+
+    def codeword_list(self):
+        """ Return a sorted list of Binary_codeword objects. """
+        return [Binary_codeword._from_int(v, self.length) for v in self.values()]
+
+    def codewords(self):
+        """ Return a set of Binary_codeword objects. """
+        return set(self.codeword_list())
+
+    def to_binary_code(self):
+        """ Return a normal set-based Binary_code with the same codewords. """
+        return Binary_code(self.length, self.codeword_list())
+
+    def fingerprint(self):
+        """ Return a content hash (hex string) - the same for any two packed codes with the same length and codewords. """
+        return hashlib.sha1(struct.pack('<QQ', self.length, self.size()) 
+                            + numpy.ascontiguousarray(self.words, dtype='<u8').tobytes()).hexdigest()
+
+    def __eq__(self,other):     
+        return self.length == other.length and numpy.array_equal(self.words, other.words)
+    def __ne__(self,other):     return not self == other
+
+    def __str__(self):      return "<Packed_binary_code instance of length %s and size %s>"%(self.length,self.size())
+    def __repr__(self):     return "<Packed_binary_code instance of length %s and size %s>"%(self.length,self.size())
+
+    def _digit_bits(self, digit):
+        """ Return a 0/1 uint64 array giving the value of the given digit (0 is leftmost) of each codeword. """
+        bit_position = self.length-1-digit
+        if self.N_words==1:     column = self.words
+        else:                   column = self.words[:, self.N_words-1-bit_position//64]
+        return (column >> numpy.uint64(bit_position%64)) & numpy.uint64(1)
+
+    def weights(self):
+        """ Return an int array giving the weight (bit-sum) of each codeword, in the same order as the rows. """
+        weights = _popcount_uint64(self.words)
+        if self.N_words>1:  weights = weights.sum(axis=1)
+        return weights
+
+    def weight_histogram(self):
+        """ Return an int array with the number of codewords of each weight (0 to length). """
+        return numpy.bincount(self.weights(), minlength=self.length+1)
+
+    def find_bit_sum_counts(self):
+        """ Same as Binary_code.find_bit_sum_counts: sorted list of (bit-sum, count) tuples, for bit-sums that occur."""
+        return [(bit_sum,int(count)) for (bit_sum,count) in enumerate(self.weight_histogram()) if count]
+
+    def total_bit_sum(self):
+        """ Return the total sum of bits in all the codewords."""
+        return int(self.weights().sum())
+
+    def bit_sums_across_digits(self):
+        """ Return a list giving the total number of codewords with a 1 at each digit, over codeword length. """
+        return [int(self._digit_bits(digit).sum()) for digit in range(self.length)]
+
+    def find_Hamming_distance_range(self, low_threshold=None, tile_size=512):
+        """ Same as Binary_code.find_Hamming_distance_range (see packed_Hamming_distance_range for the arguments). """
+        if self.size()==0:  return None,None
+        return packed_Hamming_distance_range(self.words, self.length, low_threshold, tile_size)
+
+    def Hamming_distance_histogram(self, tile_size=512):
+        """ Same as Binary_code.Hamming_distance_histogram (see packed_Hamming_distance_histogram). """
+        return packed_Hamming_distance_histogram(self.words, self.length, tile_size)
+
+    def subset(self, indices):
+        """ Return a new Packed_binary_code containing only the codewords with the given row indices (or boolean mask). """
+        return Packed_binary_code(self.length, self.words[indices], already_sorted=True)
+
+    def choose_codewords_by_bit_sum(self, low, high):
+        """ Return a new Packed_binary_code containing codewords with bit sums in low-high range.
+        If high is -1, don't apply an upper bound. """
+        weights = self.weights()
+        if high==-1:    return self.subset(weights >= low)
+        else:           return self.subset((weights >= low) & (weights <= high))
+
+    def give_N_codewords_random(self, N, random_generator=random):
+        """ Return a new Packed_binary_code with N randomly chosen codewords (error if N is higher than current size).
+        The choice is made with random_generator (the random module, or a random.Random instance). """
+        if N>self.size():
+            raise BinaryCodeError("Cannot reduce the code to %s elements, it's already only %s!"%(N,self.size()))
+        return self.subset(numpy.sort(array(random_generator.sample(xrange(self.size()), N), dtype=numpy.int64)))
+
+
+def _pair_distance_tile(words, row_start, row_end, column_start, column_end):
+    """ Return the Hamming distances between rows row_start-row_end and rows column_start-column_end of a packed words 
+    array, as a 2D int array (tile[i,j] is the distance between rows row_start+i and column_start+j). """
+    tile = _popcount_uint64(words[row_start:row_end, None] ^ words[None, column_start:column_end])
+    if tile.ndim==3:    tile = tile.sum(axis=2)
+    return tile
+
+def _iter_pair_distance_tiles(words, tile_size=512):
+    """ Yield the Hamming distances between all pairs of different rows of a packed words array, one tile at a time: 
+    as 1D int arrays, each covering a tile_size x tile_size block of pairs (only i<j pairs, so each pair once). """
+    N = len(words)
+    for row_start in range(0, N, tile_size):
+        row_end = min(row_start+tile_size, N)
+        for column_start in range(row_start, N, tile_size):
+            column_end = min(column_start+tile_size, N)
+            tile = _pair_distance_tile(words, row_start, row_end, column_start, column_end)
+            # on the diagonal, only take the pairs above it (each pair once, no codeword paired with itself)
+            if column_start==row_start:     tile = tile[numpy.triu_indices(row_end-row_start, 1, column_end-column_start)]
+            else:                           tile = tile.reshape(-1)
+            if len(tile):   yield tile
+
+def packed_Hamming_distance_range(words, length, low_threshold=None, tile_size=512):
+    """ Return the (lowest, highest) Hamming distance between all pairs of rows of a packed words array 
+     (Packed_binary_code.words format), done in vectorized tiles of tile_size x tile_size pairs, 
+     so the memory use stays bounded (and no Binary_codeword objects are ever made).
+    If there are no pairs, return (length+1, 0), the same as Binary_code.find_Hamming_distance_range.
+    If low_threshold is given, stop as soon as the lowest distance is low_threshold or below, and return (lowest, None) - 
+     for checking that the minimum distance is above some value, there's no need to go through all the pairs.
+    Otherwise stop if the lowest and highest distance are 1 and length, since those can't get any more extreme.
+    """
+    low, high = length+1, 0
+    for distances in _iter_pair_distance_tiles(words, tile_size):
+        low = min(low, int(distances.min()))
+        high = max(high, int(distances.max()))
+        if low_threshold is not None and low <= low_threshold:  return low, None
+        if low==1 and high==length:                             break
+    return low, high
+
+def packed_Hamming_distance_histogram(words, length, tile_size=512):
+    """ Return the number of pairs of rows of a packed words array at each Hamming distance, as a list of length+1 ints
+     (index is the distance, so the first one is always 0) - done in the same bounded-memory tiles as 
+     packed_Hamming_distance_range. """
+    histogram = numpy.zeros(length+1, dtype=numpy.int64)
+    for distances in _iter_pair_distance_tiles(words, tile_size):
+        histogram += numpy.bincount(distances, minlength=length+1)
+    return [int(count) for count in histogram]
+
+
+### Binary code file format: a fixed-size header followed by the packed rows, so it can be memory-mapped directly.
+# Header (little-endian): 8-byte magic string, codeword length (uint64), codeword count (uint64), 
+#  words per codeword (uint32), CRC32 checksum of the row data (uint32); then count*words uint64 values (little-endian),
+#  in Packed_binary_code order and layout (sorted, highest bits first).
+
+_BINARY_CODE_FILE_MAGIC = 'BINCODE1'
+_BINARY_CODE_FILE_HEADER = struct.Struct('<8sQQII')
+
+def _words_checksum(words):
+    return zlib.crc32(numpy.ascontiguousarray(words, dtype='<u8').data) & 0xffffffff
+
+def write_packed_code_file(packed_code, outfile):
+    """ Write a Packed_binary_code to a binary code file (see format description above). """
+    words = numpy.ascontiguousarray(packed_code.words, dtype='<u8')
+    header = _BINARY_CODE_FILE_HEADER.pack(_BINARY_CODE_FILE_MAGIC, packed_code.length, packed_code.size(), 
+                                           packed_code.N_words, _words_checksum(words))
+    OUTFILE = open(outfile,'wb')
+    OUTFILE.write(header)
+    OUTFILE.write(words.tobytes())
+    OUTFILE.close()
+
+def read_packed_code_file_header(infile):
+    """ Return the (length, count, words_per_codeword, checksum) header values of a binary code file; 
+    raise BinaryCodeError if it isn't a binary code file or its size doesn't match the header. """
+    INFILE = open(infile,'rb')
+    header = INFILE.read(_BINARY_CODE_FILE_HEADER.size)
+    INFILE.close()
+    if len(header) < _BINARY_CODE_FILE_HEADER.size or not header.startswith(_BINARY_CODE_FILE_MAGIC):
+        raise BinaryCodeError("File %s is not a binary code file (wrong header)!"%infile)
+    _, length, count, N_words, checksum = _BINARY_CODE_FILE_HEADER.unpack(header)
+    if N_words != _words_per_codeword(length):
+        raise BinaryCodeError("Binary code file %s header is inconsistent: "%infile
+                              + "%s words per codeword for codeword length %s!"%(N_words, length))
+    expected_file_size = _BINARY_CODE_FILE_HEADER.size + 8*count*N_words
+    if os.path.getsize(infile) != expected_file_size:
+        raise BinaryCodeError("Binary code file %s has the wrong size (%s bytes, "%(infile, os.path.getsize(infile))
+                              + "but the header says it should be %s) - truncated or damaged?"%expected_file_size)
+    return length, count, N_words, checksum
+
+def read_packed_code_file(infile, use_memmap=True, verify_checksum=True):
+    """ Read a binary code file (see format description above) into a Packed_binary_code.
+    If use_memmap is True, the array is memory-mapped (read-only) rather than read into memory.
+    Raise BinaryCodeError if the header, size or checksum (if verify_checksum is True) don't match. """
+    length, count, N_words, checksum = read_packed_code_file_header(infile)
+    shape = (count,) if N_words==1 else (count, N_words)
+    if count==0:
+        words = numpy.zeros(shape, dtype=numpy.uint64)
+    elif use_memmap:
+        words = numpy.memmap(infile, dtype='<u8', mode='r', offset=_BINARY_CODE_FILE_HEADER.size, shape=shape)
+    else:
+        INFILE = open(infile,'rb')
+        INFILE.seek(_BINARY_CODE_FILE_HEADER.size)
+        words = numpy.fromfile(INFILE, dtype='<u8', count=count*N_words).reshape(shape)
+        INFILE.close()
+    if verify_checksum and _words_checksum(words) != checksum:
+        raise BinaryCodeError("Binary code file %s failed the checksum test - damaged?"%infile)
+    # the rows were written sorted and unique, so no need to sort again
+    return Packed_binary_code(length, words, already_sorted=True)
+
+def read_packed_code(infile, method, length=None):
+    """ Read a code file in any format (method is listfile, matrixfile or binaryfile, as in the Binary_code initializer)
+    and return it as a Packed_binary_code, skipping the codeword set if possible.  
+    The codeword length is only needed for listfile; if it's not given, it's taken from the first codeword. """
+    if method=='binaryfile':
+        packed_code = read_packed_code_file(infile)
+    elif method=='matrixfile':
+        packed_code = expand_generator_matrix_codewords(read_generator_matrix_file(infile))
+    elif method=='listfile':
+        if length is None:
+            lines = (line.strip() for line in open(infile) if not line.startswith('#'))
+            length = len((line for line in lines if line).next())
+        packed_code = Binary_code(length, infile, method='listfile').packed()
+    else:
+        raise BinaryCodeError("method %s passed to read_packed_code not recognized! "%method 
+                              + "(allowed methods are listfile, matrixfile, binaryfile)")
+    if length is not None and packed_code.length != length:
+        raise BinaryCodeError("Code in file %s has codeword length %s, not %s!"%(infile, packed_code.length, length))
+    return packed_code
+
+def convert_code_file(infile, outfile, infile_method, outfile_method='binaryfile', length=None):
+    """ Convert a code file between formats: infile_method can be listfile, matrixfile or binaryfile 
+    (see Binary_code initializer), outfile_method can be listfile or binaryfile (all the codewords are written out). 
+    The codeword length only needs to be given for listfile input, and even then it's optional. """
+    packed_code = read_packed_code(infile, infile_method, length)
+    if outfile_method=='binaryfile':    write_packed_code_file(packed_code, outfile)
+    elif outfile_method=='listfile':    packed_code.to_binary_code().write_code_to_file(outfile)
+    else:
+        raise BinaryCodeError("Output method %s passed to convert_code_file not recognized! "%outfile_method 
+                              + "(allowed methods are listfile, binaryfile)")
+
+
+######### Generating all codewords from a generator matrix (fast bulk version)
+
+def generator_matrix_rows_as_ints(generator_matrix):
+    """ Convert a generator matrix (numpy 0/1 array or list of 0/1 lists) into a list of row values as ints.
+    (Each row is read as a binary number with the first column as the highest bit, same as Binary_codeword.value;
+     all entries are taken mod 2, since generator matrix arithmetic is binary.) """
+    return [int(''.join([str(int(x)%2) for x in row]) or '0', 2) for row in generator_matrix]
+
+def _pack_int_list(values, length):
+    """ Convert a list of ints into a uint64 array in the Packed_binary_code.words format (1D or 2D based on length)."""
+    N_words = _words_per_codeword(length)
+    if N_words==1:  return array(values, dtype=numpy.uint64).reshape(-1)
+    else:           return array([_int_to_words(v,N_words) for v in values], dtype=numpy.uint64).reshape(-1,N_words)
+
+def _gray_code_table(packed_rows):
+    """ Return all 2**len(packed_rows) XOR combinations of the given packed rows, in reflected Gray code order.
+    Each value in the result differs from the previous one by a single row - built by repeated reflection:
+     after handling rows 0..j-1 the table is T, and adding row j gives T + reversed(T)^row_j.  """
+    N_rows = len(packed_rows)
+    table = numpy.zeros((2**N_rows,)+packed_rows.shape[1:], dtype=numpy.uint64)
+    for j in range(N_rows):
+        half = 2**j
+        numpy.bitwise_xor(table[half-1::-1], packed_rows[j], out=table[half:2*half])
+    return table
+
+def _gray_code_chunk_base(high_rows, chunk_number):
+    """ Return the XOR of the high_rows selected by the Gray code of chunk_number (the start value for that chunk)."""
+    base = numpy.zeros(high_rows.shape[1:], dtype=numpy.uint64)
+    gray_code = chunk_number ^ (chunk_number >> 1)
+    for j in range(len(high_rows)):
+        if (gray_code >> j) & 1:    base ^= high_rows[j]
+    return base
+
+def _generator_expansion_setup(generator_matrix, chunk_bits):
+    """ Help function for iterate/expand_generator_matrix_codewords: return (length, low-row Gray table, high rows)."""
+    generator_matrix = array(generator_matrix)
+    if generator_matrix.ndim!=2:
+        raise BinaryCodeError("The generator matrix must be two-dimensional!")
+    k, length = generator_matrix.shape
+    packed_rows = _pack_int_list(generator_matrix_rows_as_ints(generator_matrix), length)
+    N_low_rows = min(k, chunk_bits)
+    return length, _gray_code_table(packed_rows[:N_low_rows]), packed_rows[N_low_rows:]
+
+def _expand_generator_chunk_range(args):
+    """ Help function for expand_generator_matrix_codewords (module-level, so it works with multiprocessing):
+    return the packed codewords for chunks first_chunk..last_chunk-1 as one array. """
+    low_table, high_rows, first_chunk, last_chunk = args
+    chunk_size = len(low_table)
+    output = numpy.empty(((last_chunk-first_chunk)*chunk_size,)+low_table.shape[1:], dtype=numpy.uint64)
+    base = _gray_code_chunk_base(high_rows, first_chunk)
+    for chunk_number in range(first_chunk, last_chunk):
+        # moving to the next chunk in Gray code order means XORing in a single high row
+        if chunk_number!=first_chunk:
+            base ^= high_rows[((chunk_number & -chunk_number).bit_length()-1)]
+        # odd chunks go over the low table backwards, so the whole sequence is a single Gray code walk
+        table = low_table if chunk_number%2==0 else low_table[::-1]
+        position = (chunk_number-first_chunk)*chunk_size
+        numpy.bitwise_xor(table, base, out=output[position:position+chunk_size])
+    return output
+
+def iterate_generator_matrix_codewords(generator_matrix, chunk_bits=16, first_chunk=0):
+    """ Yield all codewords generated by the generator matrix as packed uint64 arrays of up to 2**chunk_bits codewords.
+
+    The arrays are in the Packed_binary_code.words format (but not sorted), and all of them together give all 
+     2**k codewords (k being the number of generator rows), in Gray code order of the encoded messages: 
+     each codeword is the previous one XORed with a single generator row, so there's no matrix multiplication at all. 
+    If the generator rows aren't linearly independent, the same codeword will show up multiple times.
+    Only one chunk is in memory at a time, so this works even for generators too big to fully expand.
+    If first_chunk is given, the earlier chunks are skipped without being generated (each chunk is computed directly).
+    """
+    length, low_table, high_rows = _generator_expansion_setup(generator_matrix, chunk_bits)
+    for chunk_number in range(first_chunk, 2**len(high_rows)):
+        yield _expand_generator_chunk_range((low_table, high_rows, chunk_number, chunk_number+1))
+
+def expand_generator_matrix_codewords(generator_matrix, chunk_bits=16, N_processes=1):
+    """ Return a Packed_binary_code containing all codewords generated by the generator matrix.
+
+    Uses the same Gray code walk as iterate_generator_matrix_codewords, writing straight into one output array; 
+     if N_processes>1, the chunks are split into N_processes contiguous ranges and generated in parallel.
+    The result is the same as multiplying each possible message by the matrix (mod 2), but much faster
+     (practical for up to k=24 or so, where the result takes 2**24*8 bytes = 128MB).
+    """
+    length, low_table, high_rows = _generator_expansion_setup(generator_matrix, chunk_bits)
+    N_chunks = 2**len(high_rows)
+    N_processes = max(1, min(N_processes, N_chunks))
+    if N_processes==1:
+        words = _expand_generator_chunk_range((low_table, high_rows, 0, N_chunks))
+    else:
+        import multiprocessing
+        range_edges = [N_chunks*i//N_processes for i in range(N_processes+1)]
+        job_args = [(low_table, high_rows, first, last) for (first, last) in zip(range_edges, range_edges[1:])]
+        pool = multiprocessing.Pool(N_processes)
+        try:        words = numpy.concatenate(pool.map(_expand_generator_chunk_range, job_args))
+        finally:    pool.terminate()
+    return Packed_binary_code(length, words)
+
+
+def read_generator_matrix_file(generator_file):
+    """ Read a generator matrix from a plaintext file (one row of 0/1 digits per line), return it as a numpy array. """
+    return array([[int(x) for x in line.strip()] for line in open(generator_file) if line.strip()])
+
+def GF2_row_reduce(row_values, length):
+    """ Bring the rows (given as ints of the given bit length) into reduced row echelon form over GF(2).
+    Return a (reduced_rows, pivot_digits) tuple: the nonzero reduced rows (so their number is the rank), and for each 
+     row the digit (0 being leftmost) of its leading 1, which is the only row with a 1 at that digit. """
+    rows = [r for r in row_values]
+    reduced_rows, pivot_digits = [], []
+    for digit in range(length):
+        bit = 1 << (length-1-digit)
+        try:                pivot_row = (r for r in rows if r & bit).next()
+        except StopIteration:   continue
+        rows.remove(pivot_row)
+        # clear this bit from all the other rows, both the remaining ones and the already reduced ones
+        rows = [r^pivot_row if r & bit else r for r in rows]
+        reduced_rows = [r^pivot_row if r & bit else r for r in reduced_rows]
+        reduced_rows.append(pivot_row)
+        pivot_digits.append(digit)
+    return reduced_rows, pivot_digits
+
+def parity_check_rows_from_generator(generator_rows, length):
+    """ Given the generator matrix rows (as ints), return the rows of a matching parity-check matrix H (as ints).
+
+    A word c is a codeword if and only if c&h has even weight for every H row h (i.e. the syndrome Hc is zero).
+    Works on the reduced row echelon form of the generator (the systematic form, up to a column permutation): 
+     for each non-pivot digit j, codeword digit j is the sum of the pivot digits of the rows that have a 1 at j, 
+     so the H row for j has a 1 at j and at those pivot digits.  There are length-rank rows in total.
+    """
+    reduced_rows, pivot_digits = GF2_row_reduce(generator_rows, length)
+    parity_check_rows = []
+    for digit in range(length):
+        if digit in pivot_digits:   continue
+        bit = 1 << (length-1-digit)
+        parity_check_row = bit
+        for row, pivot_digit in zip(reduced_rows, pivot_digits):
+            if row & bit:   parity_check_row |= 1 << (length-1-pivot_digit)
+        parity_check_rows.append(parity_check_row)
+    return parity_check_rows
+
+def span_weight_histogram(rows, length, chunk_bits=16):
+    """ Return the weight histogram (list of length+1 counts) of all 2**len(rows) XOR combinations of the given rows 
+    (as ints) - i.e. the weight enumerator of the linear code they generate, if they're linearly independent. 
+    Streams over the codewords chunk by chunk (see iterate_generator_matrix_codewords). """
+    matrix = array([Binary_codeword(row,length).list() for row in rows], dtype=int).reshape(len(rows), length)
+    histogram = numpy.zeros(length+1, dtype=numpy.int64)
+    for chunk in iterate_generator_matrix_codewords(matrix, chunk_bits):
+        histogram += Packed_binary_code(length, chunk, already_sorted=True).weight_histogram()
+    return [int(count) for count in histogram]
+
+def _binomial(n, k):
+    """ Binomial coefficient n choose k, as an exact int (0 if k<0 or k>n). """
+    if not 0 <= k <= n:     return 0
+    result = 1
+    for i in range(min(k, n-k)):    result = result * (n-i) // (i+1)
+    return result
+
+def MacWilliams_transform(dual_weight_enumerator, length):
+    """ Given the weight enumerator of a linear code (list of length+1 counts), return that of its dual code.
+    Uses the MacWilliams identity: A_i = 1/|C| * sum over j of B_j * K_i(j), where B is the given enumerator, |C| the 
+     size of its code, and K_i(j) = sum over s of (-1)^s * (j choose s) * (length-j choose i-s) is a Krawtchouk polynomial.
+    All exact integer arithmetic (the code sizes are powers of 2, and the sums always divide exactly). """
+    code_size = sum(dual_weight_enumerator)
+    weight_enumerator = []
+    for i in range(length+1):
+        total = 0
+        for (j, B_j) in enumerate(dual_weight_enumerator):
+            if not B_j:     continue
+            total += B_j * sum([(-1)**s * _binomial(j,s) * _binomial(length-j,i-s) for s in range(min(i,j)+1)])
+        weight_enumerator.append(total // code_size)
+    return weight_enumerator
+
+def syndrome_is_zero(value, parity_check_rows):
+    """ Return True if the int value has a zero syndrome with the parity-check rows (i.e. is a codeword of that code)."""
+    for row in parity_check_rows:
+        if bin(value & row).count('1') % 2:     return False
+    return True
+
+def _parity_uint64(words):
+    """ Return the parity (0/1 array) of the bit count of each element of a uint64 array, by xor-folding the halves."""
+    words = words.copy()
+    for shift in (32,16,8,4,2,1):
+        words ^= words >> numpy.uint64(shift)
+    return words & numpy.uint64(1)
+
+def packed_syndrome_is_zero(words, parity_check_rows, length):
+    """ Vectorized syndrome_is_zero: given packed codeword values (a uint64 array in Packed_binary_code format, 
+    1D if length<=64, otherwise one row of words per codeword) return a boolean array saying which ones are codewords."""
+    words = numpy.asarray(words, dtype=numpy.uint64)
+    N_words = _words_per_codeword(length)
+    if N_words>1:   words = words.reshape(-1, N_words)
+    in_code = numpy.ones(words.shape[0], dtype=bool)
+    for row in parity_check_rows:
+        if N_words==1:
+            syndrome_bit = _parity_uint64(words & numpy.uint64(row))
+        else:
+            row_words = array(_int_to_words(row, N_words), dtype=numpy.uint64)
+            syndrome_bit = numpy.bitwise_xor.reduce(_parity_uint64(words & row_words), axis=1)
+        in_code &= (syndrome_bit==0)
+    return in_code
+
+
+######### Radius queries over a set of codewords, without expanding them (multi-index hashing)
+
+def _N_changes_radius(N_changes):
+    """ Total number of bit changes allowed by N_changes (an int, or a (1_to_0_changes, 0_to_1_changes) tuple). """
+    _check_N_permitted_changes(N_changes)
+    if isinstance(N_changes,int):   return N_changes
+    else:                           return N_changes[0] + N_changes[1]
+
+def possible_clonality_result_weights(codeword_weights, N_allowed_changes, length):
+    """ Return a list of length+1 True/False values, saying for each weight whether a word of that weight could be 
+    within N_allowed_changes of a codeword (i.e. is in expand_by_all_mutations([C],N_allowed_changes) for some C), 
+     given all the codeword weights: a word within (a 1->0, b 0->1) changes of C has a weight between 
+     weight(C)-a and weight(C)+b; a word within r changes of C has a weight between weight(C)-r and weight(C)+r. """
+    _check_N_permitted_changes(N_allowed_changes)
+    if isinstance(N_allowed_changes,int):   below, above = N_allowed_changes, N_allowed_changes
+    else:                                   below, above = N_allowed_changes
+    possible_weights = [False]*(length+1)
+    if below<0 or above<0:  return possible_weights
+    for weight in set(codeword_weights):
+        for result_weight in range(max(0, weight-below), min(length, weight+above)+1):
+            possible_weights[result_weight] = True
+    return possible_weights
+
+class Neighbor_index(object):
+    """ Index over a set of same-length codewords, answering "which codewords C is X too close to?" queries 
+    (i.e. X is in expand_by_all_mutations([C],N_changes) - see that function for the int and tuple forms of N_changes)
+    without expanding all the codewords by mutations first.
+
+    Uses multi-index hashing: the codeword bits are split into N_substrings contiguous substrings, and each substring
+     gets a hash table of the codewords by substring value.  If X is within r changes of C, then by the pigeonhole 
+     principle at least one substring of X is within r//N_substrings changes of that substring of C, so only the 
+     codewords found by looking up those substring neighbors need to be checked directly.  
+    Any query radius up to max_radius works.  Memory use is N_substrings dictionary entries per codeword.
+    """
+
+    def __init__(self, codewords, length, max_radius, N_substrings=None):
+        """ Make the index for the given codewords (all of the given length), for query radius up to max_radius.
+        N_substrings is optional - the default aims for substrings of about log2(number of codewords) bits, 
+         so each hash table has around one codeword per bucket, but never uses more than max_radius+1 substrings 
+         (more wouldn't help: with max_radius+1 substrings, one of them always has to match exactly). """
+        self.length = length
+        self.max_radius = max_radius
+        self.codewords = list(codewords)
+        self.values = [codeword.value for codeword in self.codewords]
+        if N_substrings is None:
+            bits_per_substring = max(1, len(self.values).bit_length())
+            N_substrings = min(max(max_radius,0)+1, max(1, length//bits_per_substring))
+        self.N_substrings = max(1, min(N_substrings, length))
+        edges = [length*i//self.N_substrings for i in range(self.N_substrings+1)]
+        # (shift, bit mask, table) for each substring; each table is a substring value:codeword index list dictionary
+        self._substrings = []
+        for (low, high) in zip(edges, edges[1:]):
+            mask = (1 << (high-low)) - 1
+            table = defaultdict(list)
+            for (index, value) in enumerate(self.values):
+                table[(value >> low) & mask].append(index)
+            self._substrings.append((low, mask, high-low, dict(table)))
+
+    def __len__(self):  return len(self.values)
+
+    def _candidate_indices(self, value, radius):
+        """ Return the set of indices of all the codewords that could be within radius changes of value. """
+        substring_radius = radius // self.N_substrings
+        candidates = set()
+        for (shift, mask, substring_length, table) in self._substrings:
+            query = (value >> shift) & mask
+            for flip_mask in flip_mask_table(substring_length, substring_radius)[0]:
+                try:                candidates.update(table[query ^ flip_mask])
+                except KeyError:    pass
+        return candidates
+
+    def query(self, codeword, N_changes):
+        """ Return the set of indexed codewords C such that codeword is in expand_by_all_mutations([C],N_changes), 
+        i.e. codeword is within N_changes changes of C.  N_changes can be a single number (any changes), 
+         or a (1_to_0_changes, 0_to_1_changes) tuple - the changes being from C to codeword, as in bit_change_count. """
+        radius = _N_changes_radius(N_changes)
+        if radius > self.max_radius:
+            raise BinaryCodeError("Neighbor_index query radius %s is higher than the index max_radius %s!"%(radius, 
+                                                                                                     self.max_radius))
+        if radius < 0:
+            return set()
+        value = codeword.value
+        full_mask = (1 << self.length) - 1
+        close_codewords = set()
+        if isinstance(N_changes,int):
+            for index in self._candidate_indices(value, radius):
+                if bin(self.values[index] ^ value).count('1') <= radius:
+                    close_codewords.add(self.codewords[index])
+        else:
+            (N_1_to_0_changes, N_0_to_1_changes) = N_changes
+            for index in self._candidate_indices(value, radius):
+                C_value = self.values[index]
+                if bin(C_value & ~value & full_mask).count('1') <= N_1_to_0_changes \
+                   and bin(~C_value & value & full_mask).count('1') <= N_0_to_1_changes:
+                    close_codewords.add(self.codewords[index])
+        return close_codewords
+
+
+######### Vectorized clonality conflict search over packed codes (for the zero-change case)
+
+def _iter_zero_change_conflict_tiles(values, row_start, row_end, count_self_conflicts, tile_size):
+    """ Find all the zero-change clonality conflicts for pairs (i,j) with row_start<=i<row_end and i<j, 
+    where values is the sorted unique 1D uint64 array of codeword values (see clonality_zero_change_conflicts_packed).
+    For each tile of up to tile_size columns, yield a (normal_conflicts, self_conflicts) tuple, each an (I,J,K,is_self) 
+     tuple of arrays sorted by (I,J) - self_conflicts are empty unless count_self_conflicts is True. """
+    N = len(values)
+    rows = values[row_start:row_end, None]
+    row_indices = numpy.arange(row_start, row_end)[:, None]
+    for col_start in range(row_start+1, N, tile_size):
+        col_end = min(col_start+tile_size, N)
+        cols = values[None, col_start:col_end]
+        results = rows | cols
+        positions = numpy.searchsorted(values, results)
+        in_code = values[numpy.minimum(positions, N-1)] == results
+        is_self = (results == rows) | (results == cols)
+        other_conflicts = in_code & ~is_self
+        # only the tiles overlapping the diagonal contain pairs with i>=j, which have to be ignored
+        if col_start < row_end:
+            upper_triangle = row_indices < numpy.arange(col_start, col_end)[None, :]
+            other_conflicts &= upper_triangle
+            is_self &= upper_triangle
+        if not count_self_conflicts:
+            is_self[:] = False
+        tile_conflicts = []
+        for (conflict_mask, if_self) in ((other_conflicts, False), (is_self, True)):
+            I, J = numpy.nonzero(conflict_mask)
+            tile_conflicts.append((I+row_start, J+col_start, positions[conflict_mask], 
+                                   numpy.zeros(len(I), dtype=bool) | if_self))
+        yield tuple(tile_conflicts)
+
+def _zero_change_conflicts_row_block(values, row_start, row_end, count_self_conflicts, return_conflicts, tile_size):
+    """ Return a list of codeword index arrays to be counted for the row block (see _iter_zero_change_conflict_tiles), 
+    and a list of (I,J,K,is_self) arrays (empty unless return_conflicts is True). """
+    indices_to_count, conflicts = [], []
+    for (normal_conflicts, self_conflicts) in _iter_zero_change_conflict_tiles(values, row_start, row_end, 
+                                                                               count_self_conflicts, tile_size):
+        # normal conflicts count for A, B and A|B, self-conflicts only for A and B
+        indices_to_count.extend(normal_conflicts[:3])
+        indices_to_count.extend(self_conflicts[:2])
+        if return_conflicts:
+            conflicts.extend([normal_conflicts, self_conflicts])
+    return indices_to_count, conflicts
+
+def first_zero_change_conflict_packed(values, count_self_conflicts=False, tile_size=512):
+    """ Return the first zero-change clonality conflict over packed values (in (i,j) order, as an (i,j,k,is_self) tuple 
+    of codeword indices of A, B and A|B), or None if there are none - see clonality_zero_change_conflicts_packed. 
+    Stops at the first tile that contains a conflict. """
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    for row_start in range(0, len(values), tile_size):
+        row_end = min(row_start+tile_size, len(values))
+        for tile_conflicts in _iter_zero_change_conflict_tiles(values, row_start, row_end, count_self_conflicts, 
+                                                               tile_size):
+            conflicts = [(i,j,k,is_self) for (I,J,K,is_self_array) in tile_conflicts 
+                         for (i,j,k,is_self) in zip(I.tolist(), J.tolist(), K.tolist(), is_self_array.tolist())]
+            if conflicts:   return min(conflicts)
+    return None
+
+def clonality_zero_change_conflicts_packed(values, count_self_conflicts=False, return_conflicts=False, tile_size=512, 
+                                           row_ranges=None):
+    """ Vectorized version of the zero-change case of Binary_code.clonality_count_conflicts, on packed values.
+
+    Values must be the sorted unique 1D uint64 array of codeword values (as in Packed_binary_code.words, length<=64).
+    Goes over all pairs (i,j) with i<j in tiles of tile_size x tile_size pairs (only over the rows in row_ranges, 
+     a list of (start,end) tuples, if given): computes A|B for the whole tile at once, checks which results are 
+     codewords with a binary search in values, and adds the conflict counts to a per-codeword array with bincount.
+    A result equal to A or B is a self-conflict: counted (for A and B only) if count_self_conflicts is True, 
+     ignored otherwise; any other result that's a codeword is a conflict, counted for A, B and the result.
+    Return a (conflict_count_array, conflicts) tuple; conflicts is None, or if return_conflicts is True, 
+     a (I,J,K,is_self) tuple of arrays giving the codeword indices of A, B and A|B for each conflict, sorted by (I,J).
+    """
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    N = len(values)
+    if row_ranges is None:
+        row_ranges = [(row_start, min(row_start+tile_size, N)) for row_start in range(0, N, tile_size)]
+    indices_to_count, conflicts = [], []
+    for (row_start, row_end) in row_ranges:
+        block_indices, block_conflicts = _zero_change_conflicts_row_block(values, row_start, row_end, 
+                                                                         count_self_conflicts, return_conflicts, tile_size)
+        indices_to_count.extend(block_indices)
+        conflicts.extend(block_conflicts)
+    if indices_to_count:
+        conflict_counts = numpy.bincount(numpy.concatenate(indices_to_count), minlength=N)
+    else:
+        conflict_counts = numpy.zeros(N, dtype=numpy.int64)
+    if not return_conflicts:
+        return conflict_counts, None
+    if conflicts:
+        I, J, K, is_self = [numpy.concatenate(arrays) for arrays in zip(*conflicts)]
+    else:
+        I, J, K, is_self = [numpy.zeros(0, dtype=numpy.int64)]*3 + [numpy.zeros(0, dtype=bool)]
+    order = numpy.lexsort((J, I))
+    return conflict_counts, (I[order], J[order], K[order], is_self[order])
+
+
+### Parallel conflict counting: the pair space is split into blocks of rows of the upper triangle (pairs (i,j), i<j, 
+#  with i in the row range), and each block is a separate job for a process pool.  Workers get the packed codeword values
+#  as a shared read-only buffer, plus a small picklable state dictionary; anything else they need (codeword objects, 
+#  the close-codeword finder) is made by each worker from the shared values, so this works when worker processes 
+#  are started from scratch (spawn) as well as when they're forked.
+
+_CONFLICT_WORKER_STATE = {}
+
+def _init_conflict_worker(shared_words, words_shape, state):
+    """ Process pool initializer for _clonality_conflicts_job: set up the worker state (see parallel_clonality_conflicts)."""
+    _CONFLICT_WORKER_STATE.clear()
+    _CONFLICT_WORKER_STATE.update(state)
+    values = numpy.frombuffer(shared_words, dtype=numpy.uint64).reshape(words_shape)
+    _CONFLICT_WORKER_STATE['values'] = values
+    if state['N_allowed_changes'] is not None:
+        codeword_list = Packed_binary_code(state['length'], values, already_sorted=True).codeword_list()
+        code = Binary_code(state['length'], codeword_list)
+        _CONFLICT_WORKER_STATE['codeword_list'] = codeword_list
+        _CONFLICT_WORKER_STATE['codeword_to_index'] = dict((C,i) for (i,C) in enumerate(codeword_list))
+        _CONFLICT_WORKER_STATE['find_close_codewords'] = code._close_codeword_finder(state['N_allowed_changes'], 
+                                                            state['use_neighbor_index'], state['target_weights'])
+
+def _clonality_conflicts_rows(state, row_start, row_end):
+    """ Find the clonality conflicts for all pairs (i,j) with row_start<=i<row_end and i<j (see parallel_clonality_conflicts
+    for the state dictionary and the return values). """
+    values = state['values']
+    N, count_self_conflicts, return_conflicts = len(values), state['count_self_conflicts'], state['return_conflicts']
+    if state['N_allowed_changes'] is None:
+        conflict_counts, conflicts = clonality_zero_change_conflicts_packed(values, count_self_conflicts, return_conflicts,
+                                                                    state['tile_size'], row_ranges=[(row_start,row_end)])
+        if conflicts is not None:
+            conflicts = [(i,j,(k,),is_self) for (i,j,k,is_self) in zip(*[x.tolist() for x in conflicts])]
+        return conflict_counts, conflicts
+    codeword_list, codeword_to_index = state['codeword_list'], state['codeword_to_index']
+    find_close_codewords = state['find_close_codewords']
+    conflict_counts = numpy.zeros(N, dtype=numpy.int64)
+    conflicts = [] if return_conflicts else None
+    for i in range(row_start, row_end):
+        A = codeword_list[i]
+        for j in range(i+1, N):
+            B = codeword_list[j]
+            close_codewords = find_close_codewords(A|B)
+            if not close_codewords:     continue
+            other_codewords = close_codewords - set([A,B])
+            # same rules as in the general case of Binary_code.clonality_count_conflicts
+            if other_codewords:
+                conflict_counts[[codeword_to_index[C] for C in close_codewords.union(set([A,B]))]] += 1
+                conflict_set, is_self = other_codewords, False
+            elif count_self_conflicts:
+                conflict_counts[[i,j]] += 1
+                conflict_set, is_self = close_codewords, True
+            else:
+                continue
+            if return_conflicts:
+                conflicts.append((i, j, tuple(sorted(codeword_to_index[C] for C in conflict_set)), is_self))
+    return conflict_counts, conflicts
+
+def _clonality_conflicts_job(row_range):
+    return _clonality_conflicts_rows(_CONFLICT_WORKER_STATE, row_range[0], row_range[1])
+
+def parallel_clonality_conflicts(packed_code, N_allowed_changes=None, count_self_conflicts=False, 
+                                 return_conflicts=False, N_processes=2, rows_per_job=None, tile_size=512, 
+                                 conflict_callback=None, use_neighbor_index=False, target_weights=None):
+    """ Count clonality conflicts over all codeword pairs of packed_code, using a pool of N_processes processes.
+
+    If N_allowed_changes is None, do the vectorized zero-change search (clonality_zero_change_conflicts_packed - 
+     only for length<=64); otherwise each worker makes its own close-codeword finder from the shared packed codewords 
+     (Binary_code._close_codeword_finder with N_allowed_changes, use_neighbor_index and target_weights), 
+     so nothing but the packed values and a few plain arguments is sent to the workers.
+    Jobs are blocks of rows_per_job rows (default: enough for about 16 jobs per process, for load balancing, 
+     since the upper triangle rows don't all have the same number of pairs).
+    The results are merged in job order, so they're the same regardless of N_processes and rows_per_job:
+     return a (conflict_count_array, conflicts) tuple, with conflicts being None (if return_conflicts is False) 
+     or a (i, j, conflict_codeword_indices, is_self) list sorted by (i,j), with all indices into packed_code rows.
+    If conflict_callback is given (and return_conflicts is True), it's called with each job's part of that list 
+     as soon as it's available (still in order), and the conflicts aren't kept (the returned conflicts is None).
+    """
+    N = packed_code.size()
+    if rows_per_job is None:
+        rows_per_job = max(1, N // (16*N_processes))
+    row_ranges = [(row_start, min(row_start+rows_per_job, N)) for row_start in range(0, N, rows_per_job)]
+    state = {'length': packed_code.length, 'N_allowed_changes': N_allowed_changes, 
+             'use_neighbor_index': use_neighbor_index, 'target_weights': target_weights, 
+             'count_self_conflicts': count_self_conflicts, 'return_conflicts': return_conflicts, 'tile_size': tile_size}
+    import multiprocessing, multiprocessing.sharedctypes
+    words = numpy.ascontiguousarray(packed_code.words, dtype=numpy.uint64)
+    shared_words = multiprocessing.sharedctypes.RawArray('c', max(words.nbytes,1))
+    if words.nbytes:    
+        numpy.frombuffer(shared_words, dtype=numpy.uint64)[:words.size] = words.reshape(-1)
+    pool = multiprocessing.Pool(N_processes, _init_conflict_worker, (shared_words, words.shape, state))
+    try:
+        conflict_counts = numpy.zeros(N, dtype=numpy.int64)
+        conflicts = [] if return_conflicts and conflict_callback is None else None
+        for (job_counts, job_conflicts) in pool.imap(_clonality_conflicts_job, row_ranges):
+            conflict_counts += job_counts
+            if not return_conflicts:            continue
+            if conflict_callback is not None:   conflict_callback(job_conflicts)
+            else:                               conflicts.extend(job_conflicts)
+    finally:
+        pool.terminate()
+    return conflict_counts, conflicts
+
+
+######### Distances from clonality results (A|B) to the closest codewords
+
+def _pair_row_blocks(N, pairs_per_chunk):
+    """ Split rows 0..N-2 into (row_start, row_end) blocks with about pairs_per_chunk (i,j>i) pairs each
+    (at least one row per block, even if that row alone has more pairs). """
+    row_start = 0
+    while row_start < N-1:
+        row_end, N_pairs = row_start+1, N-1-row_start
+        while row_end < N-1 and N_pairs + N-1-row_end <= pairs_per_chunk:
+            N_pairs += N-1-row_end
+            row_end += 1
+        yield row_start, row_end
+        row_start = row_end
+
+def _pair_indices(N, row_start, row_end):
+    """ Return (I, J) int arrays giving all the (i,j) pairs with row_start<=i<row_end and i<j<N, ordered by i then j. """
+    I = numpy.concatenate([numpy.full(N-1-i, i, dtype=numpy.int64) for i in range(row_start, row_end)])
+    J = numpy.concatenate([numpy.arange(i+1, N) for i in range(row_start, row_end)])
+    return I, J
+
+def iter_clonality_distances_packed(words, length, count_self_conflicts=False, pairs_per_chunk=4096, tile_size=512):
+    """ For all the codeword pairs A,B of a packed words array (Packed_binary_code.words format), find how close A|B 
+     is to the other codewords.  Yield an (I, J, distance, one_to_zero, zero_to_one, nearest) tuple of int arrays 
+     for each chunk of about pairs_per_chunk pairs, with I<J the row indices of A and B: 
+      - distance is the Hamming distance from A|B to the closest codeword C, and nearest is the row index of that C;
+      - one_to_zero is the lowest number of 1->0 changes that get from some C to A|B without 0->1 changes 
+         (so the lowest a for which N_allowed_changes (a,0) gives a conflict), and zero_to_one is the same 
+         for 0->1 changes without 1->0 changes (the lowest b for which (0,b) gives a conflict);
+      - if there is no such C at all, the value is length+1 (and nearest is -1).
+    C can't be A or B unless count_self_conflicts is True - so the pair has a clonality conflict with N_allowed_changes=r 
+     exactly when its distance is r or lower, same as in Binary_code.clonality_count_conflicts.
+    Each chunk of pairs is compared to the codewords in tiles of up to tile_size codewords of the same weight, 
+     with one popcount per comparison: if p is the weight of (A|B)&C, then A|B is weight(C)-p 1->0 changes 
+     and weight(A|B)-p 0->1 changes away from C.  
+    The weight groups are taken in order of how close their weight is to the typical A|B weight of the chunk, and each 
+     tile is only compared to the pairs for which it could still give a lower value than the ones found so far 
+     (A|B is at least |weight(A|B)-weight(C)| changes away from C, and only C with weight(C)>=weight(A|B) can give 
+     one_to_zero, only weight(C)<=weight(A|B) zero_to_one) - so most pairs only get compared to the codewords with 
+     weights near their A|B weight.  Pairs for which the tile can only give a lower one_to_zero or zero_to_one value 
+     just need to know whether C contains A|B (or the reverse), which is quicker than counting bits.
+    If that doesn't rule anything out, it's the same as comparing each pair to each codeword - O(N^3) time.
+    """
+    N = len(words)
+    words = numpy.asarray(words, dtype=numpy.uint64).reshape(N, -1)
+    weights = _popcount_uint64(words).sum(axis=1)
+    no_codeword = length+1
+    # (weight, codeword indices) tiles, each with codewords of a single weight
+    weight_tiles = []
+    for weight in sorted(set(weights.tolist())):
+        indices = numpy.flatnonzero(weights==weight)
+        for start in range(0, len(indices), tile_size):
+            weight_tiles.append((weight, indices[start:start+tile_size]))
+    for (row_start, row_end) in _pair_row_blocks(N, pairs_per_chunk):
+        I, J = _pair_indices(N, row_start, row_end)
+        results = words[I] | words[J]
+        result_weights = _popcount_uint64(results).sum(axis=1)
+        distance, one_to_zero, zero_to_one = [numpy.full(len(I), no_codeword, dtype=numpy.int64) for x in range(3)]
+        nearest = numpy.full(len(I), -1, dtype=numpy.int64)
+        typical_weight = numpy.median(result_weights)
+        for (weight, columns) in sorted(weight_tiles, key=lambda (w,_): (abs(w-typical_weight), -w)):
+            weight_difference = weight - result_weights
+            # the pairs for which this tile could give a lower distance, one_to_zero or zero_to_one value
+            needs_distance = numpy.abs(weight_difference) < distance
+            needs_one_to_zero = (weight_difference >= 0) & (weight_difference < one_to_zero) & ~needs_distance
+            needs_zero_to_one = (weight_difference <= 0) & (-weight_difference < zero_to_one) & ~needs_distance
+            def allowed_columns(rows):
+                if count_self_conflicts:    return numpy.ones((len(rows), len(columns)), dtype=bool)
+                return (columns[None, :] != I[rows, None]) & (columns[None, :] != J[rows, None])
+            # with all the tile codewords having the same weight, one_to_zero is weight(C)-weight(A|B) for any C 
+            #  that contains A|B, and zero_to_one is weight(A|B)-weight(C) for any C contained in A|B
+            rows = numpy.flatnonzero(needs_one_to_zero)
+            if len(rows):
+                found = ((results[rows, None, :] & ~words[None, columns, :]) == 0).all(axis=2) & allowed_columns(rows)
+                rows = rows[found.any(axis=1)]
+                one_to_zero[rows] = numpy.minimum(one_to_zero[rows], weight - result_weights[rows])
+            rows = numpy.flatnonzero(needs_zero_to_one)
+            if len(rows):
+                found = ((words[None, columns, :] & ~results[rows, None, :]) == 0).all(axis=2) & allowed_columns(rows)
+                rows = rows[found.any(axis=1)]
+                zero_to_one[rows] = numpy.minimum(zero_to_one[rows], result_weights[rows] - weight)
+            rows = numpy.flatnonzero(needs_distance)
+            if not len(rows):   continue
+            overlap = _popcount_uint64(results[rows, None, :] & words[None, columns, :]).sum(axis=2)
+            one_to_zero_changes = weight - overlap
+            zero_to_one_changes = result_weights[rows, None] - overlap
+            allowed = allowed_columns(rows)
+            tile_distance = numpy.where(allowed, one_to_zero_changes + zero_to_one_changes, no_codeword)
+            tile_nearest = tile_distance.argmin(axis=1)
+            tile_min = tile_distance[numpy.arange(len(rows)), tile_nearest]
+            closer = tile_min < distance[rows]
+            distance[rows[closer]] = tile_min[closer]
+            nearest[rows[closer]] = columns[tile_nearest[closer]]
+            one_to_zero[rows] = numpy.minimum(one_to_zero[rows], numpy.where(allowed & (zero_to_one_changes==0), 
+                                                                one_to_zero_changes, no_codeword).min(axis=1))
+            zero_to_one[rows] = numpy.minimum(zero_to_one[rows], numpy.where(allowed & (one_to_zero_changes==0), 
+                                                                zero_to_one_changes, no_codeword).min(axis=1))
+        yield I, J, distance, one_to_zero, zero_to_one, nearest
+
+
+######### Searching for the highest N_allowed_changes that gives no clonality conflicts
+
+def _group_common_codewords(results, first, second):
+    """ Given arrays of A|B results with, for each, two codeword indices that are common to all the pairs giving it 
+     (-1 if there's no such codeword), return the same for the sorted unique results: a codeword is common to all 
+     the pairs of a result if it's common to all the pairs of each of its rows. """
+    order = numpy.argsort(results, kind='mergesort')
+    results, first, second = results[order], first[order], second[order]
+    group_starts = numpy.flatnonzero(numpy.concatenate([[True], results[1:] != results[:-1]]))
+    group_sizes = numpy.diff(numpy.append(group_starts, len(results)))
+    group_first = numpy.repeat(first[group_starts], group_sizes)
+    group_second = numpy.repeat(second[group_starts], group_sizes)
+    all_have_first = numpy.logical_and.reduceat((first==group_first) | (second==group_first), group_starts)
+    all_have_second = numpy.logical_and.reduceat((first==group_second) | (second==group_second), group_starts)
+    return (results[group_starts], numpy.where(all_have_first, first[group_starts], -1), 
+            numpy.where(all_have_second, second[group_starts], -1))
+
+def _clonality_pair_result_table(values, pairs_per_chunk=2**20):
+    """ For all the pairs of a sorted unique 1D uint64 array of codeword values, return a (results, first_common, 
+     second_common) tuple of arrays: the sorted unique A|B values, and for each of them the indices of the codewords
+     that are in ALL the pairs giving that A|B (-1 if there are fewer than two) - a codeword close to A|B gives a normal 
+     clonality conflict (not a self-conflict) unless it's one of those. 
+    Each chunk of about pairs_per_chunk pairs is deduplicated as soon as it's made, so only the unique results 
+     are ever kept, not all the N^2/2 pairs. """
+    N = len(values)
+    if N<2:     return numpy.zeros(0, dtype=numpy.uint64), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64)
+    chunks = []
+    for (row_start, row_end) in _pair_row_blocks(N, pairs_per_chunk):
+        I, J = _pair_indices(N, row_start, row_end)
+        chunks.append(_group_common_codewords(values[I] | values[J], I, J))
+    if len(chunks)==1:  return chunks[0]
+    return _group_common_codewords(*[numpy.concatenate(arrays) for arrays in zip(*chunks)])
+
+def _combination_masks(position_bits, N_positions):
+    """ Given an N x M uint64 array of single-bit values (the positions each codeword can change), return 
+    the N x (M choose N_positions) array of all the ORs of N_positions of them (row by row). """
+    if N_positions==0:  return numpy.zeros((len(position_bits), 1), dtype=numpy.uint64)
+    combinations = array(list(itertools.combinations(range(position_bits.shape[1]), N_positions)), dtype=numpy.int64)
+    return numpy.bitwise_or.reduce(position_bits[:, combinations], axis=2)
+
+class _Clonality_change_cell_search(object):
+    """ Checks whether any clonality result A|B is EXACTLY a 1->0 and b 0->1 changes away from some codeword C 
+    (the "(a,b) cell"), for codes up to 64 bits long - C can't be A or B unless count_self_conflicts is True.
+
+    A code has a clonality conflict with N_allowed_changes (a,b) exactly if one of the cells (a',b') with a'<=a and b'<=b 
+     has one, so checking the cells one at a time lets Binary_code.clonality_max_safe_N_allowed_changes go through 
+     larger and larger N_allowed_changes without ever redoing any work - each mutation of each codeword is only 
+     looked at once, in its own cell (instead of expanding all the codewords by all mutations again for each setting).
+    All the A|B results are kept in one sorted array (see _clonality_pair_result_table), and the cell mutations are 
+     generated for all the codewords of the same weight together (as XORs of their 1-positions and 0-positions), 
+     up to chunk_size mutations at a time, stopping at the first conflict.
+    """
+
+    def __init__(self, values, length, count_self_conflicts=False, chunk_size=2**18):
+        values = numpy.asarray(values, dtype=numpy.uint64)
+        self.results, self.first_common, self.second_common = _clonality_pair_result_table(values)
+        self.length, self.count_self_conflicts, self.chunk_size = length, count_self_conflicts, chunk_size
+        bit_values = numpy.uint64(1) << numpy.arange(length, dtype=numpy.uint64)
+        bits = ((values[:, None] >> numpy.arange(length, dtype=numpy.uint64)) & numpy.uint64(1)).astype(bool)
+        weights = bits.sum(axis=1)
+        # codewords grouped by weight, with the values of their 1 bits and their 0 bits (as N x weight/length-weight arrays)
+        self.weight_groups = []
+        for weight in sorted(set(weights.tolist())):
+            indices = numpy.flatnonzero(weights==weight)
+            group_bits = bits[indices]
+            all_bit_values = numpy.tile(bit_values, (len(indices), 1))
+            self.weight_groups.append((weight, indices, values[indices], 
+                                       all_bit_values[group_bits].reshape(len(indices), weight), 
+                                       all_bit_values[~group_bits].reshape(len(indices), length-weight)))
+
+    def N_mutations(self, N_1_to_0_changes, N_0_to_1_changes):
+        """ Return the number of codeword mutations has_conflict would have to look at for that cell. """
+        return sum([len(indices) * _binomial(weight, N_1_to_0_changes) * _binomial(self.length-weight, N_0_to_1_changes)
+                    for (weight, indices, _, _, _) in self.weight_groups])
+
+    def has_conflict(self, N_1_to_0_changes, N_0_to_1_changes):
+        """ Return True if there's a clonality conflict in the (N_1_to_0_changes, N_0_to_1_changes) cell. """
+        if not len(self.results):   return False
+        for (weight, indices, group_values, one_bits, zero_bits) in self.weight_groups:
+            if N_1_to_0_changes > weight or N_0_to_1_changes > self.length-weight:  continue
+            N_mutations = _binomial(weight, N_1_to_0_changes) * _binomial(self.length-weight, N_0_to_1_changes)
+            rows_per_chunk = max(1, self.chunk_size // N_mutations)
+            for start in range(0, len(indices), rows_per_chunk):
+                end = min(start+rows_per_chunk, len(indices))
+                halfway = group_values[start:end, None] ^ _combination_masks(one_bits[start:end], N_1_to_0_changes)
+                mutations = (halfway[:, :, None] ^ _combination_masks(zero_bits[start:end], N_0_to_1_changes)[:, None, :])
+                mutations = mutations.reshape(end-start, -1)
+                positions = numpy.minimum(numpy.searchsorted(self.results, mutations), len(self.results)-1)
+                found = self.results[positions] == mutations
+                if not self.count_self_conflicts:
+                    codeword_indices = indices[start:end, None]
+                    found &= (self.first_common[positions] != codeword_indices) 
+                    found &= (self.second_common[positions] != codeword_indices)
+                if found.any():     return True
+        return False
+
+def _minimal_cells(cells):
+    """ Return the sorted list of the (a,b) cells that don't have any other cell (a2,b2) with a2<=a and b2<=b. """
+    minimal = []
+    for (a,b) in sorted(set(cells)):
+        if not minimal or b < minimal[-1][1]:   minimal.append((a,b))
+    return minimal
+
+def clonality_conflict_cells_packed(words, length, count_self_conflicts=False, max_radius=None, known_cells=(), 
+                                    pairs_per_chunk=4096, tile_size=512):
+    """ Find the minimal clonality conflict cells of a packed words array (Packed_binary_code.words format): 
+     return the sorted list of the (a,b) cells (A|B is exactly a 1->0 and b 0->1 changes away from some codeword C, 
+     see _Clonality_change_cell_search) that aren't above any other conflict cell, with a+b<=max_radius (default length).
+    So the code has a clonality conflict with N_allowed_changes (a,b) exactly if one of the returned cells is at or 
+     below (a,b) - and the lowest a+b sum on the list, minus one, is the highest safe N_allowed_changes number.
+    C can't be A or B unless count_self_conflicts is True, same as in Binary_code.clonality_count_conflicts.
+    known_cells can be conflict cells that are already known (they're included in the result, if they're minimal).
+    Unlike _Clonality_change_cell_search, this doesn't look at any mutations - the cell of each (pair, codeword) 
+     combination is computed directly (same as in iter_clonality_distances_packed: if p is the weight of (A|B)&C, 
+     then A|B is weight(C)-p 1->0 and weight(A|B)-p 0->1 changes away from C), so the time doesn't depend on 
+     the radius.  Pairs are compared to tiles of up to tile_size same-weight codewords, closest weights first, and only 
+     if they could still give a new minimal cell (A|B is at least max(weight(C)-weight(A|B),0) 1->0 changes and 
+     max(weight(A|B)-weight(C),0) 0->1 changes away from C) - but in the worst case it's still O(N^3).
+    """
+    if max_radius is None:  max_radius = length
+    N = len(words)
+    words = numpy.asarray(words, dtype=numpy.uint64).reshape(N, -1)
+    weights = _popcount_uint64(words).sum(axis=1)
+    cells = _minimal_cells(known_cells)
+    def cell_limits():
+        # a new cell (a,b) is only minimal and in range if b < limits[a]
+        limits = numpy.array([max_radius-a+1 for a in range(length+1)], dtype=numpy.int64)
+        for (a,b) in cells:     limits[a:] = numpy.minimum(limits[a:], b)
+        return limits
+    limits = cell_limits()
+    weight_tiles = []
+    for weight in sorted(set(weights.tolist())):
+        indices = numpy.flatnonzero(weights==weight)
+        for start in range(0, len(indices), tile_size):
+            weight_tiles.append((weight, indices[start:start+tile_size]))
+    for (row_start, row_end) in _pair_row_blocks(N, pairs_per_chunk):
+        I, J = _pair_indices(N, row_start, row_end)
+        results = words[I] | words[J]
+        result_weights = _popcount_uint64(results).sum(axis=1)
+        typical_weight = numpy.median(result_weights)
+        for (weight, columns) in sorted(weight_tiles, key=lambda (w,_): (abs(w-typical_weight), -w)):
+            lowest_one_to_zero = numpy.maximum(weight - result_weights, 0)
+            lowest_zero_to_one = numpy.maximum(result_weights - weight, 0)
+            rows = numpy.flatnonzero(lowest_zero_to_one < limits[numpy.minimum(lowest_one_to_zero, length)])
+            if not len(rows):   continue
+            overlap = _popcount_uint64(results[rows, None, :] & words[None, columns, :]).sum(axis=2)
+            one_to_zero_changes = weight - overlap
+            zero_to_one_changes = result_weights[rows, None] - overlap
+            new_cells = zero_to_one_changes < limits[one_to_zero_changes]
+            if not count_self_conflicts:
+                new_cells &= (columns[None, :] != I[rows, None]) & (columns[None, :] != J[rows, None])
+            if not new_cells.any():     continue
+            cells = _minimal_cells(cells + zip(one_to_zero_changes[new_cells].tolist(), 
+                                               zero_to_one_changes[new_cells].tolist()))
+            limits = cell_limits()
+    return cells
+
+
+######### Reproducibly seeded random repeats, optionally in parallel 
+#  (for clonality_grow_no_conflict_subset and give_N_codewords_even_distribution)
+
+# Each repeat gets its own random.Random instance, seeded with one of a list of seeds derived from a master seed, 
+#  so the result of each repeat only depends on the master seed and the repeat number, not on which process ran it.
+#  The shared state is given to each worker once, by the pool initializer.
+_REPEAT_WORKER_STATE = None
+
+def _init_repeat_worker(repeat_function, state):
+    global _REPEAT_WORKER_STATE
+    _REPEAT_WORKER_STATE = (repeat_function, state)
+
+def _seeded_repeats_job(seeds):
+    repeat_function, state = _REPEAT_WORKER_STATE
+    return [repeat_function(state, random.Random(seed)) for seed in seeds]
+
+def repeat_seeds(master_seed, N_repeats):
+    """ Return a list of N_repeats seeds derived from master_seed (always the same ones for the same master_seed). """
+    master_random = random.Random(master_seed)
+    return [master_random.getrandbits(64) for i in range(N_repeats)]
+
+def iter_seeded_repeats(repeat_function, state, N_repeats, master_seed=None, N_processes=1, repeats_per_job=None):
+    """ Yield repeat_function(state, random_generator) for N_repeats repeats, in repeat order, 
+    with random_generator a random.Random instance seeded with the matching seed from repeat_seeds(master_seed). 
+    If master_seed is None, it's taken from the random module (so it's still reproducible with random.seed).
+    If N_processes>1, the repeats are run by a process pool, in jobs of repeats_per_job repeats (default: enough 
+     for about 4 jobs per process) - repeat_function must be a module-level function, and the results are 
+     the same as with one process.  The state is shared with the workers read-only (don't change it).
+    """
+    if master_seed is None:     master_seed = random.getrandbits(64)
+    seeds = repeat_seeds(master_seed, N_repeats)
+    if N_processes<=1 or N_repeats<=1:
+        for seed in seeds:
+            yield repeat_function(state, random.Random(seed))
+        return
+    if repeats_per_job is None:
+        repeats_per_job = max(1, N_repeats // (4*N_processes))
+    jobs = [seeds[start:start+repeats_per_job] for start in range(0, N_repeats, repeats_per_job)]
+    import multiprocessing
+    pool = multiprocessing.Pool(N_processes, _init_repeat_worker, (repeat_function, state))
+    try:
+        for job_results in pool.imap(_seeded_repeats_job, jobs):
+            for result in job_results:
+                yield result
+    finally:
+        pool.terminate()
+
+def _iter_repeats(repeat_function, state, N_repeats, seed=None, N_processes=1):
+    """ Like iter_seeded_repeats, except that if seed is None and N_processes is 1, 
+    all the repeats just use the random module directly (the way things worked before seeds were added). """
+    if seed is None and N_processes<=1:
+        return (repeat_function(state, random) for i in range(N_repeats))
+    return iter_seeded_repeats(repeat_function, state, N_repeats, seed, N_processes)
+
+def _grow_no_conflict_subset_repeat(state, random_generator):
+    """ One repeat of Binary_code.clonality_grow_no_conflict_subset (see there for the state contents): 
+    return the list of indices of the codewords added to the starting subset, and the hash of the order they 
+    were tried in (to check the randomness). """
+    # the codewords are tried in the order of index_groups, shuffled within each group
+    indices_to_add = []
+    for index_group in state['index_groups']:
+        index_group = list(index_group)
+        random_generator.shuffle(index_group)
+        indices_to_add += index_group
+    # go over the indices_to_add list: if the current codeword has no conflicts with current subset, add it, 
+    #  otherwise skip and go on to the next one.
+    # blocked[i] is the number of conflicts that codeword i would complete if it was added to the current subset, 
+    #  updated every time a codeword is added, so checking a codeword is just checking its count is 0.
+    in_current_subset = list(state['starting_subset_mask'])
+    blocked = list(state['starting_blocked_counts'])
+    codeword_other_members = state['codeword_other_members']
+    added_indices = []
+    for index in indices_to_add:
+        if not blocked[index]:
+            added_indices.append(index)
+            in_current_subset[index] = True
+            # any triple that now has only one member outside the subset blocks that member
+            for other_members in codeword_other_members[index]:
+                missing = [m for m in other_members if not in_current_subset[m]]
+                if len(missing)==1:     blocked[missing[0]] += 1
+    return added_indices, hash(tuple(indices_to_add))
+
+def _even_distribution_repeat(state, random_generator):
+    """ One try of give_N_codewords_even_distribution: return the bit_sums_across_digits range and the subset
+    (a Packed_binary_code, or a codeword set for Linear_binary_code). """
+    code, N = state
+    if isinstance(code, Packed_binary_code):
+        subset = code.give_N_codewords_random(N, random_generator)
+    else:
+        subset = Packed_binary_code.from_codewords(code.length, code.give_N_codewords_random(N, random_generator))
+    bit_sums_across_digits = subset.bit_sums_across_digits()
+    BSAD_range = max(bit_sums_across_digits) - min(bit_sums_across_digits) if code.length else 0
+    return BSAD_range, subset
+
+
+######### Compact clonality conflict graph (integer-indexed, instead of sets of conflict details tuples)
+
+class Clonality_conflict_graph(object):
+    """ All the clonality conflicts of a code, as a hypergraph over codeword indices, stored in numpy arrays.
+
+    Made by Binary_code.clonality_count_conflicts with return_conflict_graph=True.
+    The codewords are in self.codewords (a sorted list); everything else refers to them by index:
+     - each conflict is a pair of codewords A,B whose clonality result A|B conflicts with one or more codewords C;
+        each (A,B,C) triple is one row of the parallel int32 arrays A_indices, B_indices, C_indices, 
+        with conflict_ids (also int32) saying which conflict it belongs to (triples of one conflict are consecutive);
+        for self-conflicts C is A or B.
+     - is_self is a boolean array, one value per conflict, True for self-conflicts.
+     - the codeword:triples adjacency is in CSR form: the indices of all triples involving codeword i are 
+        adjacency_triples[adjacency_offsets[i]:adjacency_offsets[i+1]] (each triple only listed once per codeword).
+    That takes about 20 bytes per triple, instead of a few hundred for a conflict details tuple with frozensets.
+    The conflict details tuple view (same as clonality_count_conflicts gives) is available with details().
+    """
+
+    def __init__(self, codewords, A_indices, B_indices, C_indices, conflict_ids, is_self, N_allowed_changes=(0,0)):
+        self.codewords = list(codewords)
+        self.N_allowed_changes = N_allowed_changes
+        self.A_indices = numpy.asarray(A_indices, dtype=numpy.int32)
+        self.B_indices = numpy.asarray(B_indices, dtype=numpy.int32)
+        self.C_indices = numpy.asarray(C_indices, dtype=numpy.int32)
+        self.conflict_ids = numpy.asarray(conflict_ids, dtype=numpy.int32)
+        self.is_self = numpy.asarray(is_self, dtype=bool)
+        if not len(self.A_indices)==len(self.B_indices)==len(self.C_indices)==len(self.conflict_ids):
+            raise BinaryCodeError("The conflict graph triple arrays must all be the same length!")
+        # CSR adjacency - each triple goes in the lists of A, B and C, but C only if it's not A or B (self-conflicts)
+        N_triples = len(self.A_indices)
+        triple_range = numpy.arange(N_triples, dtype=numpy.int32)
+        C_separate = (self.C_indices!=self.A_indices) & (self.C_indices!=self.B_indices)
+        self._C_separate = C_separate
+        members = numpy.concatenate([self.A_indices, self.B_indices, self.C_indices[C_separate]])
+        triples = numpy.concatenate([triple_range, triple_range, triple_range[C_separate]])
+        order = numpy.argsort(members, kind='mergesort')
+        self.adjacency_triples = triples[order]
+        member_counts = numpy.bincount(members, minlength=len(self.codewords)) if len(members) \
+                        else numpy.zeros(len(self.codewords), dtype=numpy.int64)
+        self.adjacency_offsets = numpy.zeros(len(self.codewords)+1, dtype=numpy.int64)
+        numpy.cumsum(member_counts, out=self.adjacency_offsets[1:])
+        self._codeword_to_index = None
+
+    def __len__(self):
+        """ The number of conflicts (not triples). """
+        return len(self.is_self)
+
+    def N_triples(self):
+        return len(self.A_indices)
+
+    def nbytes(self):
+        """ Memory used by the arrays (not counting the codeword list). """
+        return sum([x.nbytes for x in (self.A_indices, self.B_indices, self.C_indices, self.conflict_ids, self.is_self, 
+                                       self._C_separate, self.adjacency_triples, self.adjacency_offsets)])
+
+    def index(self, codeword):
+        """ Return the index of codeword in self.codewords, or None if it's not there. """
+        if self._codeword_to_index is None:
+            self._codeword_to_index = dict((C,i) for (i,C) in enumerate(self.codewords))
+        return self._codeword_to_index.get(codeword)
+
+    def triples_involving(self, index):
+        """ Return the array of indices of the triples that involve the codeword with the given index. """
+        return self.adjacency_triples[self.adjacency_offsets[index]:self.adjacency_offsets[index+1]]
+
+    def has_conflict_with_subset(self, index, in_subset):
+        """ Return True if the codeword with the given index, together with the subset, would be part of any conflict.
+        in_subset must be a boolean array over self.codewords; the codeword itself can be in the subset or not. """
+        triples = self.triples_involving(index)
+        if not len(triples):    return False
+        all_present = numpy.ones(len(triples), dtype=bool)
+        for member_indices in (self.A_indices[triples], self.B_indices[triples], self.C_indices[triples]):
+            all_present &= in_subset[member_indices] | (member_indices==index)
+        return bool(all_present.any())
+
+    def _missing_members(self, triples, in_subset):
+        """ For the given triples, return the number of members that aren't in the subset, 
+        and the last such member (only meaningful when there's exactly one). """
+        A_missing = ~in_subset[self.A_indices[triples]]
+        B_missing = ~in_subset[self.B_indices[triples]]
+        C_missing = ~in_subset[self.C_indices[triples]] & self._C_separate[triples]
+        N_missing = A_missing.astype(numpy.int32) + B_missing + C_missing
+        missing_member = numpy.where(C_missing, self.C_indices[triples], 
+                                     numpy.where(B_missing, self.B_indices[triples], self.A_indices[triples]))
+        return N_missing, missing_member
+
+    def blocked_counts(self, in_subset):
+        """ Return an array giving, for each codeword, the number of triples in which it's the only member 
+        that's not in the subset (in_subset is a boolean array over self.codewords) - a codeword not in the subset 
+        can be added to it without making a conflict exactly if its count is 0.  When a codeword is added, 
+        only the counts of the codewords in its triples can change (see other_members_lists).
+        Also return the number of triples that are entirely in the subset (i.e. conflicts within the subset). """
+        N_missing, missing_member = self._missing_members(slice(None), in_subset)
+        blocked = numpy.bincount(missing_member[N_missing==1], minlength=len(self.codewords))
+        return blocked, int(numpy.count_nonzero(N_missing==0))
+
+    def other_members_lists(self):
+        """ Return a list giving, for each codeword, a list of tuples of the other members of each triple it's in 
+        (one codeword index for self-conflicts, two otherwise) - a plain python version of the adjacency, 
+        for fast one-at-a-time updates of the blocked counts (see blocked_counts), since most codewords 
+        are only in a few triples and numpy has too much overhead for that. """
+        other_members = [[] for _ in self.codewords]
+        for (a,b,c,C_separate) in zip(self.A_indices.tolist(), self.B_indices.tolist(), self.C_indices.tolist(), 
+                                      self._C_separate.tolist()):
+            if C_separate:
+                other_members[a].append((b,c))
+                other_members[b].append((a,c))
+                other_members[c].append((a,b))
+            else:
+                other_members[a].append((b,))
+                other_members[b].append((a,))
+        return other_members
+
+    def subset_mask(self, codeword_subset):
+        """ Return a boolean array over self.codewords that's True for the codewords in codeword_subset. 
+        Codewords that aren't in self.codewords are ignored (they can't be in any conflicts). """
+        in_subset = numpy.zeros(len(self.codewords), dtype=bool)
+        for codeword in codeword_subset:
+            index = self.index(codeword)
+            if index is not None:   in_subset[index] = True
+        return in_subset
+
+    def conflict_counts(self):
+        """ Return an array of the number of conflicts each codeword is part of (same as clonality_count_conflicts). """
+        members = numpy.concatenate([self.A_indices, self.B_indices, self.C_indices])
+        conflicts = numpy.concatenate([self.conflict_ids, self.conflict_ids, self.conflict_ids])
+        # each codeword only gets counted once per conflict even if it's in multiple triples of it
+        pairs = numpy.unique(members.astype(numpy.int64) * max(len(self),1) + conflicts)
+        return numpy.bincount(pairs // max(len(self),1), minlength=len(self.codewords))
+
+    def iter_details(self):
+        """ Yield a conflict details tuple for each conflict (see Binary_code.clonality_count_conflicts). """
+        if not len(self.conflict_ids):  return
+        boundaries = numpy.flatnonzero(numpy.diff(self.conflict_ids)) + 1
+        starts = [0] + boundaries.tolist()
+        ends = boundaries.tolist() + [len(self.conflict_ids)]
+        codewords = self.codewords
+        for (start,end) in zip(starts,ends):
+            A, B = codewords[self.A_indices[start]], codewords[self.B_indices[start]]
+            C_set = frozenset([codewords[k] for k in self.C_indices[start:end].tolist()])
+            is_self = self.is_self[self.conflict_ids[start]]
+            yield (frozenset([A,B]), A|B, C_set, 'self' if is_self else '', self.N_allowed_changes)
+
+    def details(self):
+        """ Return the set of conflict details tuples (see Binary_code.clonality_count_conflicts). """
+        return set(self.iter_details())
+
+
+class _Conflict_graph_builder(object):
+    """ Collects conflicts (as codeword indices) in chunks of arrays and makes a Clonality_conflict_graph from them. """
+
+    _chunk_size = 65536
+
+    def __init__(self):
+        self._chunks = []
+        self._triples = ([], [], [], [])
+        self._is_self = []
+        self.N_conflicts = 0
+
+    def _flush(self):
+        if self._triples[0]:
+            self._chunks.append(tuple(numpy.array(x, dtype=numpy.int32) for x in self._triples) 
+                                + (numpy.array(self._is_self, dtype=bool),))
+            self._triples = ([], [], [], [])
+            self._is_self = []
+
+    def add_conflict(self, i, j, conflict_indices, is_self):
+        """ Add one conflict: codeword pair i,j, with the clonality result conflicting with the conflict_indices ones."""
+        for k in sorted(conflict_indices):
+            for (values,x) in zip(self._triples, (i, j, k, self.N_conflicts)):
+                values.append(x)
+        self._is_self.append(bool(is_self))
+        self.N_conflicts += 1
+        if len(self._triples[0]) >= self._chunk_size:   self._flush()
+
+    def add_conflict_arrays(self, I, J, K, is_self):
+        """ Add many conflicts with one conflicting codeword each, given as parallel index arrays. """
+        self._flush()
+        conflict_ids = numpy.arange(self.N_conflicts, self.N_conflicts+len(I), dtype=numpy.int32)
+        self._chunks.append((numpy.asarray(I, dtype=numpy.int32), numpy.asarray(J, dtype=numpy.int32), 
+                             numpy.asarray(K, dtype=numpy.int32), conflict_ids, numpy.asarray(is_self, dtype=bool)))
+        self.N_conflicts += len(I)
+
+    def graph(self, codewords, N_allowed_changes):
+        self._flush()
+        if self._chunks:    arrays = [numpy.concatenate(x) for x in zip(*self._chunks)]
+        else:               arrays = [numpy.zeros(0, dtype=numpy.int32) for _ in range(4)] + [numpy.zeros(0, dtype=bool)]
+        self._chunks = []
+        return Clonality_conflict_graph(codewords, *arrays, N_allowed_changes=N_allowed_changes)
+
+
+### Local search for a big conflict-free subset of a conflict graph (see Binary_code.clonality_local_search_subset)
+# The state is the subset S (in_subset), and for each codeword x not in S, blocked[x] = the number of conflict triples 
+#  whose only member missing from S is x (so x can be added to S exactly if blocked[x] is 0).  
+# Moves: adding a free codeword (blocked 0); a swap - adding a codeword x and removing one member of each triple 
+#  that blocks it, which is a (1,1) swap for blocked[x]==1 (same size, but it often frees other codewords, 
+#  which then get added - so a (1,2) swap overall); a perturbation (same, for a random x with higher blocked[x]) 
+#  only when there are no swaps left.  Recently removed codewords can't be added back, and recently added ones 
+#  can't be removed, for tabu_tenure moves (tabu search), so the search doesn't just undo its own swaps.
+
+class _Conflict_free_subset_search_state(object):
+    """ Subset, blocked counts, and the sets of free (blocked 0) and swappable (blocked 1) codewords, 
+    kept up to date with add and remove - see the local search description above. """
+
+    def __init__(self, codeword_other_members, in_subset, blocked):
+        self.codeword_other_members = codeword_other_members
+        self.in_subset = list(in_subset)
+        self.blocked = list(blocked)
+        self.size = sum(self.in_subset)
+        self.free, self.swappable = set(), set()
+        for index in range(len(self.in_subset)):
+            self._update_sets(index)
+
+    def _update_sets(self, index):
+        self.free.discard(index)
+        self.swappable.discard(index)
+        if not self.in_subset[index]:
+            if self.blocked[index]==0:      self.free.add(index)
+            elif self.blocked[index]==1:    self.swappable.add(index)
+
+    def _change_blocked(self, index, change):
+        self.blocked[index] += change
+        self._update_sets(index)
+
+    def _missing_other_members(self, index):
+        """ For each triple involving the codeword, yield the list of its other members that aren't in the subset. """
+        in_subset = self.in_subset
+        for other_members in self.codeword_other_members[index]:
+            yield [m for m in other_members if not in_subset[m]]
+
+    def add(self, index):
+        assert not self.in_subset[index] and self.blocked[index]==0
+        for missing in self._missing_other_members(index):
+            if len(missing)==1:     self._change_blocked(missing[0], +1)
+        self.in_subset[index] = True
+        self.size += 1
+        self._update_sets(index)
+
+    def remove(self, index):
+        assert self.in_subset[index]
+        self.in_subset[index] = False
+        self.size -= 1
+        for missing in self._missing_other_members(index):
+            if len(missing)==0:     self.blocked[index] += 1
+            elif len(missing)==1:   self._change_blocked(missing[0], -1)
+        self._update_sets(index)
+
+    def blocking_triples(self, index):
+        """ Return the list of (other members) tuples of the triples that block the codeword from being added. """
+        in_subset = self.in_subset
+        return [other_members for other_members in self.codeword_other_members[index] 
+                if all([in_subset[m] for m in other_members])]
+
+    def current_subset(self):
+        return [index for (index,present) in enumerate(self.in_subset) if present]
+
+
+def conflict_free_subset_local_search(conflict_graph, initial_indices, fixed_indices=(), time_limit=10, 
+                                      target_size=None, max_iterations=None, tabu_tenure=None, random_generator=random):
+    """ Improve a conflict-free subset of the codewords of a Clonality_conflict_graph by local search (see above).
+
+    initial_indices must be a conflict-free list of codeword indices, including all the fixed_indices 
+     (which will never be removed).  Stop after time_limit seconds (None for no limit), max_iterations moves, 
+     or when a subset of target_size codewords is found, whichever comes first - at least one of time_limit and 
+     max_iterations must be given.  Tabu tenure is the number of moves after which a swapped codeword can be 
+     swapped back (default: 7 plus about 1% of the codeword count, plus up to 3 random).  
+     The random choices use random_generator (the random module, or a random.Random instance). 
+    Return the best subset found (sorted list of indices) and a list of (move_number, seconds, subset_size) tuples, 
+     one for the initial subset and for each improvement after that.
+    """
+    import time
+    if time_limit is None and max_iterations is None:
+        raise BinaryCodeError("Local search needs a time limit or an iteration limit (or both)!")
+    start_time = time.time()
+    N = len(conflict_graph.codewords)
+    in_subset = numpy.zeros(N, dtype=bool)
+    in_subset[list(initial_indices)] = True
+    blocked, N_conflicts = conflict_graph.blocked_counts(in_subset)
+    if N_conflicts:
+        raise BinaryCodeError("The initial subset for the local search is not conflict-free!")
+    is_fixed = [False]*N
+    for index in fixed_indices:
+        if not in_subset[index]:
+            raise BinaryCodeError("The fixed codewords must all be in the initial subset for the local search!")
+        is_fixed[index] = True
+    codeword_other_members = conflict_graph.other_members_lists()
+    state = _Conflict_free_subset_search_state(codeword_other_members, in_subset.tolist(), blocked.tolist())
+    # codewords blocked by triples made entirely of fixed codewords can never be added
+    never_addable = set([index for index in range(N) if any([all([is_fixed[m] for m in other_members]) 
+                                                              for other_members in codeword_other_members[index]])])
+    if tabu_tenure is None:     tabu_tenure = 7 + N//100
+    # tabu_until[i] is the move number until which codeword i can't be added (if it was removed) or removed (if added)
+    tabu_until = [0]*N
+
+    best_subset = state.current_subset()
+    improvements = [(0, time.time()-start_time, len(best_subset))]
+    move = 0
+    while True:
+        if target_size is not None and len(best_subset) >= target_size:       break
+        if max_iterations is not None and move >= max_iterations:              break
+        if time_limit is not None and time.time()-start_time >= time_limit:    break
+        move += 1
+        # free codewords can always just be added
+        free = list(state.free - never_addable)
+        if free:
+            state.add(random_generator.choice(free))
+        else:
+            candidates = [index for index in state.swappable if tabu_until[index] < move and index not in never_addable]
+            # if there are no swaps, perturb: add a random codeword and remove whatever blocks it
+            if not candidates:
+                outside = [index for index in range(N) if not state.in_subset[index] and index not in never_addable]
+                # if every codeword that could be added is already there, this is the best possible subset
+                if not outside:     break
+                candidates = [index for index in outside if tabu_until[index] < move]
+            # if everything is tabu, there's nothing to do but wait for the tabu to run out
+            if not candidates:      continue
+            new_index = random_generator.choice(candidates)
+            for other_members in state.blocking_triples(new_index):
+                # an earlier removal for another blocking triple may have already unblocked this one
+                if not all([state.in_subset[m] for m in other_members]):    continue
+                removable = [m for m in other_members if not is_fixed[m] and tabu_until[m] < move] \
+                            or [m for m in other_members if not is_fixed[m]]
+                removed_index = random_generator.choice(removable)
+                state.remove(removed_index)
+                tabu_until[removed_index] = move + tabu_tenure + random_generator.randint(0,3)
+            state.add(new_index)
+            tabu_until[new_index] = move + tabu_tenure + random_generator.randint(0,3)
+        if state.size > len(best_subset):
+            best_subset = state.current_subset()
+            improvements.append((move, time.time()-start_time, len(best_subset)))
+    return best_subset, improvements
+
+
+### Exact branch and bound search for the biggest conflict-free subset of a conflict graph (only for small codes!)
+# Subsets are python ints used as bitsets over the codeword indices.  Each search node has the chosen subset S and 
+#  the candidate set P (codewords not decided yet, that can still be added to S without a conflict), and the list 
+#  of conflicts (as bitsets) that are still entirely within S|P.  Candidates that aren't in any of those conflicts 
+#  are just added; otherwise the node branches on the candidate in the most conflicts (first adding it, then not).
+# Upper bound for a node: |S|+|P| minus a lower bound on how many candidates have to be left out, the higher of:
+#  - the number of disjoint conflicts found greedily among the candidate parts of the remaining conflicts 
+#     (each of those needs a different codeword left out), trying smaller and lower-degree ones first; 
+#  - the degree bound: every remaining conflict needs at least one of its candidates left out, so the degrees 
+#     (numbers of conflicts) of the left-out candidates have to add up to at least the number of conflicts.
+
+def _bit_count(bitset):
+    return bin(bitset).count('1')
+
+def _bitset_indices(bitset):
+    indices = []
+    while bitset:
+        lowest_bit = bitset & -bitset
+        indices.append(lowest_bit.bit_length()-1)
+        bitset ^= lowest_bit
+    return indices
+
+def conflict_free_subset_branch_and_bound(conflict_graph, initial_indices, fixed_indices=(), node_limit=None, 
+                                          time_limit=None):
+    """ Find the biggest conflict-free subset of the codewords of a Clonality_conflict_graph by branch and bound.
+
+    initial_indices must be a conflict-free list of codeword indices including all the fixed_indices - it's the 
+     starting lower bound (the best subset found so far); the fixed_indices codewords are always in the subset.
+    Stop early after node_limit search nodes or time_limit seconds, if given.  
+    Return a (best_indices, upper_bound, N_nodes) tuple: best_indices is the best subset found (sorted list), 
+     and upper_bound is the highest possible size of a conflict-free subset - if it's the same as len(best_indices),
+     the result is optimal (always true unless the search stopped early); otherwise it's the remaining gap.
+    """
+    import time
+    start_time = time.time()
+    in_subset = numpy.zeros(len(conflict_graph.codewords), dtype=bool)
+    in_subset[list(initial_indices)] = True
+    if conflict_graph.blocked_counts(in_subset)[1]:
+        raise BinaryCodeError("The initial subset for the branch and bound search is not conflict-free!")
+    best_subset = sum([1<<index for index in set(initial_indices)])
+    best_size = _bit_count(best_subset)
+    # all the conflicts (self-conflicts are just pairs), as (bitset, member_indices) - no duplicates
+    conflict_bitsets = set()
+    for (a,b,c) in zip(conflict_graph.A_indices.tolist(), conflict_graph.B_indices.tolist(), 
+                       conflict_graph.C_indices.tolist()):
+        conflict_bitsets.add((1<<a) | (1<<b) | (1<<c))
+    conflicts = [(bitset, tuple(_bitset_indices(bitset))) for bitset in sorted(conflict_bitsets)]
+    # starting node: S is the fixed codewords, P is everything they don't block
+    S = sum([1<<index for index in set(fixed_indices)])
+    P = (1<<len(conflict_graph.codewords)) - 1 & ~S
+    for (bitset, _) in conflicts:
+        rest = bitset & ~S
+        if rest and not rest & (rest-1):    P &= ~rest
+    # the stack of nodes to do: (S, P, conflicts to check, upper bound from the parent node)
+    stack = [(S, P, conflicts, len(conflict_graph.codewords))]
+    N_nodes = 0
+    while stack:
+        if (node_limit is not None and N_nodes >= node_limit) or \
+           (time_limit is not None and time.time()-start_time >= time_limit):
+            break
+        S, P, parent_conflicts, parent_bound = stack.pop()
+        if parent_bound <= best_size:   continue
+        N_nodes += 1
+        # only the conflicts that are still entirely within S|P matter
+        not_possible = ~(S|P)
+        node_conflicts = [(bitset, members) for (bitset, members) in parent_conflicts if not bitset & not_possible]
+        # the candidates that aren't in any conflicts can just be added
+        candidates_in_conflicts = 0
+        for (bitset, _) in node_conflicts:     candidates_in_conflicts |= bitset & P
+        S |= P & ~candidates_in_conflicts
+        P &= candidates_in_conflicts
+        S_size = _bit_count(S)
+        if S_size > best_size:
+            best_subset, best_size = S, S_size
+        if not P:   continue
+        # the candidate parts of the conflicts (without duplicates), and how many of those each candidate is in
+        conflict_candidates = set([bitset & P for (bitset, _) in node_conflicts])
+        candidate_degrees = defaultdict(int)
+        for candidates_bitset in conflict_candidates:
+            for m in _bitset_indices(candidates_bitset):    candidate_degrees[m] += 1
+        # upper bound (see above): disjoint candidate parts
+        N_disjoint, used = 0, 0
+        for (_, _, candidates_bitset) in sorted([(_bit_count(candidates_bitset), 
+                                                  sum([candidate_degrees[m] for m in _bitset_indices(candidates_bitset)]), 
+                                                  candidates_bitset) for candidates_bitset in conflict_candidates]):
+            if not candidates_bitset & used:
+                N_disjoint += 1
+                used |= candidates_bitset
+        # upper bound (see above): degrees
+        N_by_degree, degree_sum = 0, 0
+        for degree in sorted(candidate_degrees.values(), reverse=True):
+            if degree_sum >= len(conflict_candidates):  break
+            N_by_degree += 1
+            degree_sum += degree
+        bound = S_size + _bit_count(P) - max(N_disjoint, N_by_degree)
+        if bound <= best_size:  continue
+        # branch on the candidate in the most conflicts: the node without it first on the stack, so it's done second
+        branch_index = max(candidate_degrees, key=lambda m: (candidate_degrees[m], -m))
+        branch_bit = 1<<branch_index
+        stack.append((S, P & ~branch_bit, node_conflicts, bound))
+        new_S, new_P = S | branch_bit, P & ~branch_bit
+        for (bitset, _) in node_conflicts:
+            if bitset & branch_bit:
+                rest = bitset & ~new_S
+                if not rest & (rest-1):     new_P &= ~rest
+        stack.append((new_S, new_P, node_conflicts, bound))
+    upper_bound = max([best_size] + [parent_bound for (_,_,_,parent_bound) in stack])
+    return _bitset_indices(best_subset), upper_bound, N_nodes
+
+
+######### Writing clonality conflict details to files as they're found (see Binary_code.clonality_count_conflicts)
+
+# A conflict sink is any object with an add(conflict_details) method, which gets each conflict details tuple 
+#  as soon as it's found; the two below write them to a file in chunks, so the memory use doesn't depend 
+#  on the number of conflicts.  Both can be used in a with statement, to close the file at the end.
+# Conflict record file format: a fixed-size header (little-endian: 8-byte magic string, codeword length (uint64), 
+#  words per codeword (uint32), N_allowed_changes as a (is_tuple, a, b) uint32 triple (b=0 for a single number), 
+#  record count (uint64)), followed by the records, all as little-endian uint64 values: for each conflict, 
+#  a (number_of_conflicting_codewords<<1 | is_self) word, then A, B, and each conflicting codeword C 
+#  (each as words_per_codeword words, highest bits first, as in Packed_binary_code); A<B and the Cs are sorted.
+
+_CONFLICT_FILE_MAGIC = 'BINCONF1'
+_CONFLICT_FILE_HEADER = struct.Struct('<8sQIIIIQ')
+_CONFLICT_TSV_HEADER = '# A\tB\tA|B\tconflicting_codewords\tself\tN_allowed_changes\n'
+
+def _sorted_conflict_codewords(conflict_details):
+    """ Return sorted (A,B) and sorted conflicting codeword lists from a conflict details tuple. """
+    AB_set, _, C_set = conflict_details[:3]
+    return sorted(AB_set, key=lambda codeword: codeword.value), sorted(C_set, key=lambda codeword: codeword.value)
+
+def _N_allowed_changes_string(N_allowed_changes):
+    if isinstance(N_allowed_changes,int):   return str(N_allowed_changes)
+    else:                                   return '%s,%s'%tuple(N_allowed_changes)
+
+def _parse_N_allowed_changes(string):
+    values = [int(x) for x in string.split(',')]
+    return values[0] if len(values)==1 else tuple(values)
+
+
+class Conflict_TSV_writer(object):
+    """ Conflict sink writing one tab-separated line per conflict: A, B, A|B, the comma-separated conflicting 
+    codewords, 'self' or '', N_allowed_changes (as a number or a comma-separated pair); lines are written 
+    buffer_lines at a time.  Read it back with read_conflict_file. """
+
+    def __init__(self, outfile, buffer_lines=10000):
+        self.outfile = outfile
+        self.buffer_lines = buffer_lines
+        self.N_conflicts = 0
+        self._lines = []
+        self._OUTFILE = open(outfile,'w')
+        self._OUTFILE.write(_CONFLICT_TSV_HEADER)
+
+    def add(self, conflict_details):
+        (A,B), C_list = _sorted_conflict_codewords(conflict_details)
+        self._lines.append('\t'.join([A.string(), B.string(), conflict_details[1].string(), 
+                                      ','.join([C.string() for C in C_list]), conflict_details[3], 
+                                      _N_allowed_changes_string(conflict_details[4])]) + '\n')
+        self.N_conflicts += 1
+        if len(self._lines) >= self.buffer_lines:   self.flush()
+
+    def flush(self):
+        self._OUTFILE.writelines(self._lines)
+        self._lines = []
+
+    def close(self):
+        if not self._OUTFILE.closed:
+            self.flush()
+            self._OUTFILE.close()
+
+    def __enter__(self):            return self
+    def __exit__(self, *args):      self.close()
+
+
+class Conflict_record_file_writer(object):
+    """ Conflict sink writing a compact binary conflict record file (see format description above), 
+    in chunks of about chunk_words 64-bit words.  Read it back with read_conflict_file. 
+    All the conflicts must be for the given codeword length and N_allowed_changes. """
+
+    def __init__(self, outfile, length, N_allowed_changes=(0,0), chunk_words=65536):
+        _check_N_permitted_changes(N_allowed_changes)
+        self.outfile = outfile
+        self.length = length
+        self.N_allowed_changes = N_allowed_changes
+        self.N_words = _words_per_codeword(length)
+        self.chunk_words = chunk_words
+        self.N_conflicts = 0
+        self._words = []
+        self._OUTFILE = open(outfile,'wb')
+        self._OUTFILE.write(self._header())
+
+    def _header(self):
+        if isinstance(self.N_allowed_changes,int):  N_changes_values = (0, self.N_allowed_changes, 0)
+        else:                                       N_changes_values = (1,) + tuple(self.N_allowed_changes)
+        return _CONFLICT_FILE_HEADER.pack(_CONFLICT_FILE_MAGIC, self.length, self.N_words, *(N_changes_values
+                                                                                             + (self.N_conflicts,)))
+
+    def add(self, conflict_details):
+        (A,B), C_list = _sorted_conflict_codewords(conflict_details)
+        if A.length != self.length:
+            raise BinaryCodeError("Can't write length %s conflicts to a length %s conflict file!"%(A.length,self.length))
+        if conflict_details[4] != self.N_allowed_changes:
+            raise BinaryCodeError("Can't write conflicts with N_allowed_changes %s "%(conflict_details[4],) 
+                                  + "to a conflict file for N_allowed_changes %s!"%(self.N_allowed_changes,))
+        self._words.append(len(C_list)<<1 | (conflict_details[3]=='self'))
+        for codeword in [A,B]+C_list:
+            if self.N_words==1: self._words.append(codeword.value)
+            else:               self._words.extend(_int_to_words(codeword.value, self.N_words))
+        self.N_conflicts += 1
+        if len(self._words) >= self.chunk_words:    self.flush()
+
+    def flush(self):
+        if self._words:
+            self._OUTFILE.write(array(self._words, dtype='<u8').tobytes())
+            self._words = []
+
+    def close(self):
+        """ Write the remaining records and the final record count (in the header), and close the file. """
+        if not self._OUTFILE.closed:
+            self.flush()
+            self._OUTFILE.seek(0)
+            self._OUTFILE.write(self._header())
+            self._OUTFILE.close()
+
+    def __enter__(self):            return self
+    def __exit__(self, *args):      self.close()
+
+
+def _iter_conflict_record_file(infile, chunk_words):
+    INFILE = open(infile,'rb')
+    header = INFILE.read(_CONFLICT_FILE_HEADER.size)
+    if len(header) < _CONFLICT_FILE_HEADER.size:
+        raise BinaryCodeError("Conflict record file %s is too short to have a header!"%infile)
+    _, length, N_words, N_changes_is_tuple, a, b, N_conflicts = _CONFLICT_FILE_HEADER.unpack(header)
+    N_allowed_changes = (a,b) if N_changes_is_tuple else a
+    N_read = 0
+    # words from the previous chunk that don't make a whole record yet, and how many more words that record needs
+    words = []
+    position = 0
+    N_missing_words = 0
+    while True:
+        # (reading at least the rest of the partial record, so each word is only carried over to the next chunk once, 
+        #  even if a record is longer than chunk_words)
+        chunk = numpy.fromfile(INFILE, dtype='<u8', count=max(chunk_words, N_missing_words))
+        if not len(chunk):  break
+        words = words[position:] + chunk.tolist()
+        position = 0
+        N_missing_words = 0
+        while position < len(words):
+            N_C, is_self = words[position]>>1, words[position]&1
+            record_end = position + 1 + (2+N_C)*N_words
+            if record_end > len(words):     
+                N_missing_words = record_end - len(words)
+                break
+            if N_words==1:  codeword_values = words[position+1:record_end]
+            else:           codeword_values = [_words_to_int(words[start:start+N_words]) 
+                                               for start in range(position+1, record_end, N_words)]
+            A, B = [Binary_codeword._from_int(value,length) for value in codeword_values[:2]]
+            C_set = frozenset([Binary_codeword._from_int(value,length) for value in codeword_values[2:]])
+            yield (frozenset([A,B]), A|B, C_set, 'self' if is_self else '', N_allowed_changes)
+            N_read += 1
+            position = record_end
+    INFILE.close()
+    if position < len(words) or N_read != N_conflicts:
+        raise BinaryCodeError("Conflict record file %s has %s whole records, "%(infile, N_read)
+                              + "but the header says %s - truncated, damaged, or not closed?"%N_conflicts)
+
+def _iter_conflict_TSV_file(infile):
+    for line in open(infile):
+        if line.startswith('#') or not line.strip():   continue
+        fields = line.rstrip('\n').split('\t')
+        A, B, clonality_result = [Binary_codeword(x) for x in fields[:3]]
+        C_set = frozenset([Binary_codeword(x) for x in fields[3].split(',') if x])
+        yield (frozenset([A,B]), clonality_result, C_set, fields[4], _parse_N_allowed_changes(fields[5]))
+
+def read_conflict_file(infile, chunk_words=65536):
+    """ Yield the conflict details tuples (as in Binary_code.clonality_count_conflicts) from a conflict file written 
+    by Conflict_TSV_writer or Conflict_record_file_writer (the format is detected automatically), one at a time. 
+    Record files are read in chunks of chunk_words 64-bit words. """
+    INFILE = open(infile,'rb')
+    start = INFILE.read(len(_CONFLICT_FILE_MAGIC))
+    INFILE.close()
+    if start == _CONFLICT_FILE_MAGIC:   return _iter_conflict_record_file(infile, chunk_words)
+    else:                               return _iter_conflict_TSV_file(infile)
 
 
 ######### Binary code (set of binary strings) representation
 
 # MAYBE-TODO figure out a naming that won't confuse people!  (Or me!)  Mathematically a "code" is a set of codewords (or a method of encoding things), but IRL a "code" can be either a method of encoding things or just a string, so code/codeword is confusing and even I'm using them wrong!
 
-class Binary_code:
+# how many codewords to check at once in batched membership checks (see Binary_code.contains_many)
+_MEMBERSHIP_BATCH_SIZE = 4096
+
+# default memory limit (in MB) for each code's cache of clonality conflict results (see Binary_code._cache_conflicts)
+DEFAULT_CONFLICT_CACHE_MAX_MB = 256
+
+class _Codeword_set(set):
+    """ A set that counts its in-place changes in self.version, used for Binary_code.codewords,
+    so that data cached from the codeword set can be checked even if the set was changed directly. """
+    version = 0
+    def add(self, x):                           self.version += 1;  return set.add(self, x)
+    def remove(self, x):                        set.remove(self, x);  self.version += 1
+    def discard(self, x):                       self.version += 1;  return set.discard(self, x)
+    def pop(self):
+        x = set.pop(self);  self.version += 1;  return x
+    def clear(self):                            self.version += 1;  return set.clear(self)
+    def update(self, *others):                  self.version += 1;  return set.update(self, *others)
+    def intersection_update(self, *others):     self.version += 1;  return set.intersection_update(self, *others)
+    def difference_update(self, *others):       self.version += 1;  return set.difference_update(self, *others)
+    def symmetric_difference_update(self, other):
+        self.version += 1;  return set.symmetric_difference_update(self, other)
+    def __ior__(self, other):                   self.version += 1;  return set.__ior__(self, other)
+    def __iand__(self, other):                  self.version += 1;  return set.__iand__(self, other)
+    def __isub__(self, other):                  self.version += 1;  return set.__isub__(self, other)
+    def __ixor__(self, other):                  self.version += 1;  return set.__ixor__(self, other)
+
+class Binary_code(object):
     """ Essentially a set of Binary_codeword objects, all of the same length."""
 
+    @property
+    def codewords(self):
+        return self._codewords
+
+    @codewords.setter
+    def codewords(self, codeword_set):
+        # assigning a plain set is allowed, but it gets copied into a _Codeword_set so that changes can be detected
+        if not isinstance(codeword_set, _Codeword_set):  codeword_set = _Codeword_set(codeword_set)
+        self._codewords = codeword_set
+
+    def _codeword_set_state(self):
+        """ Return a (codeword set, version) tuple that changes whenever self.codewords is replaced or changed in place;
+        data cached from the codewords should store it and be ignored if it doesn't match the current one. """
+        return (self.codewords, self.codewords.version)
+
+    def _is_current(self, codeword_set_state):
+        codeword_set, version = codeword_set_state
+        return codeword_set is self.codewords and version==self.codewords.version
+
     def __init__(self,length,val=[],method='list',expected_count=0):
         """ Initialize with given codeword length; add all elements of values to the set of codewords (default empty)."""
         try: 
@@ -220,6 +2134,12 @@ class Binary_code:
             raise BinaryCodeError('Binary_code length argument "%s" is not an int or possible to cast to an int!'%length)
         self.method = method
         self.codewords = set()
+        self._packed_cache = None
+        self._linear_info = None
+        self._conflict_tracker = None
+        self._conflict_cache = OrderedDict()
+        self.conflict_cache_max_MB = DEFAULT_CONFLICT_CACHE_MAX_MB
+        self._statistics_cache_data = None
         if method=='list':
             for x in val: self.add(x)
         elif method=='listfile':    
@@ -228,9 +2148,11 @@ class Binary_code:
             self.get_code_from_generator_matrix(generator_matrix=val)
         elif method=='matrixfile':    
             self.get_code_from_generator_matrix(generator_file=val)
+        elif method=='binaryfile':    
+            self.read_code_from_binary_file(val)
         else:
             raise BinaryCodeError("method %s passed to the Binary_code initializer not recognized! "%method 
-                                  + "(allowed methods are list, listfile, matrix, matrixfile)")
+                                  + "(allowed methods are list, listfile, matrix, matrixfile, binaryfile)")
         if expected_count and not self.size()==expected_count:
             raise BinaryCodeError("Binary_code initializer gave %s codewords, "%self.size() 
                                   + "not %s as expected!"%expected_count)
@@ -238,7 +2160,19 @@ class Binary_code:
     def add(self,val):
         """ Add Binary_code(val) codeword to the code, checking for correct length."""
         # it's all right if val is a Binary_codeword already, that works too - similar to sets
-        self.codewords.add(Binary_codeword(val,length=self.length,check_length=True))
+        codeword = Binary_codeword(val,length=self.length,check_length=True)
+        linear_info = self._linear_code_info()
+        if linear_info is not None and codeword not in self.codewords:
+            parity_check_rows, removed_values = linear_info
+            # re-adding a removed codeword is fine, but anything else means the code isn't known to be linear any more
+            if codeword.value in removed_values:    removed_values.remove(codeword.value)
+            else:                                   self._linear_info = None
+        if codeword in self.codewords:  return
+        self.codewords.add(codeword)
+        self._keep_linear_info_current()
+        self._codewords_changed()
+        if self._conflict_tracker is not None:
+            self._conflict_tracker._codeword_added(codeword)
 
     def remove(self,val):
         """ Remove Binary_code(val) codeword from the code; fail if val wasn't in the code, or is the wrong length."""
@@ -247,6 +2181,8 @@ class Binary_code:
         # trying to remove an element from a set where it wasn't present raises KeyError - we want a similar behavior.
         except KeyError:
             raise BinaryCodeError("Codeword %s cannot be removed from code because it wasn't present!"%val)
+        self._codeword_removed(Binary_codeword(val,length=self.length))
+        self._codewords_changed()
 
     def remove_extreme_codeword(self,bit=0):
         """ Remove the all-zero codeword (if bit==0; default) or the all-one codeword (if bit==1) from the code.  
@@ -254,16 +2190,281 @@ class Binary_code:
         # MAYBE-TODO or should I make this return a new code instead? Do I want the codes to be immutable or not?
         if bit not in [0,1,'0','1']:
             raise BinaryCodeError("bit argument to remove_extreme_codeword must be 0 or 1!")
+        codeword = Binary_codeword(str(bit)*self.length,length=self.length)
         try:
-            self.codewords.remove(Binary_codeword(str(bit)*self.length,length=self.length))
-            return 1
+            self.codewords.remove(codeword)
         except KeyError:
             return 0
+        self._codeword_removed(codeword)
+        self._codewords_changed()
+        return 1
 
     def size(self):
         """ Return the number of codewords currently in the code."""
         return len(self.codewords)
 
+    def __contains__(self,val):
+        """ Return True if val (a Binary_codeword, or anything that can be made into one) is in the code."""
+        if not isinstance(val,Binary_codeword):
+            try:                        val = Binary_codeword(val,length=self.length,check_length=True)
+            except BinaryCodeError:     return False
+        return val in self.codewords
+
+    def iter_codewords(self):
+        """ Iterate over all the codewords in the code (in arbitrary order). """
+        return iter(self.codewords)
+
+    def _iter_codeword_pairs(self):
+        """ Iterate over all unordered pairs of distinct codewords in the code. """
+        return itertools.combinations(self.codewords,2)
+
+    def _iter_pair_clonality_results(self):
+        """ Iterate over (A, B, A|B, whether A|B is in the code) for all unordered pairs of distinct codewords A,B.
+        For codes known to be linear, membership is checked in batches by syndrome (as in contains_many) rather than 
+         by hashing, and pairs where A|B is neither in the code nor equal to A or B are skipped. """
+        linear_info = self._linear_code_info()
+        if linear_info is None:
+            for A,B in self._iter_codeword_pairs():
+                clonality_result = A|B
+                yield A, B, clonality_result, clonality_result in self.codewords
+            return
+        codeword_pairs = self._iter_codeword_pairs()
+        while True:
+            pair_batch = list(itertools.islice(codeword_pairs, _MEMBERSHIP_BATCH_SIZE))
+            if not pair_batch:  break
+            # only the values are needed for the check, and codeword objects are only made for the pairs that matter
+            result_values = [A.value|B.value for (A,B) in pair_batch]
+            results_in_code = self._linear_values_in_code(result_values, linear_info).tolist()
+            for (A,B), result_value, result_in_code in zip(pair_batch, result_values, results_in_code):
+                if result_in_code or result_value in (A.value, B.value):
+                    yield A, B, Binary_codeword._from_int(result_value, self.length), result_in_code
+
+    def _clonality_weight_pruning(self, N_allowed_changes):
+        """ Work out which weights matter for the clonality conflict search, from the codeword weights alone: 
+        return a (result_weights, target_weights) tuple of length+1 True/False lists, where result_weights says which 
+         weights an A|B result can have while still being close to some codeword, and target_weights says which 
+         codeword weights can be close to some A|B at all.
+        A|B has a weight between max(weight(A),weight(B)) and weight(A)+weight(B) (and over weight(A) if the weights 
+         are the same, since A and B are different), and it can only be within (a 1->0, b 0->1) changes of a codeword C 
+         if its weight is between weight(C)-a and weight(C)+b (or within r of weight(C) for a single N_allowed_changes r)
+         - see possible_clonality_result_weights.
+        Constant-weight codes and codes in a narrow weight band (see choose_codewords_by_bit_sum) get the most pruning: 
+         for instance, in a constant-weight code every A|B is heavier than all the codewords, so with no 0->1 changes 
+         allowed there is nothing to check at all, and with b of them only the A|B with weights up to w+b are looked up.
+        """
+        weight_counts = self.find_bit_sum_counts()
+        reachable_weights = [False]*(self.length+1)
+        for (N, (weight_A, count_A)) in enumerate(weight_counts):
+            for (weight_B, count_B) in weight_counts[N:]:
+                if weight_A==weight_B and count_A<2:  continue
+                for weight in range(weight_B+(weight_A==weight_B), min(self.length, weight_A+weight_B)+1):
+                    reachable_weights[weight] = True
+        possible_weights = possible_clonality_result_weights([weight for (weight,_) in weight_counts], 
+                                                             N_allowed_changes, self.length)
+        result_weights = [reachable and possible for (reachable, possible) in zip(reachable_weights, possible_weights)]
+        if isinstance(N_allowed_changes,int):   below, above = N_allowed_changes, N_allowed_changes
+        else:                                   below, above = N_allowed_changes
+        target_weights = [any(result_weights[max(0, weight-below):max(0, weight+above+1)]) 
+                          for weight in range(self.length+1)]
+        return result_weights, target_weights
+
+    def _iter_weight_pruned_codeword_pairs(self, result_weights, pairs_per_tile=2**18):
+        """ Iterate over the unordered pairs of distinct codewords, grouped by weight, skipping all the pairs of weight 
+        groups where the A|B weight range (max(weight(A),weight(B)) to weight(A)+weight(B)) has no result_weights. 
+        For codeword lengths up to 64, the A|B weights of the remaining pairs are also calculated in vectorized tiles 
+         (of about pairs_per_tile pairs), and only the pairs with result_weights are given - for longer codewords 
+         the pairs may still have A|B with other weights, so those have to be checked separately. """
+        weight_to_codewords = defaultdict(list)
+        for codeword in self.iter_codewords():  weight_to_codewords[codeword.weight()].append(codeword)
+        weight_groups = sorted(weight_to_codewords.items())
+        result_weights_array = array(result_weights, dtype=bool)
+        for (N, (weight_A, codewords_A)) in enumerate(weight_groups):
+            for (weight_B, codewords_B) in weight_groups[N:]:
+                if not any(result_weights[weight_B+(weight_A==weight_B):weight_A+weight_B+1]):     continue
+                if self.length>64:
+                    if weight_A==weight_B:  pairs = itertools.combinations(codewords_A, 2)
+                    else:                   pairs = itertools.product(codewords_A, codewords_B)
+                    for pair in pairs:  yield pair
+                    continue
+                values_A = array([codeword.value for codeword in codewords_A], dtype=numpy.uint64)
+                values_B = array([codeword.value for codeword in codewords_B], dtype=numpy.uint64)
+                rows_per_tile = max(1, pairs_per_tile // len(codewords_B))
+                for row_start in range(0, len(codewords_A), rows_per_tile):
+                    row_end = min(row_start+rows_per_tile, len(codewords_A))
+                    keep = result_weights_array[_popcount_uint64(values_A[row_start:row_end, None] | values_B[None, :])]
+                    # within one weight group, only take each pair once
+                    if weight_A==weight_B:  keep &= numpy.arange(row_start, row_end)[:, None] < numpy.arange(len(values_B))
+                    for (i, j) in zip(*[x.tolist() for x in numpy.nonzero(keep)]):
+                        yield codewords_A[row_start+i], codewords_B[j]
+
+    def neighbor_index(self, max_radius, N_substrings=None):
+        """ Return a Neighbor_index over the codewords, for radius queries up to max_radius (see Neighbor_index). """
+        return Neighbor_index(self.iter_codewords(), self.length, max_radius, N_substrings)
+
+    def _close_codeword_finder(self, N_allowed_changes, use_neighbor_index=False, target_weights=None):
+        """ Return a function that takes a codeword X and returns the set of code codewords C that X is too close to.
+        (i.e. X is in expand_by_all_mutations([C],N_allowed_changes) - see that function's docstring for details.) 
+        By default all codewords are expanded by mutations up front, which is fast but can take a lot of memory; 
+         if use_neighbor_index is True, a Neighbor_index is used instead. 
+        If target_weights is given (a length+1 list of True/False), only the codewords with those weights are expanded 
+         or indexed - use it when no X will ever be close to the other ones (see _clonality_weight_pruning). """
+        if target_weights is None:  codewords = self.codewords
+        else:                       codewords = [C for C in self.codewords if target_weights[C.weight()]]
+        if use_neighbor_index:
+            index = Neighbor_index(codewords, self.length, _N_changes_radius(N_allowed_changes))
+            return lambda codeword: index.query(codeword, N_allowed_changes)
+        expanded_conflict_values = expand_by_all_mutations_dict(codewords, N_allowed_changes)
+        empty_set = frozenset()
+        return lambda codeword: expanded_conflict_values.get(codeword, empty_set)
+
+    def contains_many(self,codewords):
+        """ Batched membership check: given a list of Binary_codeword objects, return a matching list of True/False.
+        If the code is known to be linear (made from a generator matrix, possibly with some codewords removed since), 
+         this is done by vectorized syndrome calculation with the parity-check matrix rather than by hashing. """
+        linear_info = self._linear_code_info()
+        if linear_info is None:
+            return [codeword in self for codeword in codewords]
+        codewords = list(codewords)
+        right_length = [codeword.length==self.length for codeword in codewords]
+        if all(right_length):
+            return self._linear_values_in_code([codeword.value for codeword in codewords], linear_info).tolist()
+        values = [codeword.value if OK else 0 for (codeword, OK) in zip(codewords, right_length)]
+        in_code = self._linear_values_in_code(values, linear_info)
+        return [bool(x) and OK for (x, OK) in zip(in_code, right_length)]
+
+    def _linear_values_in_code(self, values, linear_info):
+        """ Given a list of codeword values (ints) and the _linear_code_info output, return a boolean array of membership."""
+        parity_check_rows, removed_values = linear_info
+        if self.length<=64:     words = numpy.fromiter(values, dtype=numpy.uint64, count=len(values))
+        else:                   words = _pack_int_list(values, self.length)
+        in_code = packed_syndrome_is_zero(words, parity_check_rows, self.length)
+        if removed_values:
+            in_code &= numpy.array([value not in removed_values for value in values], dtype=bool)
+        return in_code
+
+    def parity_check_matrix(self):
+        """ Return the parity-check matrix of the code (as a numpy 0/1 array with one row per parity check), 
+        derived from the generator matrix by GF(2) elimination; raise BinaryCodeError if the code isn't known to be linear.
+        (If some codewords were removed from the linear code since, this is still the matrix of the original code.) """
+        linear_info = self._linear_code_info()
+        if linear_info is None:
+            raise BinaryCodeError("Can't give the parity-check matrix: the code isn't known to be linear "
+                                  + "(only codes made from a generator matrix are, and only until other codewords are added)")
+        parity_check_rows = linear_info[0]
+        return array([Binary_codeword(row, length=self.length).list() for row in parity_check_rows], 
+                     dtype=int).reshape(len(parity_check_rows), self.length)
+
+    def _linear_code_info(self):
+        """ If the code is a linear code with some (or no) codewords removed, return a (parity_check_rows, removed_values)
+        tuple (the removed values set can be modified in place), otherwise None.  
+        The information is set when the code is made from a generator matrix, and dropped when other codewords are added, 
+         or ignored if self.codewords was replaced or changed directly. """
+        if self._linear_info is None:
+            return None
+        codeword_set_state, rank, parity_check_rows, removed_values = self._linear_info
+        if not self._is_current(codeword_set_state) or len(self.codewords) != 2**rank - len(removed_values):
+            self._linear_info = None
+            return None
+        return parity_check_rows, removed_values
+
+    def _keep_linear_info_current(self):
+        """ Mark the linear code information as still matching self.codewords after one add/remove, 
+        since those keep it up to date themselves (but not if the codewords were also changed some other way). """
+        if self._linear_info is not None:
+            codeword_set, version = self._linear_info[0]
+            if codeword_set is self.codewords and version+1==self.codewords.version:
+                self._linear_info = (self._codeword_set_state(),) + self._linear_info[1:]
+
+    def _codeword_removed(self,codeword):
+        """ Keep track of removed codewords for linear codes and the conflict tracker (called after each removal). """
+        self._keep_linear_info_current()
+        if self._linear_info is not None:
+            self._linear_info[3].add(codeword.value)
+            if self._linear_code_info() is None:    self._linear_info = None
+        if self._conflict_tracker is not None:
+            self._conflict_tracker._codeword_removed(codeword)
+
+    def enable_conflict_tracking(self, N_allowed_changes=(0,0), count_self_conflicts=False):
+        """ Start keeping track of clonality conflicts incrementally as codewords are added or removed; 
+        return the Clonality_conflict_tracker (see its docstring for details).  Only one tracker can be active. """
+        self._conflict_tracker = Clonality_conflict_tracker(self, N_allowed_changes, count_self_conflicts)
+        return self._conflict_tracker
+
+    def disable_conflict_tracking(self):
+        """ Stop keeping track of clonality conflicts (see enable_conflict_tracking). """
+        self._conflict_tracker = None
+
+    def _codewords_changed(self):
+        """ Drop all the data cached based on the current codeword set - must be called whenever self.codewords changes."""
+        self._packed_cache = None
+        self._conflict_cache.clear()
+        self._statistics_cache_data = None
+
+    def _statistics_cache(self):
+        """ Return a dictionary for caching statistics of the current codeword set (distance histogram etc).
+        Cleared by add/remove etc, and ignored if self.codewords was replaced or changed directly. """
+        if self._statistics_cache_data is not None:
+            codeword_set_state, statistics = self._statistics_cache_data
+            if self._is_current(codeword_set_state):    return statistics
+        self._statistics_cache_data = (self._codeword_set_state(), {})
+        return self._statistics_cache_data[1]
+
+    ### Cache of clonality conflict results (counts, and the conflict graph if one was made), so that calling several 
+    #   clonality functions with the same arguments only does the O(N^2) conflict search once.  Keyed by a fingerprint of the codeword set 
+    #   (so it's safe even if self.codewords is replaced directly), N_allowed_changes and count_self_conflicts; 
+    #   cleared whenever the code changes; least recently used results are dropped when over conflict_cache_max_MB.
+    #   With conflict_cache_max_MB<=0 the cache isn't used at all, so no fingerprint is ever calculated.
+
+    def _conflict_cache_key(self, N_allowed_changes, count_self_conflicts):
+        return (self._sorted_codewords_and_packed()[1].fingerprint(), N_allowed_changes, bool(count_self_conflicts))
+
+    def _cached_conflicts(self, cache_key):
+        """ Return the cached (conflict_count_to_codeword_set, conflict_graph) tuple for the key, or None; 
+        conflict_graph is None if only the counts were cached.  Both are shared with the cache, so don't modify them! """
+        if self.conflict_cache_max_MB<=0 or cache_key not in self._conflict_cache:    return None
+        # move it to the end, as the most recently used
+        cached = self._conflict_cache.pop(cache_key)
+        self._conflict_cache[cache_key] = cached
+        return cached[:2]
+
+    def _cache_conflicts(self, cache_key, conflict_count_to_codeword_set, conflict_graph):
+        """ Add the results to the cache (unless they're bigger than the limit), dropping old ones if needed. 
+        conflict_graph can be None, to only cache the counts. """
+        max_bytes = self.conflict_cache_max_MB * 2**20
+        # rough size estimate: the graph arrays, plus ~100 bytes per codeword for the count dictionary
+        size = 100*sum([len(codewords) for codewords in conflict_count_to_codeword_set.values()])
+        if conflict_graph is not None:  size += conflict_graph.nbytes()
+        if size > max_bytes:    return
+        # (re-adding a key replaces the old results, and makes it the most recently used)
+        self._conflict_cache.pop(cache_key, None)
+        self._conflict_cache[cache_key] = (conflict_count_to_codeword_set, conflict_graph, size)
+        while sum([cached[2] for cached in self._conflict_cache.values()]) > max_bytes:
+            self._conflict_cache.popitem(last=False)
+
+    def clear_conflict_cache(self):
+        """ Drop all the cached clonality conflict results (they're also dropped whenever the code changes). """
+        self._conflict_cache.clear()
+
+    def _sorted_codewords_and_packed(self):
+        """ Return a sorted list of all codewords and the matching Packed_binary_code (same order); cached.
+        The cache is cleared by add/remove etc, and ignored if self.codewords was replaced or changed directly. """
+        if self._packed_cache is not None:
+            codeword_set_state, codeword_list, packed = self._packed_cache
+            if self._is_current(codeword_set_state):
+                return codeword_list, packed
+        codeword_list = sorted(self.codewords, key=lambda codeword: codeword.value)
+        N_words = _words_per_codeword(self.length)
+        if N_words==1:  words = array([c.value for c in codeword_list], dtype=numpy.uint64)
+        else:           words = array([_int_to_words(c.value,N_words) for c in codeword_list], dtype=numpy.uint64)
+        packed = Packed_binary_code(self.length, words, already_sorted=True)
+        self._packed_cache = (self._codeword_set_state(), codeword_list, packed)
+        return codeword_list, packed
+
+    def packed(self):
+        """ Return a Packed_binary_code (numpy array-based) version of the code, for fast vectorized operations.
+        The result is cached until the code changes - don't modify it. Use Packed_binary_code.to_binary_code to go back."""
+        return self._sorted_codewords_and_packed()[1]
+
     def read_code_from_file(self,infile,expected_count=0):
         """ Populate the code with codewords read from a plaintext file of 0/1 strings (one per line).
         Skip comment lines (starting with #).  Optionally make sure the codeword count is as expected. """
@@ -277,12 +2478,34 @@ class Binary_code:
                                   + "not %s as expected!"%expected_count)
 
     def write_code_to_file(self,outfile):
-        """ Write all the codewords (in arbitrary order) to a plaintext file of 0/1 strings (one per line). """
+        """ Write all the codewords (sorted) to a plaintext file of 0/1 strings (one per line). """
         OUTFILE = open(outfile,'w')
-        for codeword in self.codewords:
+        for codeword in self._sorted_codewords_and_packed()[0]:
             OUTFILE.write(codeword.string()+'\n')
         OUTFILE.close()
 
+    def read_code_from_binary_file(self,infile,expected_count=0):
+        """ Populate the code with codewords read from a binary code file (see write_packed_code_file). 
+        Optionally make sure the codeword count is as expected. """
+        packed = read_packed_code_file(infile)
+        if not packed.length==self.length:
+            raise BinaryCodeError("Binary code file %s has codeword length %s, "%(infile,packed.length)
+                                  + "but the code length is %s!"%self.length)
+        if expected_count and not packed.size()==expected_count:   
+            raise BinaryCodeError("File %s contained %s codewords, "%(infile,packed.size())
+                                  + "not %s as expected!"%expected_count)
+        codeword_list = packed.codeword_list()
+        if not self.codewords:
+            self.codewords.update(codeword_list)
+            self._codewords_changed()
+            self._packed_cache = (self._codeword_set_state(), codeword_list, packed)
+        else:
+            for codeword in codeword_list:  self.add(codeword)
+
+    def write_code_to_binary_file(self,outfile):
+        """ Write all the codewords to a binary code file (see write_packed_code_file), readable with method binaryfile."""
+        write_packed_code_file(self.packed(), outfile)
+
     def get_code_from_generator_matrix(self,generator_file=None,generator_matrix=None,expected_count=0):
         """ Given either a generator matrix (as a numpy array) or a plaintext file containing the matrix, 
         add all codewords generated by that matrix to the current code.  Check if the count is as expected, if given.
@@ -291,7 +2514,9 @@ class Binary_code:
         if generator_file and generator_matrix:
             raise BinaryCodeError("Provide either a generator_file or a generator_matrix, not both!")
         if generator_file:
-            generator_matrix = array([[int(x) for x in line.strip()] for line in open(generator_file)])
+            generator_matrix = read_generator_matrix_file(generator_file)
+        else:
+            generator_matrix = array(generator_matrix)
         # the encoded word length and the codeword length (i.e. the n and k from the [n,k,d] description)
         #  can be inferred from the generator matrix size; check if they match self.length and expected_count (if given)
         input_code_length, output_code_length = generator_matrix.shape
@@ -302,11 +2527,24 @@ class Binary_code:
         if expected_count and not expected_count==codeword_count:
             raise BinaryCodeError("The number of codewords generated by the given matrix will be %s, "%codeword_count
                                   + "not %s as expected!"%expected_count)
-        # generate all possible input codewords of length k, and convert them to codewords using matrix dot-multiplication
-        #   (need to do a %2 at the end because binary addition in coding theory is basically xor - I think...)
-        for x in range(codeword_count):
-            x = Binary_codeword(x,length=input_code_length).list()
-            self.add(dot(x,generator_matrix)%2)
+        # generate all possible codewords - this is the same as taking each possible input codeword of length k 
+        #   and multiplying it by the matrix (mod 2), but done as a Gray code walk over packed ints, which is much faster.
+        #   (binary addition in coding theory is basically xor, so each codeword is the XOR of some generator rows)
+        packed = expand_generator_matrix_codewords(generator_matrix)
+        codeword_list = packed.codeword_list()
+        if not self.codewords:
+            self.codewords.update(codeword_list)
+            self._codewords_changed()
+            # we already have the sorted codeword list and the packed version, so fill the cache
+            self._packed_cache = (self._codeword_set_state(), codeword_list, packed)
+            # the code is linear, so keep the parity-check matrix for fast membership checks (see contains_many)
+            reduced_rows, _ = GF2_row_reduce(generator_matrix_rows_as_ints(generator_matrix), self.length)
+            self._linear_info = (self._codeword_set_state(), len(reduced_rows), 
+                                 parity_check_rows_from_generator(reduced_rows, self.length), set())
+        else:
+            self.codewords.update(codeword_list)
+            self._codewords_changed()
+            self._linear_info = None
 
     # MAYBE-TODO I could make one or both of these be the initialization signature instead, but who cares
     # MAYBE-TODO could add the minimum Hamming distance to this?
@@ -320,35 +2558,80 @@ class Binary_code:
     # MAYBE-TODO this hashing solution is dangerous, since technically codeword sets ARE mutable... Hmmmm...
     #def __hash__(self):         return hash(frozenset(self.codewords))      
 
-    def find_Hamming_distance_range(self):
-        """ Return a tuple containing the lowest and highest Hamming distance between all codeword pairs."""
-        # set start lov/high values to impossible extremes to make sure they get overwritten
-        if len(self.codewords)==0:
+    def find_Hamming_distance_range(self, low_threshold=None, tile_size=512):
+        """ Return a tuple containing the lowest and highest Hamming distance between all codeword pairs.
+        Done on the packed code in vectorized tiles of pairs (see packed_Hamming_distance_range); if low_threshold is 
+         given, stop as soon as the lowest distance is low_threshold or below, and return (lowest, None) in that case.
+        For an intact linear code (made from a generator matrix, with no codewords removed), the distances between 
+         codewords are exactly the weights of the nonzero codewords (see weight_enumerator), so no pairs need to be 
+         compared at all.
+        """
+        if self.size()==0:
             return None,None
-        low = self.length+1
-        high = 0
-        for x,y in itertools.combinations(self.codewords,2):
-            dist = Hamming_distance(x,y)
-            low = min(low,dist)
-            high = max(high,dist)
-        return low,high
+        # if the full distance histogram was already calculated, that has the answer
+        histogram = self._statistics_cache().get('Hamming_distance_histogram')
+        if histogram is not None:
+            distances = [distance for (distance,count) in enumerate(histogram) if count]
+            if not distances:   return self.length+1, 0
+            low, high = min(distances), max(distances)
+            if low_threshold is not None and low <= low_threshold:  return low, None
+            return low, high
+        linear_info = self._linear_code_info()
+        if linear_info is not None and not linear_info[1] and self.size()>1:
+            nonzero_weights = [weight for (weight,count) in enumerate(self.weight_enumerator()) if weight>0 and count]
+            low, high = min(nonzero_weights), max(nonzero_weights)
+            if low_threshold is not None and low <= low_threshold:  return low, None
+            return low, high
+        return self.packed().find_Hamming_distance_range(low_threshold, tile_size)
         # more on Hamming distance comparisons/implementations: http://stackoverflow.com/questions/2420412/search-for-string-allowing-for-one-mismatch-in-any-location-of-the-string
 
+    def Hamming_distance_histogram(self, tile_size=512):
+        """ Return the number of codeword pairs at each Hamming distance, as a list of length+1 ints (index is distance).
+        Done on the packed code in vectorized tiles of pairs, so memory use is bounded (see packed_Hamming_distance_histogram).
+        For an intact linear code (no codewords removed), each codeword has the same distance profile as the all-zero 
+         codeword, so the histogram is just N*A_d/2, with A being the weight enumerator - no pairs are compared at all.
+        The result is cached until the code changes. """
+        statistics = self._statistics_cache()
+        if 'Hamming_distance_histogram' not in statistics:
+            linear_info = self._linear_code_info()
+            if linear_info is not None and not linear_info[1]:
+                histogram = [self.size()*count//2 for count in self.weight_enumerator()]
+                histogram[0] = 0
+            else:
+                histogram = self.packed().Hamming_distance_histogram(tile_size)
+            statistics['Hamming_distance_histogram'] = histogram
+        return list(statistics['Hamming_distance_histogram'])
+
+    def weight_enumerator(self):
+        """ Return the number of codewords of each weight (bit-sum), as a list of length+1 ints (index is weight).
+        Same information as find_bit_sum_counts, but for an intact linear code (no codewords removed) with rank k over 
+         half the length, it's calculated from the smaller dual code (2**(length-k) codewords, spanned by the parity-check
+         rows) with the MacWilliams identity, instead of going over all 2**k codewords (see MacWilliams_transform).
+        The result is cached until the code changes. """
+        statistics = self._statistics_cache()
+        if 'weight_enumerator' not in statistics:
+            linear_info = self._linear_code_info()
+            if linear_info is not None and not linear_info[1] and 2*len(linear_info[0]) < self.length:
+                dual_weight_enumerator = span_weight_histogram(linear_info[0], self.length)
+                statistics['weight_enumerator'] = MacWilliams_transform(dual_weight_enumerator, self.length)
+            else:
+                weight_enumerator = [0]*(self.length+1)
+                for (bit_sum,count) in self.find_bit_sum_counts():     weight_enumerator[bit_sum] = count
+                statistics['weight_enumerator'] = weight_enumerator
+        return list(statistics['weight_enumerator'])
+
     def find_bit_sum_counts(self):
         """ Return the number of codewords with each possible bit-sum value (weight), as a list of (bit-sum, count) tuples.
         The return value is a sorted list of tuples, for readability, but convertion into a dictionary is trivial."""
-        bit_sum_counts = defaultdict(lambda: 0)
-        for codeword in self.codewords:
-            bit_sum_counts[codeword.weight()] += 1
-        return sorted(bit_sum_counts.items())
+        return self.packed().find_bit_sum_counts()
 
     def total_bit_sum(self):
         """ Return the total sum of bits in all the codewords."""
-        return sum([codeword.weight() for codeword in self.codewords])
+        return self.packed().total_bit_sum()
 
     def bit_sums_across_digits(self):
         """ Return a list giving the total number of codewords with a 1 at each digit, over codeword length. """
-        return [sum([codeword.list()[digit] for codeword in self.codewords]) for digit in range(self.length)]
+        return self.packed().bit_sums_across_digits()
 
     def add_parity_bit(self):
         """ Return a new Binary_code object generated by adding a parity bit to the current codewords.
@@ -372,22 +2655,25 @@ class Binary_code:
         """ Take all codewords with bit sums in low-high range; either return the set, or replace self.codewords with it.
         If high is -1, don't apply an upper bound. 
         """
-        if high==-1:    high = self.find_bit_sum_counts()[-1][0]
-        new_codewords = set()
-        for codeword in self.codewords:
-            if low <= codeword.weight() <= high:  new_codewords.add(codeword)
+        codeword_list, packed = self._sorted_codewords_and_packed()
+        weights = packed.weights()
+        if high==-1:    selected = (weights >= low)
+        else:           selected = (weights >= low) & (weights <= high)
+        new_codewords = set([codeword_list[i] for i in numpy.flatnonzero(selected)])
         if replace_self:
             self.codewords = new_codewords
+            self._codewords_changed()
             return
         else:
             return new_codewords
 
-    def give_N_codewords_random(self,N):
-        """ Return a set of N randomly chosen codewords.  Raise an error if N is higher than current code size. """
+    def give_N_codewords_random(self,N,random_generator=random):
+        """ Return a set of N randomly chosen codewords.  Raise an error if N is higher than current code size. 
+        The choice is made with random_generator (the random module, or a random.Random instance). """
         if N>self.size():
             raise BinaryCodeError("Cannot reduce the code to %s elements, it's already only %s!"%(N,self.size()))
         # Grab the codewords as a list; Sort normally (i.e. by string) just to make sure the result is reproducible.
-        new_codeword_set = set(random.sample(self.codewords, N))
+        new_codeword_set = set(random_generator.sample(self.codewords, N))
         return new_codeword_set
 
     def give_N_codewords_by_bit_sum(self, N, take_high=False):
@@ -407,26 +2693,34 @@ class Binary_code:
             if codeword_total>=N:   break
         # now that we know what bit-sum range to use, grab all the keywords from that range, and randomly choose N.
         bit_sum_min, bit_sum_max = min(bit_sums_to_use), max(bit_sums_to_use)
-        codewords_by_bit_sum = self.choose_codewords_by_bit_sum(bit_sum_min, bit_sum_max, replace_self=False)
-        new_codeword_set = set(random.sample(codewords_by_bit_sum, N))
-        return new_codeword_set
+        return self._random_codewords_by_bit_sum(bit_sum_min, bit_sum_max, N)
         # MAYBE-TODO add an option to make it take all the codewords from all the bit-sum sets except the last one (and random from the last one to get up to N), instead of just taking random N ones from the whole range?  More complicated, not sure if useful.
 
-    def give_N_codewords_even_distribution(self, N, N_tries, return_repeat_summary=False):
+    def _random_codewords_by_bit_sum(self, low, high, N):
+        """ Return a set of N codewords chosen randomly from all the codewords with bit sums in low-high range. """
+        codewords_by_bit_sum = self.choose_codewords_by_bit_sum(low, high, replace_self=False)
+        return set(random.sample(codewords_by_bit_sum, N))
+
+    def give_N_codewords_even_distribution(self, N, N_tries, return_repeat_summary=False, seed=None, N_processes=1):
         """ Run give_N_codewords_random N_tries times, return result with most even bit_sums_across_digits distribution.
         If return_repeat_summary is True, also return a list containing the max-min range for each try.
+        If seed is given, each try uses its own random generator seeded from it (see iter_seeded_repeats), 
+         so the result only depends on the seed; if N_processes>1, the tries are run by a process pool 
+         (with a seed taken from the random module if none is given) - the results are the same for any N_processes.
         """
-        best_code, best_BSAD_range, all_BSAD_ranges = None, self.size(), []
-        for i in range(N_tries):
-            curr_code = Binary_code(self.length, self.give_N_codewords_random(N))
-            bit_sums_across_digits = curr_code.bit_sums_across_digits()
-            BSAD_range = max(bit_sums_across_digits) - min(bit_sums_across_digits)
-            if BSAD_range < best_BSAD_range:
-                best_code = curr_code
+        if N>self.size():
+            raise BinaryCodeError("Cannot reduce the code to %s elements, it's already only %s!"%(N,self.size()))
+        # work on the packed version of the code: each try is just a random row subset and a vectorized column sum
+        codeword_list, packed = self._sorted_codewords_and_packed()
+        best_subset, best_BSAD_range, all_BSAD_ranges = None, self.size(), []
+        for (BSAD_range, curr_subset) in _iter_repeats(_even_distribution_repeat, (packed, N), N_tries, seed, N_processes):
+            if BSAD_range < best_BSAD_range or best_subset is None:
+                best_subset = curr_subset
                 best_BSAD_range = BSAD_range
             all_BSAD_ranges.append(BSAD_range)
-        if return_repeat_summary:     return best_code.codewords, all_BSAD_ranges
-        else:                         return best_code.codewords
+        best_codewords = best_subset.codewords()
+        if return_repeat_summary:     return best_codewords, all_BSAD_ranges
+        else:                         return best_codewords
 
     def add_mirrored_bits(self, bit_position_list):
         """ Return new Binary_code with all codewords extended by mirroring the given bits.
@@ -445,8 +2739,21 @@ class Binary_code:
         return Binary_code(length=new_codeword_length, val=new_codewords, method='list', expected_count=self.size())
 
 
+    def _clonality_deal_with_all_zero_codeword(self, count_self_conflicts, remove_all_zero_codeword, quiet):
+        """ Remove the all-zero codeword if requested; print a warning if it's kept and count_self_conflicts is True."""
+        if remove_all_zero_codeword:    self.remove_extreme_codeword(bit=0)
+        elif count_self_conflicts and (Binary_codeword('0'*self.length) in self) and not quiet:
+            print("Warning: you're running a clonality conflict check with count_self_conflicts turned on, and your code "
+                  +"contains the all-zero codeword - be aware that it's going to generate a clonality conflict with "
+                  +"EVERYTHING. Set the remove_all_zero_codeword argument to True if you'd like to prevent that; "
+                  +"set the quiet argument to True to silence this message.")
+        # MAYBE-TODO add a remove_all_one_codeword option too?  It's frequently bad to have it in there...
+
     def clonality_count_conflicts(self, N_allowed_changes=(0,0), count_self_conflicts=False,remove_all_zero_codeword=False,
-                                  print_conflict_details=False, return_conflict_details=False, quiet=False):
+                                  print_conflict_details=False, return_conflict_details=False, quiet=False, 
+                                  use_neighbor_index=False, vectorized=True, tile_size=512, 
+                                  N_processes=1, rows_per_job=None, return_conflict_graph=False, conflict_sink=None, 
+                                  use_cache=True):
         """ Simple clonality conflict count.  Return a (conflict_count: codeword_set) dictionary.
         Go over all combinations of codewords A,B,C in the code, and whenever the clonality sum A+B is close enough to C  
          according to N_allowed changes (which can be either a single number or a (1_to_0_changes, 0_to_1_changes) tuple)
@@ -460,27 +2767,116 @@ class Binary_code:
          tuples, where A and B are two codewords in the code, A|B is their clonality result, C is the codeword or set
           of codewords that A|B conflicts with (i.e. is too close to, based on N_allowed_changes), s is 'self' if it was 
           a self-conflict and '' otherwise, and n is N_allowed_changes (since I don't have the real N_changes available).
+        If use_neighbor_index is True, the close codewords for nonzero N_allowed_changes are found with a Neighbor_index 
+         rather than by expanding all the codewords by all mutations first - slower, but needs much less memory 
+         for high N_allowed_changes.
+        If vectorized is True (default), the zero-change case for codeword lengths up to 64 is done on the packed code 
+         in tiles of tile_size x tile_size pairs (see clonality_zero_change_conflicts_packed) - same results, much faster.
+        If N_processes>1, the pairs are split into blocks of rows_per_job rows and counted by a process pool
+         (see parallel_clonality_conflicts) - the results are the same as with a single process.
+        If return_conflict_graph is True, also return the same conflicts as a Clonality_conflict_graph - a compact 
+         integer-indexed form, much smaller than the details set for large codes (and it can still give the details).
+         If both return_conflict_details and return_conflict_graph are True, the return value is a 
+         (conflict_count_dict, conflict_details, conflict_graph) tuple.
+        If conflict_sink is given, each conflict details tuple is passed to conflict_sink.add as soon as it's found, 
+         without keeping them all - use Conflict_TSV_writer or Conflict_record_file_writer to write them to a file
+         (and read_conflict_file to read them back), for more conflicts than fit in memory.
+        If use_cache is True, the counts (and the conflict graph, if return_conflict_graph is True) are kept in 
+         a per-code cache (limited to self.conflict_cache_max_MB, see _cache_conflicts), so later calls with the same 
+         N_allowed_changes and count_self_conflicts on the same codewords don't redo the conflict search - 
+         calls that only want the counts can use any cached results, and ones that want the details or the graph 
+         can use cached results with a graph (the details are generated from the graph).
         """
 
-        # deal with all-zero codeword: remove if requested, print warning if it's False and count_self_conflicts is True
-        if remove_all_zero_codeword:    self.remove_extreme_codeword(bit=0)
-        elif count_self_conflicts and (Binary_codeword('0'*self.length) in self.codewords) and not quiet:
-            print("Warning: you're running a clonality conflict check with count_self_conflicts turned on, and your code "
-                  +"contains the all-zero codeword - be aware that it's going to generate a clonality conflict with "
-                  +"EVERYTHING. Set the remove_all_zero_codeword argument to True if you'd like to prevent that; "
-                  +"set the quiet argument to True to silence this message.")
-        # MAYBE-TODO add a remove_all_one_codeword option too?  It's frequently bad to have it in there...
+        self._clonality_deal_with_all_zero_codeword(count_self_conflicts, remove_all_zero_codeword, quiet)
 
-        # set up conflict-count dictionary, with a 0 for each codeword
-        codeword_to_conflict_count = dict([(codeword,0) for codeword in self.codewords])
         if return_conflict_details:     all_conflict_details = set()
+        if_details = print_conflict_details or return_conflict_details or conflict_sink is not None
+        def record_conflict_details(conflict_details):
+            if print_conflict_details:      print conflict_details
+            if return_conflict_details:     all_conflict_details.add(conflict_details)
+            if conflict_sink is not None:   conflict_sink.add(conflict_details)
+        def final_return_values(conflict_count_to_codeword_set, conflict_graph):
+            # a copy of the count dictionary, since the original may be in the cache
+            return_values = [dict((count, set(codewords)) for (count, codewords) in conflict_count_to_codeword_set.items())]
+            if return_conflict_details:     return_values.append(all_conflict_details)
+            if return_conflict_graph:       return_values.append(conflict_graph)
+            if len(return_values)==1:       return return_values[0]
+            else:                           return tuple(return_values)
+
+        ### If the same conflicts were already found, just use those
+        use_cache = use_cache and self.conflict_cache_max_MB>0
+        if use_cache:
+            cache_key = self._conflict_cache_key(N_allowed_changes, count_self_conflicts)
+            cached = self._cached_conflicts(cache_key)
+            if cached is not None and (cached[1] is not None or not (if_details or return_conflict_graph)):
+                conflict_count_to_codeword_set, conflict_graph = cached
+                if if_details:
+                    for conflict_details in conflict_graph.iter_details():  record_conflict_details(conflict_details)
+                return final_return_values(conflict_count_to_codeword_set, conflict_graph)
+        # the graph is only made if it's requested - not just for the cache, since it can take a lot of time and memory
+        build_conflict_graph = return_conflict_graph
+
+        # set up conflict-count dictionary, with a 0 for each codeword
+        codeword_to_conflict_count = dict([(codeword,0) for codeword in self.iter_codewords()])
+        if build_conflict_graph:       
+            graph_builder = _Conflict_graph_builder()
+            graph_codewords = self._sorted_codewords_and_packed()[0]
+            graph_codeword_to_index = {}
+            def add_details_to_graph(conflict_details):
+                if not graph_codeword_to_index:
+                    graph_codeword_to_index.update((C,i) for (i,C) in enumerate(graph_codewords))
+                i, j = sorted([graph_codeword_to_index[X] for X in conflict_details[0]])
+                graph_builder.add_conflict(i, j, [graph_codeword_to_index[C] for C in conflict_details[2]], 
+                                           conflict_details[3]=='self')
+
+        ### Parallel version of both cases below (split into row blocks of the pair space)
+        if N_processes>1 and self.size()>1:
+            codeword_list, packed = self._sorted_codewords_and_packed()
+            if N_allowed_changes in [0, (0,0)] and vectorized and self.length<=64:  
+                worker_N_allowed_changes, target_weights = None, None
+            else:   
+                worker_N_allowed_changes = N_allowed_changes
+                target_weights = self._clonality_weight_pruning(N_allowed_changes)[1]
+            # the conflicts from each job are dealt with as they come, rather than all at the end
+            def record_job_conflicts(conflicts):
+                for (i,j,conflict_indices,is_self) in conflicts:
+                    if build_conflict_graph:
+                        graph_builder.add_conflict(i, j, conflict_indices, is_self)
+                    if if_details:
+                        A, B = codeword_list[i], codeword_list[j]
+                        record_conflict_details((frozenset([A,B]), A|B, 
+                                                 frozenset([codeword_list[k] for k in conflict_indices]), 
+                                                 'self' if is_self else '', N_allowed_changes))
+            conflict_counts, _ = parallel_clonality_conflicts(packed, worker_N_allowed_changes, 
+                          count_self_conflicts, if_details or build_conflict_graph, N_processes, rows_per_job, 
+                          tile_size, conflict_callback=record_job_conflicts, use_neighbor_index=use_neighbor_index, 
+                          target_weights=target_weights)
+            codeword_to_conflict_count = dict(zip(codeword_list, conflict_counts.tolist()))
 
         ### Special case just for 0 allowed_changes, because the normal way is SLOW
         # MAYBE-TODO it would be better code if the special case wasn't here... But it is faster than the general case.
         # MAYBE-TODO add option to force using the general case even for 0 changes, to make totally sure it's the same?
-        if N_allowed_changes in [0, (0,0)]:
-            for A,B in itertools.combinations(self.codewords,2):
-                clonality_result = A|B
+        elif N_allowed_changes in [0, (0,0)] and vectorized and self.length<=64:
+            codeword_list, packed = self._sorted_codewords_and_packed()
+            conflict_counts = numpy.zeros(len(codeword_list), dtype=numpy.int64)
+            # one block of tile_size rows at a time, so that only one block's conflicts are kept at once
+            for row_start in range(0, len(codeword_list), tile_size):
+                row_range = (row_start, min(row_start+tile_size, len(codeword_list)))
+                block_counts, conflicts = clonality_zero_change_conflicts_packed(packed.words, count_self_conflicts, 
+                                          if_details or build_conflict_graph, tile_size, row_ranges=[row_range])
+                conflict_counts += block_counts
+                if build_conflict_graph:
+                    graph_builder.add_conflict_arrays(*conflicts)
+                if if_details:
+                    for (i,j,k,is_self) in zip(*[x.tolist() for x in conflicts]):
+                        A, B, clonality_result = codeword_list[i], codeword_list[j], codeword_list[k]
+                        record_conflict_details((frozenset([A,B]), clonality_result, frozenset([clonality_result]), 
+                                                 'self' if is_self else '', N_allowed_changes))
+            codeword_to_conflict_count = dict(zip(codeword_list, conflict_counts.tolist()))
+
+        elif N_allowed_changes in [0, (0,0)]:
+            for A,B,clonality_result,result_in_code in self._iter_pair_clonality_results():
                 conflict_details = None
                 conflict_info = (frozenset([A,B]),clonality_result,frozenset([clonality_result]))
                 # if clonality_result is A or B, what to do depends on if count_self_conflicts is True
@@ -491,72 +2887,280 @@ class Binary_code:
                         # MAYBE-TODO use short string representations for A,B,clonality_result?  Or only when printing?...
                         conflict_details = conflict_info+('self',N_allowed_changes)
                 # if clonality_result is an existing codeword (that's not A or B), add a conflict count
-                elif clonality_result in self.codewords: 
+                elif result_in_code: 
                     for codeword in [A,B,clonality_result]:
                         codeword_to_conflict_count[codeword] += 1
                     conflict_details = conflict_info+('',N_allowed_changes)
-                if conflict_details and print_conflict_details:     print conflict_details
-                if conflict_details and return_conflict_details:    all_conflict_details.add(conflict_details)
+                if conflict_details and if_details:                 record_conflict_details(conflict_details)
+                if conflict_details and build_conflict_graph:       add_details_to_graph(conflict_details)
 
         ### Standard case, for when the allowed change count arguments aren't 0: 
         #   pre-calculate a pool of all illegal clonality results based on all the codewords and check against that.
+        #   Codewords and pairs that can't be involved in conflicts based on their weights are skipped 
+        #    (see _clonality_weight_pruning), and so are A|B results with the wrong weights.
         # MAYBE-TODO why is this still so much slower than the special case version, even with 0,0 arguments?  
         #   Is it the set operations? Ir is it that much slower at all, really?... Do I care enough to fix it?
         else:
-            expanded_conflict_values = expand_by_all_mutations_dict(self.codewords, N_allowed_changes)
-            for A,B in itertools.combinations(self.codewords,2):
+            result_weights, target_weights = self._clonality_weight_pruning(N_allowed_changes)
+            find_close_codewords = self._close_codeword_finder(N_allowed_changes, use_neighbor_index, target_weights)
+            for A,B in self._iter_weight_pruned_codeword_pairs(result_weights):
                 clonality_result = A|B
+                if not result_weights[clonality_result.weight()]:   continue
                 conflict_details = None
-                if clonality_result in expanded_conflict_values: 
+                close_codewords = find_close_codewords(clonality_result)
+                if close_codewords: 
                     # if the list of base codewords for the conflict contains codewords other than A and B, 
                     #   register a conflict for A, B and all the base codewords (doing a set union 
                     #    ensures that even if A/B were among the base codewords, they only get one conflict)
-                    if len(expanded_conflict_values[clonality_result]-set([A,B]))>0:
-                        for codeword in expanded_conflict_values[clonality_result].union(set([A,B])):
+                    if len(close_codewords-set([A,B]))>0:
+                        for codeword in close_codewords.union(set([A,B])):
                             codeword_to_conflict_count[codeword] += 1
-                        conflict_set = frozenset(expanded_conflict_values[clonality_result] - set([A,B]))
+                        conflict_set = frozenset(close_codewords - set([A,B]))
                         conflict_details = (frozenset([A,B]),clonality_result,conflict_set,'',N_allowed_changes)
                     # if the list of base codewords for the conflict was only A/B, 
                     #   only register a conflict is count_self_conflicts is True
                     elif count_self_conflicts:
                         for codeword in A,B:
                             codeword_to_conflict_count[codeword] += 1
-                        conflict_set = frozenset(expanded_conflict_values[clonality_result] & set([A,B]))
+                        conflict_set = frozenset(close_codewords & set([A,B]))
                         conflict_details = (frozenset([A,B]),clonality_result,conflict_set,'self',N_allowed_changes)
-                if conflict_details and print_conflict_details:     print conflict_details
-                if conflict_details and return_conflict_details:    all_conflict_details.add(conflict_details)
+                if conflict_details and if_details:                 record_conflict_details(conflict_details)
+                if conflict_details and build_conflict_graph:       add_details_to_graph(conflict_details)
 
         ### generate the final conflict_count:codeword_set dictionary from the codeword:conflict_count one
         conflict_count_to_codeword_set = invert_dict_tolists(codeword_to_conflict_count)
-        if return_conflict_details:     return conflict_count_to_codeword_set, all_conflict_details
-        else:                           return conflict_count_to_codeword_set
+        conflict_graph = graph_builder.graph(graph_codewords, N_allowed_changes) if build_conflict_graph else None
+        if use_cache:
+            self._cache_conflicts(cache_key, conflict_count_to_codeword_set, conflict_graph)
+        return final_return_values(conflict_count_to_codeword_set, conflict_graph)
 
     def clonality_conflict_check(self, N_allowed_changes=(0,0), count_self_conflicts=False, remove_all_zero_codeword=False,
-                                  print_conflict_details=False, quiet=False):
+                                  print_conflict_details=False, quiet=False, return_witness=False):
         """ Return False if the code contains no clonality conflicts based on arguments, True otherwise.
-        Passes all its arguments to clonality_count_conflicts - see that function's docstring for details."""
-        # MAYBE-TODO could rewrite this to be much faster by writing it separately and having it just go on until
-        #   the first conflict and then return True, instead of using clonality_count_conflicts and thus needing to
-        #   go through all the combinations, but I'm not sure it's worth it.
-        conflict_count_to_codeword_set = self.clonality_count_conflicts(N_allowed_changes, count_self_conflicts, 
-                            remove_all_zero_codeword, print_conflict_details, return_conflict_details=False, quiet=quiet)
-        if conflict_count_to_codeword_set.keys() in ([0],[]):   return False
-        else:                                                   return True
+        The arguments and conflict rules are the same as for clonality_count_conflicts (see its docstring), 
+         but this stops at the first conflict found instead of going through all the codeword pairs.
+        If return_witness is True, return a (True/False, witness) tuple instead, where witness is the conflict details 
+         tuple (same format as in clonality_count_conflicts) for the conflict found, or None if there are no conflicts.
+        print_conflict_details prints that conflict only.
+        If the conflicts for these arguments are already cached (see clonality_count_conflicts), the witness is taken
+         from there (or if only the counts are cached and they're all 0, there's no need to search at all); 
+         the early-stopping search doesn't add anything to the cache.
+        """
+        self._clonality_deal_with_all_zero_codeword(count_self_conflicts, remove_all_zero_codeword, quiet)
+        # (no need for the cache key if there's nothing in the cache)
+        if self.conflict_cache_max_MB>0 and self._conflict_cache:
+            cached = self._cached_conflicts(self._conflict_cache_key(N_allowed_changes, count_self_conflicts))
+        else:
+            cached = None
+        if cached is not None and cached[1] is not None:    
+            witness = next(cached[1].iter_details(), None)
+        elif cached is not None and not any(cached[0].keys()):
+            witness = None
+        else:
+            witness = self._find_first_clonality_conflict(N_allowed_changes, count_self_conflicts)
+        if witness and print_conflict_details:  print witness
+        if return_witness:  return (witness is not None), witness
+        else:               return (witness is not None)
 
-    # MAYBE-TODO write a function to find the highest N_allowed_changes that results in no clonality conflict?  Maybe just for single-digit N_allowed_changes - otherwise we run into the issue of whether (2,0) or (0,3) is higher, although there could be more options to deal with that.
+    def _find_first_clonality_conflict(self, N_allowed_changes, count_self_conflicts, tile_size=512):
+        """ Return the conflict details tuple for a clonality conflict (see clonality_count_conflicts), or None. 
+
+        The zero-change case for lengths up to 64 is vectorized (first_zero_change_conflict_packed), stopping at the first 
+         tile with a conflict.  Otherwise see _scan_for_first_clonality_conflict.
+        """
+        if N_allowed_changes in [0, (0,0)] and self.length<=64:
+            codeword_list, packed = self._sorted_codewords_and_packed()
+            conflict = first_zero_change_conflict_packed(packed.words, count_self_conflicts, tile_size)
+            if conflict is None:    return None
+            (i, j, k, is_self) = conflict
+            A, B, clonality_result = codeword_list[i], codeword_list[j], codeword_list[k]
+            return (frozenset([A,B]), clonality_result, frozenset([clonality_result]), 'self' if is_self else '', 
+                    N_allowed_changes)
+        return self._scan_for_first_clonality_conflict(N_allowed_changes, count_self_conflicts)
+
+    def _scan_for_first_clonality_conflict(self, N_allowed_changes, count_self_conflicts):
+        """ Return the conflict details tuple for the first clonality conflict found by scanning the codeword pairs, or None.
+
+        Only the pairs of codewords light enough to give A|B weights that could be close to some codeword weight 
+         are checked (no other pair can be a conflict, including self-conflicts) - see _iter_pairs_up_to_weight.
+        A|B results are looked up in a Neighbor_index, so there's no expensive setup before the first pair is checked.
+        """
+        possible_weights = possible_clonality_result_weights([w for (w,_) in self.find_bit_sum_counts()], 
+                                                             N_allowed_changes, self.length)
+        if not any(possible_weights):   return None
+        max_possible_weight = max(w for w in range(self.length+1) if possible_weights[w])
+        # a Neighbor_index is quick to make, unlike the full mutation expansion of all the codewords, 
+        #  which would take far longer than the scan itself if a conflict is found early
+        find_close_codewords = self._close_codeword_finder(N_allowed_changes, use_neighbor_index=True)
+        # A|B has at least the weight of A and of B, so pairs with heavier codewords can't be conflicts
+        for (A, B) in self._iter_pairs_up_to_weight(max_possible_weight):
+            clonality_result = A|B
+            if not possible_weights[clonality_result.weight()]:    continue
+            close_codewords = find_close_codewords(clonality_result)
+            if not close_codewords:     continue
+            # same rules as in the general case of clonality_count_conflicts
+            if len(close_codewords-set([A,B]))>0:
+                return (frozenset([A,B]), clonality_result, frozenset(close_codewords - set([A,B])), '', 
+                        N_allowed_changes)
+            elif count_self_conflicts:
+                return (frozenset([A,B]), clonality_result, frozenset(close_codewords & set([A,B])), 'self', 
+                        N_allowed_changes)
+        return None
+
+    def _iter_pairs_up_to_weight(self, max_weight):
+        """ Iterate over all the unordered pairs of codewords with weights up to max_weight, lightest codewords first. """
+        codewords_by_weight = sorted((codeword.weight(), codeword) for codeword in self.codewords)
+        for (N, (weight_A, A)) in enumerate(codewords_by_weight):
+            if weight_A > max_weight:   break
+            for (weight_B, B) in codewords_by_weight[N+1:]:
+                if weight_B > max_weight:   break
+                yield A, B
+
+    def clonality_distance_histogram(self, count_self_conflicts=False, remove_all_zero_codeword=False, quiet=False, 
+                                     N_worst_pairs=0, pairs_per_chunk=4096, tile_size=512):
+        """ For each codeword pair A,B, find how close the clonality result A|B is to the closest other codeword C, 
+         and return a (distance_histogram, one_to_zero_histogram, zero_to_one_histogram) tuple of dictionaries 
+         giving the number of pairs for each distance value:
+          - distance is the Hamming distance from A|B to the closest C;
+          - one_to_zero is the lowest number of 1->0 changes that get from some C to A|B with no 0->1 changes, 
+             and zero_to_one is the lowest number of 0->1 changes with no 1->0 changes;
+          - None means there's no such C at all (for instance if there are only two codewords).
+        So there are no clonality conflicts with N_allowed_changes=r (or (r,0), or (0,r)) exactly if the lowest value 
+         in the matching histogram is over r, and the histograms show how many pairs would be conflicts for each r 
+         - all from one pass over the pairs, instead of running clonality_count_conflicts for each r.
+        The count_self_conflicts and remove_all_zero_codeword arguments work as in clonality_count_conflicts: 
+         C can only be A or B if count_self_conflicts is True.
+        If N_worst_pairs>0, also return a list of the N_worst_pairs pairs with the lowest distance, as 
+         (set(A,B), A|B, C, distance) tuples sorted by distance (C is a closest codeword, or None if there are none).
+        Done on the packed code in chunks of pairs_per_chunk pairs and tile_size codewords, so memory use is bounded 
+         (see iter_clonality_distances_packed); each pair is only compared to the codewords with weights close enough 
+         to its A|B weight to matter, but that can still be most of them, so it's up to O(N^3) time.
+        """
+        self._clonality_deal_with_all_zero_codeword(count_self_conflicts, remove_all_zero_codeword, quiet)
+        codeword_list, packed = self._sorted_codewords_and_packed()
+        no_codeword = self.length+1
+        histograms = [numpy.zeros(no_codeword+1, dtype=numpy.int64) for x in range(3)]
+        worst_pairs = []
+        for (I, J, distance, one_to_zero, zero_to_one, nearest) in iter_clonality_distances_packed(packed.words, 
+                                        self.length, count_self_conflicts, pairs_per_chunk, tile_size):
+            for (histogram, values) in zip(histograms, (distance, one_to_zero, zero_to_one)):
+                histogram += numpy.bincount(values, minlength=no_codeword+1)
+            if N_worst_pairs:
+                chosen = numpy.argsort(distance, kind='mergesort')[:N_worst_pairs]
+                worst_pairs = sorted(worst_pairs + zip(distance[chosen].tolist(), I[chosen].tolist(), 
+                                                       J[chosen].tolist(), nearest[chosen].tolist()))[:N_worst_pairs]
+        histogram_dicts = tuple([dict([(distance if distance<no_codeword else None, int(count)) 
+                                       for (distance, count) in enumerate(histogram) if count]) 
+                                 for histogram in histograms])
+        if not N_worst_pairs:   return histogram_dicts
+        worst_pair_details = []
+        for (distance, i, j, k) in worst_pairs:
+            A, B = codeword_list[i], codeword_list[j]
+            worst_pair_details.append((frozenset([A,B]), A|B, codeword_list[k] if k>=0 else None, 
+                                       distance if distance<no_codeword else None))
+        return histogram_dicts + (worst_pair_details,)
+
+    def clonality_max_safe_N_allowed_changes(self, count_self_conflicts=False, remove_all_zero_codeword=False, 
+                                             quiet=False, max_radius=None):
+        """ Find the highest N_allowed_changes values that give no clonality conflicts (see clonality_count_conflicts).
+        Return a (max_N_changes, safe_frontier) tuple: max_N_changes is the highest single N_allowed_changes number 
+         with no conflicts (None if even 0 gives conflicts); safe_frontier is the sorted list of all the highest 
+         (1_to_0_changes, 0_to_1_changes) tuples with no conflicts - the ones where adding a change of either kind 
+         gives a conflict (so (2,0) and (0,3) can both be on it, since neither is higher than the other).
+        Goes through the changes one radius (total number of changes) at a time, and for each radius only checks 
+         the (a,b) splits that aren't already known to give conflicts because a smaller split did - and each radius 
+         only checks the mutations with exactly that many changes, reusing the results of the smaller ones (see 
+         _Clonality_change_cell_search).  The number of mutations grows very fast with the radius, so as soon as 
+         a radius would need more of them than there are (pair, codeword) combinations (or right away for codes 
+         over 64 bits long), the rest of the conflict cells are found by comparing each pair to each codeword instead 
+         (see clonality_conflict_cells_packed), which takes the same time for any radius.
+        The search ends when all the splits of a radius give conflicts, or after max_radius (default length) - 
+         in that case tuples with max_radius total changes may be on safe_frontier just because of the limit.
+        The count_self_conflicts and remove_all_zero_codeword arguments work as in clonality_count_conflicts.
+        """
+        self._clonality_deal_with_all_zero_codeword(count_self_conflicts, remove_all_zero_codeword, quiet)
+        if max_radius is None:  max_radius = self.length
+        words = self._sorted_codewords_and_packed()[1].words
+        N = len(words)
+        if self.length<=64:     cell_search = _Clonality_change_cell_search(words, self.length, count_self_conflicts)
+        else:                   cell_search = None
+        conflict_cells = []
+        def is_safe(a, b):
+            return a+b <= max_radius and not any([a2<=a and b2<=b for (a2,b2) in conflict_cells])
+        for radius in range(max_radius+1):
+            open_cells = [(a, radius-a) for a in range(radius+1) if is_safe(a, radius-a)]
+            if not open_cells:  break
+            if cell_search is None or (sum([cell_search.N_mutations(a,b) for (a,b) in open_cells]) 
+                                       > N * N*(N-1)//2):
+                conflict_cells = clonality_conflict_cells_packed(words, self.length, count_self_conflicts, 
+                                                                 max_radius, conflict_cells)
+                break
+            for (a,b) in open_cells:
+                if cell_search.has_conflict(a, b):  conflict_cells.append((a,b))
+        if conflict_cells:  max_N_changes = min([a+b for (a,b) in conflict_cells]) - 1
+        else:               max_N_changes = max_radius
+        safe_frontier = [(a,b) for a in range(max_radius+1) for b in range(max_radius+1-a) 
+                         if is_safe(a,b) and not is_safe(a+1,b) and not is_safe(a,b+1)]
+        return (max_N_changes if max_N_changes>=0 else None), safe_frontier
 
     def clonality_obvious_no_conflict_subset(self, N_allowed_changes=(0,0), count_self_conflicts=False, 
                                          remove_all_zero_codeword=False, print_conflict_details=False, quiet=False):
         """ Really naive solution of the clonality problem: return a set of codewords with 0 conflicts, 
-         as given by clonality_count_conflicts with the same arguments (see that function's docstring for more)."""
-        conflict_count_to_codeword_set = self.clonality_count_conflicts(N_allowed_changes, count_self_conflicts, 
-                            remove_all_zero_codeword, print_conflict_details, return_conflict_details=False, quiet=quiet)
+         as given by clonality_count_conflicts with the same arguments (see that function's docstring for more).
+        The conflict graph is made too, even though it's not returned, so that it's cached (if it fits) for 
+         clonality_conflict_check and the subset-growing functions that usually come next - that way they don't 
+         have to redo the conflict search."""
+        conflict_count_to_codeword_set, _ = self.clonality_count_conflicts(N_allowed_changes, count_self_conflicts, 
+                            remove_all_zero_codeword, print_conflict_details, return_conflict_details=False, quiet=quiet, 
+                            return_conflict_graph=True)
         try:                return conflict_count_to_codeword_set[0]
         except KeyError:    return set()
 
+    def _clonality_subset_search_setup(self, N_allowed_changes, starting_subset, count_self_conflicts, 
+                                       remove_all_zero_codeword, quiet, function_name):
+        """ Get the conflict graph and check the starting subset for clonality_grow_no_conflict_subset and 
+        clonality_local_search_subset (function_name is just for error messages).  Return a (conflict_count_to_codeword_set,
+         conflict_graph, starting_subset, starting_subset_mask, starting_blocked_counts) tuple 
+         (see Clonality_conflict_graph.blocked_counts). """
+        ### First get all the detailed conflict-count info, as a compact conflict graph (see Clonality_conflict_graph)
+        conflict_count_to_codeword_set, conflict_graph = self.clonality_count_conflicts(N_allowed_changes, 
+                            count_self_conflicts, remove_all_zero_codeword, return_conflict_graph=True, quiet=quiet)
+        # conflict_count_to_codeword_set is a conflict_count:codeword_set dictionary.
+        # conflict_graph has all the (A,B,C) conflict triples (or (A,B,A) for self-conflicts) as codeword indices, 
+        #  with the triples each codeword is in - a codeword conflicts with a subset if the other members of any 
+        #  of its triples are all in the subset.
+
+        ### set the starting subset (empty unless provided); make sure it's conflict-free and part of the current code
+        starting_subset = set() if starting_subset is None else starting_subset
+        # if a code instead of a set of codewords was given as starting_subset, just take its codewords, that's fine
+        if isinstance(starting_subset, Binary_code):    starting_subset = starting_subset.codewords
+        if remove_all_zero_codeword:
+            if '0'*self.length in starting_subset:   starting_subset.remove('0'*self.length)
+        starting_subset_mask = conflict_graph.subset_mask(starting_subset)
+        starting_blocked_counts, N_starting_subset_conflicts = conflict_graph.blocked_counts(starting_subset_mask)
+        if N_starting_subset_conflicts > 0:
+            raise BinaryCodeError("starting_subset provided to %s is not conflict-free!"%function_name)
+        if not all([codeword in self for codeword in starting_subset]):
+            raise BinaryCodeError("starting_subset provided to %s is not part of the code!"%function_name)
+        return (conflict_count_to_codeword_set, conflict_graph, starting_subset, starting_subset_mask, 
+                starting_blocked_counts)
+
+    def _clonality_addition_order_groups(self, conflict_count_to_codeword_set, conflict_graph, starting_subset, 
+                                         more_random):
+        """ What order all the codewords should be attempted-added in, for clonality_grow_no_conflict_subset 
+        (ignoring codewords already in starting_subset), given as groups of conflict_graph codeword indices - 
+        the groups are tried in order, each shuffled separately. """
+        # default: based on conflict-count per codeword (lowest first), random within that
+        if not more_random:
+            return [[conflict_graph.index(c) for c in cwset if c not in starting_subset] 
+                    for ccount, cwset in sorted(conflict_count_to_codeword_set.iteritems())]
+        # if more_random: completely random without regard to conflict-count
+        else:
+            return [[conflict_graph.index(c) for c in self.iter_codewords() if c not in starting_subset]]
+
     def clonality_grow_no_conflict_subset(self, N_allowed_changes=(0,0), starting_subset=None, more_random=False, 
            N_repeats=1, return_repeat_summary=False, 
-           count_self_conflicts=False, remove_all_zero_codeword=False, quiet=False):
+           count_self_conflicts=False, remove_all_zero_codeword=False, quiet=False, seed=None, N_processes=1):
         """ Imperfect iterative partially-random codeword addition solution to the clonality problem, close to Goodman2009.
 
         First use self.clonality_count_conflicts to get the full conflict graph, using the N_allowed_changes, 
@@ -568,83 +3172,37 @@ class Binary_code:
            number of conflicts they participate in, and only random within that.
         Return the resulting no-conflict codeword set; if N_repeats>1 and return_repeat_summary is True, 
          also return a list of the lengths of all the N_repeats codeword sets found.
+        If seed is given, each repeat uses its own random generator seeded from it (see iter_seeded_repeats), 
+         so the result only depends on the seed; if N_processes>1, the repeats are run by a process pool 
+         (with a seed taken from the random module if none is given) - the results are the same for any N_processes.
         """
-        ### First get all the detailed conflict-count info
-        conflict_count_to_codeword_set, conflict_detail_tuples = self.clonality_count_conflicts(N_allowed_changes, 
-                            count_self_conflicts, remove_all_zero_codeword, return_conflict_details=True, quiet=quiet)
-        # conflict_count_to_codeword_set is a conflict_count:codeword_set dictionary.
-        # conflict_detail_tuples is a set of (set(A,B), A|B, conflicting_codeword_set, if_self, N_allowed_changes) tuples
-
-        # conflict_triples is a set of (A,B,C) frozensets - except they may just be (A,B) if self-conflicts are counted...
-        #  I could use tuples instead of frozensets here, but then we'd have the issue of (A,B,C) and (A,C,B) being 
-        #    different and counted twice, which seems pointless.
-        conflict_triples = set()
-        for (AB_set,_,C_set,_,_) in conflict_detail_tuples:
-            A,B = tuple(AB_set)
-            for C in C_set:     conflict_triples.add(frozenset([A,B,C]))
-
-        # make a codeword:set_of_conflict_pairs dictionary
-        codeword_to_conflict_pairs = defaultdict(lambda: set())
-        for triple in conflict_triples:
-            # not that this works whether the triple is in fact a triple, duple (self-conflicts), or whatever
-            for curr_codeword in triple:
-                codeword_to_conflict_pairs[curr_codeword].add(triple - frozenset([curr_codeword]))
-
-        # three ways of counting conflicts - ARE they actually the same? Probably not exactly, 
-        #  especially when we include self-conflicts and possibilities like a (A,B,C) conflict and an (A,C,B) one... 
-        #  MAYBE-TODO add some asserts using approximate relations between those numbers?
-        #total_conflicts_1 = sum([ccount*len(cwset) for (ccount,cwset) in conflict_count_to_codeword_set.iteritems()])/3
-        #total_conflicts_2 = len(conflict_triples) 
-        #total_conflicts_3 = sum([len(pairs) for pairs in codeword_to_conflict_pairs.values()])
-
-        def count_conflicts_codeword_and_set(codeword_conflict_pairs, codeword_set):
-            return len([pair for pair in codeword_conflict_pairs if pair.issubset(codeword_set)])
+        conflict_count_to_codeword_set, conflict_graph, starting_subset, starting_subset_mask, starting_blocked_counts \
+                = self._clonality_subset_search_setup(N_allowed_changes, starting_subset, count_self_conflicts, 
+                                                      remove_all_zero_codeword, quiet, 'clonality_grow_no_conflict_subset')
 
-        ### set the starting subset (empty unless provided); make sure it's conflict-free and part of the current code
-        starting_subset = set() if starting_subset is None else starting_subset
-        # if a code instead of a set of codewords was given as starting_subset, just take its codewords, that's fine
-        if isinstance(starting_subset, Binary_code):    starting_subset = starting_subset.codewords
-        if remove_all_zero_codeword:
-            if '0'*self.length in starting_subset:   starting_subset.remove('0'*self.length)
-        for codeword in starting_subset:
-            if count_conflicts_codeword_and_set(codeword_to_conflict_pairs[codeword], starting_subset) > 0:
-               raise BinaryCodeError("starting_subset provided to clonality_grow_no_conflict_subset is not conflict-free!")
-        if not all([codeword in self.codewords for codeword in starting_subset]):
-            raise BinaryCodeError("starting_subset provided to clonality_grow_no_conflict_subset is not part of the code!")
+        index_groups = self._clonality_addition_order_groups(conflict_count_to_codeword_set, conflict_graph, 
+                                                             starting_subset, more_random)
+        N_codewords_to_add = sum([len(index_group) for index_group in index_groups])
+        assert N_codewords_to_add + len(starting_subset) == self.size()
 
         ### repeat randomly generating an order and making a subset multiple times, return the best (and a trial summary)
+        # (the repeats only share read-only data, so they can be run in parallel - see _grow_no_conflict_subset_repeat)
+        repeat_state = {'index_groups': index_groups, 'starting_subset_mask': starting_subset_mask.tolist(), 
+                        'starting_blocked_counts': starting_blocked_counts.tolist(), 
+                        'codeword_other_members': conflict_graph.other_members_lists()}
         best_subset = set()
         all_subset_lengths = []
-        multiple_subsets, multiple_codeword_addition_orders, prev_codewords_addition_order = False, False, []
-        for i in range(N_repeats):
-            ### what order all the codewords should be attempted-added in: (ignore codewords already in starting_subset)
-            # default: based on conflict-count per codeword (lowest first), random within that
-            if not more_random:
-                codewords_to_add = []
-                for ccount, cwset in sorted(conflict_count_to_codeword_set.iteritems()):
-                    cwlist = [c for c in cwset if c not in starting_subset]
-                    random.shuffle(cwlist)
-                    codewords_to_add += cwlist
-            # if more_random: completely random without regard to conflict-count
-            else:
-                codewords_to_add = [c for c in self.codewords if c not in starting_subset]
-                random.shuffle(codewords_to_add)
-            assert len(codewords_to_add) + len(starting_subset) == len(self.codewords)
-
-            # go over the codewords_to_add list: if the current codeword has no conflicts with current_subset, add it, 
-            #  otherwise skip and go on to the next one.
+        multiple_subsets, multiple_codeword_addition_orders, prev_addition_order_hash = False, False, None
+        for (added_indices, addition_order_hash) in _iter_repeats(_grow_no_conflict_subset_repeat, repeat_state, 
+                                                                  N_repeats, seed, N_processes):
             # using set() here so that current_subset is a real copy of starting_subset, not two labels for one object!
             current_subset = set(starting_subset)   
-            for codeword in codewords_to_add:
-                assert codeword not in current_subset, "Error: shouldn't be adding an already present codeword!"
-                if count_conflicts_codeword_and_set(codeword_to_conflict_pairs[codeword], current_subset) == 0:
-                    current_subset.add(codeword)
+            current_subset.update([conflict_graph.codewords[index] for index in added_indices])
 
             # check if the codeword addition order and resulting subset is always the same or not
-            if not multiple_codeword_addition_orders and prev_codewords_addition_order!=[]:
-                if prev_codewords_addition_order != codewords_to_add:
-                    multiple_codeword_addition_orders = True
-            prev_codewords_addition_order = codewords_to_add
+            if prev_addition_order_hash is not None and prev_addition_order_hash != addition_order_hash:
+                multiple_codeword_addition_orders = True
+            prev_addition_order_hash = addition_order_hash
             if not multiple_subsets and best_subset!=set() and current_subset != best_subset:
                 multiple_subsets = True
 
@@ -654,20 +3212,591 @@ class Binary_code:
 
         # check that the results are sane; print warnings if there's something suspicions
         assert len(best_subset) == max(all_subset_lengths)
-        if not quiet and N_repeats>1 and (len(self.codewords)-len(starting_subset) > 1):
+        if not quiet and N_repeats>1 and (self.size()-len(starting_subset) > 1):
             if not multiple_codeword_addition_orders:
                 print("WARNING: Only 1 random order of %s elements in %s repeats - RANDOMNESS PROBABLY FAILING!"
-                      %(len(codewords_to_add), N_repeats))
+                      %(N_codewords_to_add, N_repeats))
         if not quiet and N_repeats>1 and not multiple_subsets:
             print("Warning: The same subset always found in %s repeats - something may be wrong!"%N_repeats)
 
         if return_repeat_summary:   return best_subset, all_subset_lengths
         else:                       return best_subset
 
+    def clonality_local_search_subset(self, N_allowed_changes=(0,0), starting_subset=None, time_limit=10, 
+                                      target_size=None, max_iterations=None, tabu_tenure=None, more_random=False, 
+                                      count_self_conflicts=False, remove_all_zero_codeword=False, quiet=False, 
+                                      seed=None, return_search_summary=False):
+        """ Find a big clonality-conflict-free subset by local search - usually bigger than clonality_grow_no_conflict_subset.
+
+        Start with one clonality_grow_no_conflict_subset repeat (with the same N_allowed_changes, starting_subset, 
+         more_random, count_self_conflicts and remove_all_zero_codeword arguments), then improve it by tabu search 
+         with swap moves on the conflict graph (see conflict_free_subset_local_search), keeping the best subset found.
+        The starting_subset codewords are never removed.
+        Stop after time_limit seconds (None for no limit) or max_iterations moves, or as soon as a subset of 
+         target_size codewords is found.  If seed is given, the random choices use a random.Random(seed) generator 
+         rather than the random module (the result is still only reproducible with max_iterations and no time limit).
+        Return the best no-conflict codeword set found; if return_search_summary is True, also return a list of 
+         (move_number, seconds, subset_size) tuples for the initial subset and each improvement.
+        """
+        conflict_count_to_codeword_set, conflict_graph, starting_subset, starting_subset_mask, starting_blocked_counts \
+                = self._clonality_subset_search_setup(N_allowed_changes, starting_subset, count_self_conflicts, 
+                                                      remove_all_zero_codeword, quiet, 'clonality_local_search_subset')
+        random_generator = random if seed is None else random.Random(seed)
+        ### greedy start (same as one clonality_grow_no_conflict_subset repeat)
+        repeat_state = {'index_groups': self._clonality_addition_order_groups(conflict_count_to_codeword_set, 
+                                                                   conflict_graph, starting_subset, more_random), 
+                        'starting_subset_mask': starting_subset_mask.tolist(), 
+                        'starting_blocked_counts': starting_blocked_counts.tolist(), 
+                        'codeword_other_members': conflict_graph.other_members_lists()}
+        added_indices, _ = _grow_no_conflict_subset_repeat(repeat_state, random_generator)
+        fixed_indices = numpy.flatnonzero(starting_subset_mask).tolist()
+        ### improve it by local search
+        best_indices, improvements = conflict_free_subset_local_search(conflict_graph, fixed_indices+added_indices, 
+                               fixed_indices, time_limit, target_size, max_iterations, tabu_tenure, random_generator)
+        best_subset = set(starting_subset)
+        best_subset.update([conflict_graph.codewords[index] for index in best_indices])
+        if not quiet and target_size is not None and len(best_subset) < target_size:
+            print("Warning: local search only found a conflict-free subset of %s codewords, "%len(best_subset)
+                  +"not the target %s, within the time/move limits."%target_size)
+        if return_search_summary:   return best_subset, improvements
+        else:                       return best_subset
+
+    def clonality_exact_no_conflict_subset(self, N_allowed_changes=(0,0), starting_subset=None, node_limit=None, 
+                                           time_limit=None, count_self_conflicts=False, remove_all_zero_codeword=False, 
+                                           quiet=False, N_greedy_repeats=10, local_search_moves=1000, seed=None, 
+                                           return_search_summary=False):
+        """ Find the biggest possible clonality-conflict-free subset exactly, by branch and bound - only for small codes 
+        (up to a few hundred codewords), since the search time can grow exponentially.
+
+        Uses the same conflicts as clonality_grow_no_conflict_subset (with the same N_allowed_changes, starting_subset, 
+         count_self_conflicts and remove_all_zero_codeword arguments), so the results can be compared directly; 
+         the best of N_greedy_repeats clonality_grow_no_conflict_subset repeats (with the given seed), improved by 
+         local_search_moves moves of local search (see clonality_local_search_subset), is the starting lower bound 
+         - the better it is, the more of the search can be skipped.  See conflict_free_subset_branch_and_bound.
+        If node_limit or time_limit (in seconds) are given, the search can stop early: then the result may not be 
+         optimal, and a warning with the optimality gap is printed (unless quiet is True).
+        Return the best no-conflict codeword set found; if return_search_summary is True, also return 
+         an (is_optimal, upper_bound, N_nodes) tuple, where upper_bound is the highest possible subset size.
+        """
+        conflict_count_to_codeword_set, conflict_graph, starting_subset, starting_subset_mask, starting_blocked_counts \
+                = self._clonality_subset_search_setup(N_allowed_changes, starting_subset, count_self_conflicts, 
+                                                remove_all_zero_codeword, quiet, 'clonality_exact_no_conflict_subset')
+        ### greedy lower bound (same as clonality_grow_no_conflict_subset repeats)
+        repeat_state = {'index_groups': self._clonality_addition_order_groups(conflict_count_to_codeword_set, 
+                                                                   conflict_graph, starting_subset, False), 
+                        'starting_subset_mask': starting_subset_mask.tolist(), 
+                        'starting_blocked_counts': starting_blocked_counts.tolist(), 
+                        'codeword_other_members': conflict_graph.other_members_lists()}
+        fixed_indices = numpy.flatnonzero(starting_subset_mask).tolist()
+        greedy_indices = max([added_indices for (added_indices,_) in 
+                              _iter_repeats(_grow_no_conflict_subset_repeat, repeat_state, N_greedy_repeats, seed)], key=len)
+        if local_search_moves:
+            random_generator = random if seed is None else random.Random(seed)
+            initial_indices, _ = conflict_free_subset_local_search(conflict_graph, fixed_indices+greedy_indices, 
+                                       fixed_indices, None, None, local_search_moves, None, random_generator)
+        else:
+            initial_indices = fixed_indices+greedy_indices
+        ### exact search
+        best_indices, upper_bound, N_nodes = conflict_free_subset_branch_and_bound(conflict_graph, initial_indices, 
+                                                                     fixed_indices, node_limit, time_limit)
+        best_subset = set(starting_subset)
+        best_subset.update([conflict_graph.codewords[index] for index in best_indices])
+        is_optimal = (upper_bound == len(best_subset))
+        if not quiet and not is_optimal:
+            print("Warning: branch and bound search stopped early after %s nodes - best subset found has "%N_nodes
+                  +"%s codewords, but there could be up to %s (gap %s)."%(len(best_subset), upper_bound, 
+                                                                          upper_bound-len(best_subset)))
+        if return_search_summary:   return best_subset, (is_optimal, upper_bound, N_nodes)
+        else:                       return best_subset
+
     # MAYBE-TODO implement some other options for reducing the set to one without clonality issues?
     #  * Any other sensible algorithms for doing this?  See Clonality section of ../notes_combinatorial_pooling_theory.txt - I had some new ideas...
 
 
+class Linear_binary_code(Binary_code):
+    """ A linear binary code given by a generator matrix, WITHOUT ever generating the full set of codewords.
+
+    Only keeps the generator matrix (in reduced row echelon form) and the derived parity-check matrix, 
+     plus a small set of removed codewords (removing codewords is allowed, but adding new ones isn't).
+    Answers the same questions as Binary_code, but on demand: 
+     - size() is just 2**rank minus the removed codewords; 
+     - membership ("X in code") is decided by the syndrome (X times the parity-check matrix), not a lookup; 
+     - iter_codewords and iter_codewords_by_bit_sum stream the codewords in chunks (see iterate_generator_matrix_codewords);
+     - give_N_codewords_random encodes randomly chosen messages, give_N_codewords_by_bit_sum streams the right bit-sums. 
+    This makes it practical to use with assign_codewords in robotic_plate_transfer.py even for k>=20, and the clonality 
+     functions also work on it (they stream the codeword pairs and use syndromes instead of lookups - that's still O(N^2)
+     time, but no big codeword sets or expanded-mutation dictionaries are ever made).
+    Accessing self.codewords directly still works, but it does generate the full codeword set every time - avoid it.
+    Use expand() to get a normal Binary_code with all the codewords.
+    """
+
+    def __init__(self,length,val,method='matrix',expected_count=0,chunk_bits=16):
+        """ Initialize from a generator matrix (method 'matrix') or a generator matrix file name (method 'matrixfile').
+        If expected_count is given, check that the code has that many codewords. """
+        try: 
+            self.length = int(length)
+        except (ValueError,TypeError):  
+            raise BinaryCodeError('Binary_code length argument "%s" is not an int or possible to cast to an int!'%length)
+        self.method = method
+        if method=='matrix':            self.generator_matrix = array(val)
+        elif method=='matrixfile':      self.generator_matrix = read_generator_matrix_file(val)
+        else:
+            raise BinaryCodeError("method %s passed to the Linear_binary_code initializer not recognized! "%method 
+                                  + "(allowed methods are matrix, matrixfile)")
+        if not (self.generator_matrix.ndim==2 and self.generator_matrix.shape[1]==self.length):
+            raise BinaryCodeError("Trying to use a generator matrix of shape %s "%(self.generator_matrix.shape,)
+                                  + "to generate codewords of length %s - the sizes don't match up!"%self.length)
+        self.chunk_bits = chunk_bits
+        # reduce the generator to linearly independent rows, so each message gives a different codeword
+        self._basis_rows, _ = GF2_row_reduce(generator_matrix_rows_as_ints(self.generator_matrix), self.length)
+        self.rank = len(self._basis_rows)
+        self.parity_check_rows = parity_check_rows_from_generator(self._basis_rows, self.length)
+        self._removed_values = set()
+        self._packed_cache = None
+        self._conflict_cache = OrderedDict()
+        self.conflict_cache_max_MB = DEFAULT_CONFLICT_CACHE_MAX_MB
+        self._statistics_cache_data = None
+        if expected_count and not self.size()==expected_count:
+            raise BinaryCodeError("Linear_binary_code initializer gave %s codewords, "%self.size() 
+                                  + "not %s as expected!"%expected_count)
+
+    ### basic properties and membership
+
+    def size(self):
+        """ Return the number of codewords currently in the code (2**rank minus the removed ones). """
+        return 2**self.rank - len(self._removed_values)
+
+    def _contains_value(self, value):
+        return syndrome_is_zero(value, self.parity_check_rows) and value not in self._removed_values
+
+    def _linear_code_info(self):
+        return self.parity_check_rows, self._removed_values
+
+    def _conflict_cache_key(self, N_allowed_changes, count_self_conflicts):
+        # the basis rows and removed values define the code, so there's no need to generate it all for a fingerprint
+        return (tuple(self._basis_rows), frozenset(self._removed_values), N_allowed_changes, bool(count_self_conflicts))
+
+    def _statistics_cache(self):
+        # self.codewords is made from scratch every time, so only add/remove etc can change the code
+        if self._statistics_cache_data is None:     self._statistics_cache_data = (None, {})
+        return self._statistics_cache_data[1]
+
+    def __contains__(self,val):
+        """ Return True if val (a Binary_codeword, or anything that can be made into one) is in the code, by syndrome."""
+        if not isinstance(val,Binary_codeword):
+            try:                        val = Binary_codeword(val,length=self.length,check_length=True)
+            except BinaryCodeError:     return False
+        return val.length==self.length and self._contains_value(val.value)
+
+    def _encode(self, message):
+        """ Return the codeword value for the given message (an int below 2**rank): XOR of the matching basis rows. """
+        value = 0
+        for row in self._basis_rows:
+            if message & 1:     value ^= row
+            message >>= 1
+        return value
+
+    ### changing the code: only removal is allowed
+
+    def add(self,val):
+        """ Adding arbitrary codewords would make the code non-linear - only allowed for removed codewords."""
+        codeword = Binary_codeword(val,length=self.length,check_length=True)
+        if not syndrome_is_zero(codeword.value, self.parity_check_rows):
+            raise BinaryCodeError("Can't add codeword %s to a Linear_binary_code - "%codeword
+                                  + "use expand() to get a normal Binary_code first!")
+        self._removed_values.discard(codeword.value)
+        self._codewords_changed()
+
+    def remove(self,val):
+        """ Remove Binary_code(val) codeword from the code; fail if val wasn't in the code, or is the wrong length."""
+        codeword = Binary_codeword(val,length=self.length,check_length=True)
+        if not self._contains_value(codeword.value):
+            raise BinaryCodeError("Codeword %s cannot be removed from code because it wasn't present!"%val)
+        self._removed_values.add(codeword.value)
+        self._codewords_changed()
+
+    def remove_extreme_codeword(self,bit=0):
+        """ Remove the all-zero codeword (if bit==0; default) or the all-one codeword (if bit==1) from the code.  
+        Return 1 if the codeword was present, otherwise return 0; only raise an exception if bit argument isn't 0/1. """
+        if bit not in [0,1,'0','1']:
+            raise BinaryCodeError("bit argument to remove_extreme_codeword must be 0 or 1!")
+        value = 0 if int(bit)==0 else 2**self.length-1
+        if not self._contains_value(value):     return 0
+        self._removed_values.add(value)
+        self._codewords_changed()
+        return 1
+
+    ### streaming over all the codewords
+
+    def iter_packed_chunks(self, first_chunk=0):
+        """ Yield all the codewords as packed uint64 arrays (Packed_binary_code.words format, unsorted), chunk by chunk.
+        Start at chunk first_chunk if given (see iterate_generator_matrix_codewords). """
+        basis_matrix = array([Binary_codeword(row,self.length).list() for row in self._basis_rows], dtype=int)
+        basis_matrix = basis_matrix.reshape(self.rank, self.length)
+        if self._removed_values:
+            removed_words = _pack_int_list(sorted(self._removed_values), self.length)
+        for chunk in iterate_generator_matrix_codewords(basis_matrix, chunk_bits=self.chunk_bits, first_chunk=first_chunk):
+            if self._removed_values:
+                keep = numpy.ones(len(chunk), dtype=bool)
+                for removed in removed_words:
+                    keep &= ~(chunk==removed).reshape(len(chunk),-1).all(axis=1)
+                chunk = chunk[keep]
+            yield chunk
+
+    def _iter_packed_codes(self, first_chunk=0):
+        for chunk in self.iter_packed_chunks(first_chunk):
+            yield Packed_binary_code(self.length, chunk, already_sorted=True)
+
+    def iter_codewords(self):
+        """ Iterate over all the codewords in the code, generating them on the fly (in Gray code order). """
+        for packed_chunk in self._iter_packed_codes():
+            for value in packed_chunk.values():
+                yield Binary_codeword._from_int(value, self.length)
+
+    def iter_codewords_by_bit_sum(self, low, high):
+        """ Iterate over all the codewords with bit sums in low-high range (no upper bound if high is -1). """
+        for packed_chunk in self._iter_packed_codes():
+            for codeword in packed_chunk.choose_codewords_by_bit_sum(low, high).codeword_list():
+                yield codeword
+
+    def _iter_codeword_pairs(self):
+        """ Iterate over all unordered pairs of distinct codewords, streaming (no full codeword list is ever made): 
+        each chunk of codewords is paired with itself and then with each later chunk, generated directly 
+         (without redoing the earlier ones), so only two chunks are in memory at a time. """
+        for (N, packed_chunk) in enumerate(self._iter_packed_codes()):
+            chunk_codewords = packed_chunk.codeword_list()
+            for pair in itertools.combinations(chunk_codewords, 2):
+                yield pair
+            for later_chunk in self._iter_packed_codes(first_chunk=N+1):
+                later_codewords = later_chunk.codeword_list()
+                for A in chunk_codewords:
+                    for B in later_codewords:
+                        yield A, B
+
+    def _iter_weight_pruned_codeword_pairs(self, result_weights, pairs_per_tile=2**18):
+        """ All the codeword pairs, streaming - grouping by weight would need all the codewords in memory, 
+        so only the A|B weight check is done (by the caller). """
+        return self._iter_codeword_pairs()
+
+    def _iter_pairs_up_to_weight(self, max_weight):
+        """ Same pairs as Binary_code._iter_pairs_up_to_weight, but streaming (see _iter_codeword_pairs), 
+        so not in weight order. """
+        for (A, B) in self._iter_codeword_pairs():
+            if A.weight()<=max_weight and B.weight()<=max_weight:   yield A, B
+
+    def _find_first_clonality_conflict(self, N_allowed_changes, count_self_conflicts, tile_size=512):
+        """ Same as Binary_code._find_first_clonality_conflict, but always with the streaming pair scan - 
+        the vectorized zero-change search would need all the codewords packed. """
+        return self._scan_for_first_clonality_conflict(N_allowed_changes, count_self_conflicts)
+
+    def _close_codeword_finder(self, N_allowed_changes, use_neighbor_index=False, target_weights=None):
+        """ Like Binary_code._close_codeword_finder, but instead of precomputing the mutations of all codewords, 
+        take all the mutations of the query codeword X (in the opposite direction) and keep the ones that are in the code.
+        (X is within (a 1->0, b 0->1) changes of C exactly if C is within (b 1->0, a 0->1) changes of X.) 
+        This never needs memory for more than one mutation set, so use_neighbor_index and target_weights are ignored. """
+        if isinstance(N_allowed_changes,tuple) and len(N_allowed_changes)==2:
+            reverse_changes = (N_allowed_changes[1], N_allowed_changes[0])
+        else:
+            reverse_changes = N_allowed_changes
+        def find_close_codewords(codeword):
+            candidates = list(iter_mutations(codeword, reverse_changes))
+            return set([C for (C, in_code) in zip(candidates, self.contains_many(candidates)) if in_code])
+        return find_close_codewords
+
+    @property
+    def codewords(self):
+        """ The full set of codewords - generated from scratch every time, so avoid for big codes! """
+        return set(self.iter_codewords())
+
+    def expand(self):
+        """ Return a normal Binary_code with all the codewords of this one. """
+        return Binary_code(self.length, self.iter_codewords())
+
+    def packed(self):
+        """ Return a Packed_binary_code with all the codewords (8 bytes per codeword) - cached until the code changes. """
+        if self._packed_cache is None:
+            chunks = list(self.iter_packed_chunks())
+            self._packed_cache = Packed_binary_code(self.length, numpy.concatenate(chunks))
+        return self._packed_cache
+
+    def _sorted_codewords_and_packed(self):
+        packed = self.packed()
+        return packed.codeword_list(), packed
+
+    ### summary statistics, calculated by streaming over the codewords
+
+    def find_bit_sum_counts(self):
+        """ Return the number of codewords with each possible bit-sum value (weight), as a list of (bit-sum, count) tuples.
+        Calculated chunk by chunk, without keeping all the codewords in memory. """
+        weight_histogram = numpy.zeros(self.length+1, dtype=numpy.int64)
+        for packed_chunk in self._iter_packed_codes():
+            weight_histogram += packed_chunk.weight_histogram()
+        return [(bit_sum,int(count)) for (bit_sum,count) in enumerate(weight_histogram) if count]
+
+    def total_bit_sum(self):
+        """ Return the total sum of bits in all the codewords."""
+        return sum([packed_chunk.total_bit_sum() for packed_chunk in self._iter_packed_codes()])
+
+    def bit_sums_across_digits(self):
+        """ Return a list giving the total number of codewords with a 1 at each digit, over codeword length. """
+        digit_sums = [0]*self.length
+        for packed_chunk in self._iter_packed_codes():
+            digit_sums = [x+y for (x,y) in zip(digit_sums, packed_chunk.bit_sums_across_digits())]
+        return digit_sums
+
+    def choose_codewords_by_bit_sum(self, low, high, replace_self=False):
+        """ Return the set of all codewords with bit sums in low-high range (no upper bound if high is -1).
+        replace_self isn't allowed, since a subset of a linear code isn't linear - make a Binary_code from the result. """
+        if replace_self:
+            raise BinaryCodeError("A Linear_binary_code can't be replaced by a bit-sum subset - "
+                                  + "use Binary_code(length, code.choose_codewords_by_bit_sum(low,high)) instead!")
+        return set(self.iter_codewords_by_bit_sum(low, high))
+
+    ### random codeword selection, without generating all the codewords
+
+    def give_N_codewords_random(self,N,random_generator=random):
+        """ Return a set of N randomly chosen codewords (by encoding random messages).  
+        Raise an error if N is higher than current code size. 
+        The choice is made with random_generator (the random module, or a random.Random instance). """
+        if N>self.size():
+            raise BinaryCodeError("Cannot reduce the code to %s elements, it's already only %s!"%(N,self.size()))
+        # take a few extra messages in case some of them encode removed codewords
+        messages = random_generator.sample(xrange(2**self.rank), min(2**self.rank, N+len(self._removed_values)))
+        values = [self._encode(message) for message in messages]
+        values = [value for value in values if value not in self._removed_values][:N]
+        return set([Binary_codeword._from_int(value, self.length) for value in values])
+
+    def _random_codewords_by_bit_sum(self, low, high, N):
+        """ Return a set of N codewords chosen randomly from all the codewords with bit sums in low-high range.
+        Picks N random positions among the matching codewords (counted with find_bit_sum_counts), then streams 
+         over the matching codewords and takes the ones at those positions, so only N codewords are ever kept. """
+        N_in_range = sum([count for (bit_sum,count) in self.find_bit_sum_counts() if low <= bit_sum <= high])
+        chosen_positions = sorted(random.sample(xrange(N_in_range), N))
+        chosen_codewords = set()
+        if not chosen_positions:    return chosen_codewords
+        next_position = iter(chosen_positions+[None]).next
+        position_to_take = next_position()
+        for (position, codeword) in enumerate(self.iter_codewords_by_bit_sum(low, high)):
+            if position==position_to_take:
+                chosen_codewords.add(codeword)
+                position_to_take = next_position()
+                if position_to_take is None:    break
+        return chosen_codewords
+
+    def give_N_codewords_even_distribution(self, N, N_tries, return_repeat_summary=False, seed=None, N_processes=1):
+        """ Run give_N_codewords_random N_tries times, return result with most even bit_sums_across_digits distribution.
+        If return_repeat_summary is True, also return a list containing the max-min range for each try.
+        The seed and N_processes arguments work the same way as in Binary_code.give_N_codewords_even_distribution.
+        """
+        best_subset, best_BSAD_range, all_BSAD_ranges = None, self.size(), []
+        for (BSAD_range, curr_subset) in _iter_repeats(_even_distribution_repeat, (self, N), N_tries, seed, N_processes):
+            if BSAD_range < best_BSAD_range or best_subset is None:
+                best_subset = curr_subset
+                best_BSAD_range = BSAD_range
+            all_BSAD_ranges.append(BSAD_range)
+        best_codewords = best_subset.codewords() if best_subset is not None else None
+        if return_repeat_summary:     return best_codewords, all_BSAD_ranges
+        else:                         return best_codewords
+
+    def __str__(self):      return "<Linear_binary_code instance of length %s and size %s>"%(self.length,self.size())
+    def __repr__(self):     return "<Linear_binary_code instance of length %s and size %s>"%(self.length,self.size())
+
+    def enable_conflict_tracking(self, N_allowed_changes=(0,0), count_self_conflicts=False):
+        """ Not supported: incremental tracking needs the full codeword set - use expand() to get a normal code. """
+        raise BinaryCodeError("Conflict tracking isn't supported for Linear_binary_code - use expand() first.")
+
+
+######### Incremental clonality conflict tracking
+
+class Clonality_conflict_tracker(object):
+    """ Keeps the clonality conflicts of a Binary_code up to date as codewords are added and removed.
+
+    Made with Binary_code.enable_conflict_tracking; the conflict rules are the same as in 
+     Binary_code.clonality_count_conflicts with the given N_allowed_changes and count_self_conflicts.
+    Stores each conflicting pair {A,B} with the set of codewords close to A|B (found by expanding A|B by mutations 
+     in the reverse direction and checking which results are codewords, so there's no precomputed mutation pool 
+     to update), and a codeword:pairs dictionary, so that:
+     - adding Z only requires checking the new pairs (Z,B), and the existing pairs whose A|B could be close to Z 
+        (both A and B can only have a few bits that Z doesn't have, which is a quick check - but for Z with most bits 
+        set that can be most codewords, and their pairs are all checked, see _pairs_close_to);
+     - removing Y only requires going over the conflicts that Y is part of.
+    Also provides "what if" queries (conflicts_if_added, conflicts_if_removed) that don't change anything.
+    If the code's codeword set is replaced or changed directly (not by add/remove), everything is recalculated 
+     on the next query.
+    """
+
+    def __init__(self, binary_code, N_allowed_changes=(0,0), count_self_conflicts=False):
+        _check_N_permitted_changes(N_allowed_changes)
+        self.code = binary_code
+        self.N_allowed_changes = N_allowed_changes
+        self.count_self_conflicts = count_self_conflicts
+        # X is within (a 1->0, b 0->1) changes of C exactly if C is within (b 1->0, a 0->1) changes of X; 
+        #  and then X has at most b bits that aren't in C (or r bits, for a single N_allowed_changes value r)
+        if isinstance(N_allowed_changes,int):
+            self._reverse_changes = N_allowed_changes
+            self._max_extra_bits = N_allowed_changes
+        else:
+            self._reverse_changes = (N_allowed_changes[1], N_allowed_changes[0])
+            self._max_extra_bits = N_allowed_changes[1]
+        self.recalculate()
+
+    def recalculate(self):
+        """ Recalculate all the conflicts from scratch (using Binary_code.clonality_count_conflicts). """
+        self._codeword_set = self.code.codewords
+        self._codeword_set_version = self._codeword_set.version
+        self._pair_to_close_codewords = {}
+        self._codeword_to_pairs = defaultdict(set)
+        self._conflict_counts = dict((codeword,0) for codeword in self._codeword_set)
+        _, conflict_details = self.code.clonality_count_conflicts(self.N_allowed_changes, self.count_self_conflicts, 
+                                                                  return_conflict_details=True, quiet=True)
+        for (pair, clonality_result, _, _, _) in conflict_details:
+            self._add_pair(pair, self._close_codewords(clonality_result))
+
+    def _check_current(self):
+        if not self.code._is_current((self._codeword_set, self._codeword_set_version)):
+            self.recalculate()
+
+    def _check_single_change(self):
+        """ Return True if the code was changed only by the one add/remove that's being handled; 
+        otherwise recalculate everything and return False. """
+        if self.code._is_current((self._codeword_set, self._codeword_set_version+1)):
+            self._codeword_set_version += 1
+            return True
+        self.recalculate()
+        return False
+
+    ### internal bookkeeping
+
+    def _close_codewords(self, clonality_result, extra_codeword=None):
+        """ Return the set of codewords (plus extra_codeword, if given) that clonality_result is too close to. """
+        return set([C for C in iter_mutations(clonality_result, self._reverse_changes) 
+                    if C in self._codeword_set or C==extra_codeword])
+
+    def _conflict_codewords(self, pair, close_codewords):
+        """ Return (codewords to count, conflict codeword set, 'self'/'') for the pair, or None if it's not a conflict."""
+        other_codewords = close_codewords - pair
+        if other_codewords:
+            return close_codewords | pair, other_codewords, ''
+        elif close_codewords and self.count_self_conflicts:
+            return pair, close_codewords & pair, 'self'
+        return None
+
+    def _add_pair(self, pair, close_codewords):
+        conflict = self._conflict_codewords(pair, close_codewords)
+        if conflict is None:    return
+        self._pair_to_close_codewords[pair] = close_codewords
+        for codeword in conflict[0]:
+            self._conflict_counts[codeword] += 1
+            self._codeword_to_pairs[codeword].add(pair)
+
+    def _drop_pair(self, pair):
+        close_codewords = self._pair_to_close_codewords.pop(pair, None)
+        if close_codewords is None:     return None
+        for codeword in self._conflict_codewords(pair, close_codewords)[0]:
+            self._conflict_counts[codeword] -= 1
+            self._codeword_to_pairs[codeword].discard(pair)
+        return close_codewords
+
+    def _pairs_close_to(self, codeword, codeword_set, pairs_per_chunk=2**16):
+        """ Iterate over the pairs of codewords from codeword_set (not including codeword) with A|B close to codeword. 
+        Only the K codewords with at most _max_extra_bits bits that codeword doesn't have can be in such a pair, 
+         and only their pairs are checked, in vectorized chunks of pairs_per_chunk pairs on the packed values. 
+        So this is O(N) for finding the candidates plus O(K^2) for the pairs (but fast, about 0.1s per 10 million pairs): 
+         K is only a small part of N for most codewords, but for ones with most bits set (like the all-ones codeword) 
+         it can be almost all of N, and then the pair check dominates from a few thousand codewords on. """
+        candidates = [C for C in codeword_set if C != codeword 
+                      and bin(C.value & ~codeword.value).count('1') <= self._max_extra_bits]
+        if len(candidates)<2:   return
+        length = self.code.length
+        words = _pack_int_list([C.value for C in candidates], length).reshape(len(candidates), -1)
+        codeword_words = _pack_int_list([codeword.value], length).reshape(1, -1)
+        for (row_start, row_end) in _pair_row_blocks(len(candidates), pairs_per_chunk):
+            I, J = _pair_indices(len(candidates), row_start, row_end)
+            results = words[I] | words[J]
+            if isinstance(self.N_allowed_changes,int):
+                close = _popcount_uint64(results ^ codeword_words).sum(axis=1) <= self.N_allowed_changes
+            else:
+                (N_1_to_0, N_0_to_1) = self.N_allowed_changes
+                close = ((_popcount_uint64(codeword_words & ~results).sum(axis=1) <= N_1_to_0) 
+                         & (_popcount_uint64(results & ~codeword_words).sum(axis=1) <= N_0_to_1))
+            for (i,j) in zip(I[close].tolist(), J[close].tolist()):
+                yield frozenset([candidates[i], candidates[j]])
+
+    def _codeword_added(self, codeword):
+        """ Update the conflicts after codeword was added to the code (called by Binary_code.add). """
+        if not self._check_single_change():     return
+        self._conflict_counts[codeword] = 0
+        for B in self._codeword_set:
+            if B != codeword:
+                pair = frozenset([codeword,B])
+                self._add_pair(pair, self._close_codewords(codeword|B))
+        for pair in self._pairs_close_to(codeword, self._codeword_set):
+            self._drop_pair(pair)
+            A,B = pair
+            self._add_pair(pair, self._close_codewords(A|B))
+
+    def _codeword_removed(self, codeword):
+        """ Update the conflicts after codeword was removed from the code (called by Binary_code.remove etc). """
+        if not self._check_single_change():     return
+        for pair in list(self._codeword_to_pairs.get(codeword, ())):
+            close_codewords = self._drop_pair(pair)
+            if codeword not in pair:
+                self._add_pair(pair, close_codewords - set([codeword]))
+        del self._conflict_counts[codeword]
+        self._codeword_to_pairs.pop(codeword, None)
+
+    def _conflict_details(self, pair, close_codewords):
+        conflict = self._conflict_codewords(pair, close_codewords)
+        if conflict is None:    return None
+        A,B = pair
+        return (pair, A|B, frozenset(conflict[1]), conflict[2], self.N_allowed_changes)
+
+    ### queries
+
+    def conflict_counts(self):
+        """ Return the same conflict_count:codeword_set dictionary as Binary_code.clonality_count_conflicts. """
+        self._check_current()
+        return invert_dict_tolists(self._conflict_counts)
+
+    def conflict_details(self):
+        """ Return the same conflict details set as Binary_code.clonality_count_conflicts(return_conflict_details=True)."""
+        self._check_current()
+        return set([self._conflict_details(pair, close_codewords) 
+                    for (pair, close_codewords) in self._pair_to_close_codewords.iteritems()])
+
+    def has_conflicts(self):
+        """ Return True if the code currently has any clonality conflicts, False otherwise. """
+        self._check_current()
+        return bool(self._pair_to_close_codewords)
+
+    def conflicts_involving(self, val):
+        """ Return the set of conflict details tuples for all the current conflicts that involve the codeword. """
+        self._check_current()
+        codeword = Binary_codeword(val, length=self.code.length, check_length=True)
+        return set([self._conflict_details(pair, self._pair_to_close_codewords[pair]) 
+                    for pair in self._codeword_to_pairs.get(codeword, ())])
+
+    def conflicts_if_removed(self, val):
+        """ Return the set of conflict details tuples that would be removed or changed if the codeword was removed. """
+        return self.conflicts_involving(val)
+
+    def conflicts_if_added(self, val):
+        """ Return the set of conflict details tuples involving the codeword that there would be if it was added 
+        (i.e. the new or changed conflicts), without changing the code.  Empty if adding it wouldn't make any conflicts."""
+        self._check_current()
+        codeword = Binary_codeword(val, length=self.code.length, check_length=True)
+        if codeword in self._codeword_set:  return self.conflicts_involving(codeword)
+        new_conflicts = set()
+        for B in self._codeword_set:
+            pair = frozenset([codeword,B])
+            new_conflicts.add(self._conflict_details(pair, self._close_codewords(codeword|B, codeword)))
+        for pair in self._pairs_close_to(codeword, self._codeword_set):
+            A,B = pair
+            new_conflicts.add(self._conflict_details(pair, self._close_codewords(A|B, codeword)))
+        new_conflicts.discard(None)
+        return new_conflicts
+
+
 class Testing__Binary_codeword(unittest.TestCase):
     """ Testing Binary_codeword functionality. """
 
@@ -720,6 +3849,28 @@ class Testing__Binary_codeword(unittest.TestCase):
     def test__list_string_representations(self):
         self.assertEqual(Binary_codeword('111').string(), '111')
         self.assertEqual(Binary_codeword('111').list(), [1,1,1])
+        self.assertEqual(Binary_codeword('0010').list(), [0,0,1,0])
+        self.assertEqual(Binary_codeword(0,4).string(), '0000')
+        self.assertEqual(Binary_codeword('').string(), '')
+
+    def test__hashing_and_immutable_representation(self):
+        """ Equal codewords should hash the same (in sets/dicts), length matters, and no per-instance __dict__ exists."""
+        self.assertEqual(len(set([Binary_codeword('011'), Binary_codeword(3,3), Binary_codeword([0,1,1])])), 1)
+        self.assertEqual(len(set([Binary_codeword('011'), Binary_codeword('11')])), 2)
+        self.assertEqual(hash(Binary_codeword('110')|Binary_codeword('011')), hash(Binary_codeword('111')))
+        self.assertRaises(AttributeError, setattr, Binary_codeword('111'), 'something', 1)
+        self.assertFalse(Binary_codeword('111') == '111')
+        # the bitwise operators return new objects and leave the originals alone
+        A, B = Binary_codeword('110'), Binary_codeword('011')
+        A|B, A&B, A^B, ~A
+        self.assertEqual((A.string(),B.string()), ('110','011'))
+        # pickling (needed for multiprocessing etc) works even without a __dict__
+        import pickle
+        self.assertEqual(pickle.loads(pickle.dumps(Binary_codeword('0101'))), Binary_codeword('0101'))
+        self.assertEqual(pickle.loads(pickle.dumps(Binary_codeword('0101'),2)).string(), '0101')
+        # bad values raise errors
+        self.assertRaises(BinaryCodeError, Binary_codeword, '1021')
+        self.assertRaises(BinaryCodeError, Binary_codeword, -1)
 
 
 class Testing__other_functions(unittest.TestCase):
@@ -797,6 +3948,35 @@ class Testing__other_functions(unittest.TestCase):
                     result_to_base_dict = invert_listdict_tolists(all_result_dict)
                     assert expand_by_all_mutations_dict(test_codewords, N_changes) == result_to_base_dict
 
+    def test__mutation_masks_match_position_combinations(self):
+        def reference_expansion(codeword, N_changes):
+            """ The old expand_by_all_mutations implementation, based on _change_all_position_combinations. """
+            val = codeword.list()
+            if isinstance(N_changes,int):
+                return set([Binary_codeword(x) for x in _change_all_position_combinations(val,N_changes)])
+            results = set()
+            list_of_1_positions = [x for x in range(len(val)) if val[x]==1]
+            for new_val in _change_all_position_combinations(val,N_changes[0],list_of_1_positions):
+                list_of_0_positions = [x for x in range(len(new_val)) if new_val[x]==0]
+                results.update([Binary_codeword(x) for x in 
+                                _change_all_position_combinations(new_val,N_changes[1],list_of_0_positions)])
+            return results
+        for length in [1,2,5,12,64,70]:
+            test_codewords = [Binary_codeword(0,length), Binary_codeword(2**length-1,length)]
+            test_codewords += [Binary_codeword(random.getrandbits(length),length) for i in range(3)]
+            for N_changes in [0,1,2,(0,0),(1,0),(0,2),(2,1)]:
+                for codeword in test_codewords:
+                    mutations = list(iter_mutations(codeword, N_changes))
+                    assert len(mutations) == len(set(mutations))
+                    assert set(mutations) == reference_expansion(codeword, N_changes)
+        # the mask tables are cached, and the cache size is limited
+        assert flip_mask_table(10,2) is flip_mask_table(10,2)
+        assert len(flip_mask_table(10,2)[0]) == 1 + 10 + 45
+        for radius in range(_FLIP_MASK_TABLE_CACHE_SIZE+2):
+            flip_mask_table(3, radius)
+        assert len(_FLIP_MASK_TABLE_CACHE) == _FLIP_MASK_TABLE_CACHE_SIZE
+        self.assertRaises(ValueError, list, iter_mutations(Binary_codeword('01'), (1,1,1)))
+
 
 class Testing__Binary_code__most_functions(unittest.TestCase):
     """ Testing Binary_code functionality, except for clonality-conflict functions, which have their own test suite."""
@@ -1110,11 +4290,395 @@ class Testing__Binary_code__most_functions(unittest.TestCase):
         self.assertRaises(IndexError, B.add_mirrored_bits, [-4])
 
 
+class Testing__Packed_binary_code(unittest.TestCase):
+    """ Testing the packed numpy version of the code, mostly by comparing it to the normal Binary_code results. """
+
+    def test__round_trip_and_basic_properties(self):
+        for length in [1,3,64,65,130]:
+            values = set([0, 1, 2**length-1] + [random.getrandbits(length) for i in range(20)])
+            codewords = set([Binary_codeword(v,length) for v in values])
+            B = Binary_code(length, codewords)
+            P = Packed_binary_code.from_codewords(length, codewords)
+            assert P == B.packed()
+            assert P.size() == B.size() == len(values)
+            assert P.values() == sorted(values)
+            assert P.codewords() == codewords
+            assert P.to_binary_code() == B
+            assert P.codeword_list() == sorted(codewords)
+            # duplicates get merged, order doesn't matter
+            assert Packed_binary_code.from_codewords(length, list(codewords)*2) == P
+        P = Packed_binary_code(3, [])
+        assert P.size() == 0 and P.find_bit_sum_counts() == [] and P.bit_sums_across_digits() == [0,0,0]
+        # values that don't fit in the length aren't allowed
+        self.assertRaises(BinaryCodeError, Packed_binary_code, 3, [8])
+        self.assertRaises(BinaryCodeError, Packed_binary_code.from_codewords, 3, ['0000'])
+
+    def test__summary_methods_match_Binary_code(self):
+        for length in [2,5,20,70]:
+            codewords = set([Binary_codeword(random.getrandbits(length),length) for i in range(50)])
+            B = Binary_code(length, codewords)
+            P = B.packed()
+            assert P.find_bit_sum_counts() == sorted(Counter([c.weight() for c in codewords]).items())
+            assert P.total_bit_sum() == sum([c.weight() for c in codewords])
+            assert P.bit_sums_across_digits() == [sum([c.list()[d] for c in codewords]) for d in range(length)]
+            assert list(P.weights()) == [c.weight() for c in sorted(codewords)]
+            for low,high in [(0,-1), (0,length), (2,4), (length/2,-1), (4,2)]:
+                expected = set([c for c in codewords if c.weight()>=low and (high==-1 or c.weight()<=high)])
+                assert P.choose_codewords_by_bit_sum(low,high).codewords() == expected
+                assert B.choose_codewords_by_bit_sum(low,high) == expected
+            for N in [0,1,len(codewords)/2,len(codewords)]:
+                subset = P.give_N_codewords_random(N)
+                assert subset.size() == N and subset.codewords().issubset(codewords)
+            self.assertRaises(BinaryCodeError, P.give_N_codewords_random, len(codewords)+1)
+
+    def test__Hamming_distance_range(self):
+        for length in [2,5,20,64,70,130]:
+            for N in [1,2,7,50]:
+                codewords = set([Binary_codeword(random.getrandbits(length),length) for i in range(N)])
+                distances = [Hamming_distance(x,y) for (x,y) in itertools.combinations(codewords,2)]
+                expected = (min(distances), max(distances)) if distances else (length+1, 0)
+                B = Binary_code(length, codewords)
+                for tile_size in [1,3,512]:
+                    assert B.find_Hamming_distance_range(tile_size=tile_size) == expected
+                    # with a threshold, stop early if the lowest distance is at or below it
+                    for low_threshold in [0, expected[0]-1, expected[0], length]:
+                        low, high = B.find_Hamming_distance_range(low_threshold, tile_size)
+                        if distances and expected[0] <= low_threshold:  assert low <= low_threshold and high is None
+                        else:                                           assert (low, high) == expected
+        assert Binary_code(5).find_Hamming_distance_range() == (None,None)
+        # for linear codes, the range is just the nonzero weight range, unless some codewords were removed
+        for (k,n) in [(3,6),(4,9),(3,70)]:
+            generator_matrix = [[random.getrandbits(1) for i in range(n)] for j in range(k)]
+            for code in [Binary_code(n, generator_matrix, method='matrix'), Linear_binary_code(n, generator_matrix)]:
+                if code.size()<2:   continue
+                expected = Binary_code(n, code.codewords).find_Hamming_distance_range()
+                assert code._linear_code_info() is not None
+                assert code.find_Hamming_distance_range() == expected
+                assert code.find_Hamming_distance_range(expected[0]) == (expected[0], None)
+                code.remove(max(code.codewords))
+                assert code.find_Hamming_distance_range() == Binary_code(n, code.codewords).find_Hamming_distance_range()
+
+    def test__Hamming_distance_histogram(self):
+        for length in [5,64,70]:
+            for N in [1,2,40]:
+                codewords = set([Binary_codeword(random.getrandbits(length),length) for i in range(N)])
+                distance_counts = Counter([Hamming_distance(x,y) for (x,y) in itertools.combinations(codewords,2)])
+                expected = [distance_counts[d] for d in range(length+1)]
+                B = Binary_code(length, codewords)
+                for tile_size in [1,7,512]:
+                    assert B.packed().Hamming_distance_histogram(tile_size) == expected
+                assert B.Hamming_distance_histogram() == expected
+                # the cached histogram is used for the distance range too, and is dropped when the code changes
+                assert B.find_Hamming_distance_range() == Binary_code(length, codewords).find_Hamming_distance_range()
+                B.add(Binary_codeword(0,length))
+                assert B.Hamming_distance_histogram() == Binary_code(length, B.codewords).packed().Hamming_distance_histogram()
+
+    def test__packed_cache_follows_code_changes(self):
+        B = Binary_code(3,['110','101'])
+        assert B.total_bit_sum() == 4
+        B.add('111')
+        assert B.total_bit_sum() == 7
+        B.remove('110')
+        assert B.bit_sums_across_digits() == [2,1,2]
+        B.choose_codewords_by_bit_sum(3,3,replace_self=True)
+        assert B.find_bit_sum_counts() == [(3,1)]
+        # replacing the codeword set directly works too
+        B.codewords = set([Binary_codeword('000')])
+        assert B.find_bit_sum_counts() == [(0,1)]
+        # and so does changing it in place, even if the size stays the same
+        assert B.Hamming_distance_histogram() == [0,0,0,0]
+        B.codewords.add(Binary_codeword('011'))
+        B.codewords.remove(Binary_codeword('000'))
+        assert B.find_bit_sum_counts() == [(2,1)]
+        B.codewords |= set([Binary_codeword('111')])
+        assert B.find_bit_sum_counts() == [(2,1),(3,1)]
+        assert B.Hamming_distance_histogram() == [0,1,0,0]
+        # linear code information (used by contains_many) is dropped after in-place changes, but kept after add/remove
+        L = Binary_code(4, [[1,0,1,1],[0,1,0,1]], method='matrix')
+        L.remove('1011')
+        assert L._linear_code_info() is not None
+        L.add('1011')
+        assert L._linear_code_info() is not None
+        L.codewords.remove(Binary_codeword('1011'))
+        L.codewords.add(Binary_codeword('1111'))
+        assert L._linear_code_info() is None
+        assert list(L.contains_many(['1011','1111'])) == [False,True]
+
+    def test__binary_file_format(self):
+        import tempfile, shutil
+        tmpdir = tempfile.mkdtemp()
+        try:
+            binfile, listfile, matrixfile = [os.path.join(tmpdir,x) for x in ('code.bin', 'code.txt', 'matrix.txt')]
+            for length in [1,5,64,65,130]:
+                for N in [0,1,30]:
+                    B = Binary_code(length, set([random.getrandbits(length) for i in range(N)]))
+                    B.write_code_to_binary_file(binfile)
+                    for use_memmap in [True,False]:
+                        assert read_packed_code_file(binfile, use_memmap=use_memmap) == B.packed()
+                    assert Binary_code(length, binfile, method='binaryfile') == B
+                    self.assertRaises(BinaryCodeError, Binary_code, length+1, binfile, method='binaryfile')
+                    # the text list file is now sorted, and conversions work both ways
+                    B.write_code_to_file(listfile)
+                    assert [line.strip() for line in open(listfile)] == sorted(c.string() for c in B.codewords)
+                    convert_code_file(listfile, binfile, 'listfile', 'binaryfile', length=length)
+                    assert Binary_code(length, binfile, method='binaryfile') == B
+                    convert_code_file(binfile, listfile, 'binaryfile', 'listfile')
+                    assert Binary_code(length, listfile, method='listfile') == B
+            # converting from a generator matrix file
+            generator_matrix = array([[1,0,0,1,1],[0,1,0,1,0],[0,0,1,0,1]])
+            open(matrixfile,'w').write(''.join(''.join(str(x) for x in row)+'\n' for row in generator_matrix))
+            convert_code_file(matrixfile, binfile, 'matrixfile')
+            assert Binary_code(5, binfile, method='binaryfile') == Binary_code(5, generator_matrix, method='matrix')
+            # damaged or wrong files give errors
+            data = open(binfile,'rb').read()
+            open(binfile,'wb').write(data[:-1])
+            self.assertRaises(BinaryCodeError, read_packed_code_file, binfile)
+            open(binfile,'wb').write(data[:32] + chr(ord(data[32])^1) + data[33:])
+            self.assertRaises(BinaryCodeError, read_packed_code_file, binfile)
+            read_packed_code_file(binfile, verify_checksum=False)
+            self.assertRaises(BinaryCodeError, read_packed_code_file, matrixfile)
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class Testing__generator_matrix_expansion(unittest.TestCase):
+    """ Testing the Gray code generator matrix expansion against plain matrix multiplication of all messages. """
+
+    def _codewords_by_multiplication(self, generator_matrix):
+        k = generator_matrix.shape[0]
+        return set([Binary_codeword(dot(Binary_codeword(x,length=k).list(),generator_matrix)%2) for x in range(2**k)])
+
+    def test__Gray_code_order(self):
+        # with an identity generator matrix the codewords are the messages, so they should be a Gray code sequence
+        values = []
+        for chunk in iterate_generator_matrix_codewords(numpy.identity(5,dtype=int), chunk_bits=2):
+            values.extend([int(x) for x in chunk])
+        assert sorted(values) == range(32)
+        for x,y in zip(values, values[1:]):
+            assert bin(x^y).count('1') == 1
+
+    def test__matches_matrix_multiplication(self):
+        for (k,n) in [(1,1),(1,3),(3,3),(4,7),(7,11),(5,70),(3,130)]:
+            for i in range(3):
+                generator_matrix = array([[random.randint(0,1) for x in range(n)] for y in range(k)])
+                expected = self._codewords_by_multiplication(generator_matrix)
+                for chunk_bits in [1,2,16]:
+                    packed = expand_generator_matrix_codewords(generator_matrix, chunk_bits=chunk_bits)
+                    assert packed.codewords() == expected
+                    chunks = list(iterate_generator_matrix_codewords(generator_matrix, chunk_bits=chunk_bits))
+                    assert sum([len(chunk) for chunk in chunks]) == 2**k
+                    assert Packed_binary_code(n, numpy.concatenate(chunks)) == packed
+                    # starting at a later chunk gives the same chunks as skipping the earlier ones
+                    for first_chunk in [1, len(chunks)-1]:
+                        later_chunks = iterate_generator_matrix_codewords(generator_matrix, chunk_bits, first_chunk)
+                        assert [c.tolist() for c in later_chunks] == [c.tolist() for c in chunks[first_chunk:]]
+                assert Binary_code(n, generator_matrix, method='matrix').codewords == expected
+        # linearly dependent rows just give fewer distinct codewords
+        generator_matrix = array([[1,1,0],[0,1,1],[1,0,1]])
+        assert expand_generator_matrix_codewords(generator_matrix).codewords() == \
+                self._codewords_by_multiplication(generator_matrix)
+        assert expand_generator_matrix_codewords(generator_matrix).size() == 4
+
+    def test__parallel_expansion(self):
+        generator_matrix = array([[random.randint(0,1) for x in range(12)] for y in range(8)])
+        serial = expand_generator_matrix_codewords(generator_matrix, chunk_bits=3)
+        for N_processes in [2,3]:
+            assert expand_generator_matrix_codewords(generator_matrix, chunk_bits=3, N_processes=N_processes) == serial
+
+
+class Testing__Linear_binary_code(unittest.TestCase):
+    """ Testing the lazy Linear_binary_code by comparing it to a fully generated Binary_code from the same matrix. """
+
+    def _random_generator_matrix(self, k, n, full_rank=False):
+        if not full_rank:   return array([[random.randint(0,1) for x in range(n)] for y in range(k)])
+        # identity on the first k columns guarantees full rank; add an extra row that's the sum of the first two
+        rows = [[int(x==y) for x in range(k)] + [random.randint(0,1) for x in range(n-k)] for y in range(k)]
+        return array(rows + [[(a+b)%2 for (a,b) in zip(rows[0],rows[-1])]])
+
+    def test__parity_check_rows(self):
+        for (k,n) in [(1,1),(2,5),(4,7),(6,10),(3,70)]:
+            generator_matrix = self._random_generator_matrix(k,n)
+            codeword_values = set(expand_generator_matrix_codewords(generator_matrix).values())
+            parity_check_rows = parity_check_rows_from_generator(generator_matrix_rows_as_ints(generator_matrix), n)
+            rank = len(GF2_row_reduce(generator_matrix_rows_as_ints(generator_matrix), n)[0])
+            assert len(codeword_values) == 2**rank and len(parity_check_rows) == n - rank
+            test_values = range(2**n) if n<=10 else list(codeword_values)+[random.getrandbits(n) for i in range(100)]
+            for value in test_values:
+                assert syndrome_is_zero(value, parity_check_rows) == (value in codeword_values)
+
+    def test__basic_properties_match_Binary_code(self):
+        for (k,n) in [(1,3),(3,3),(4,7),(5,9),(4,66)]:
+            generator_matrix = self._random_generator_matrix(k,n,full_rank=True)
+            B = Binary_code(n, generator_matrix, method='matrix')
+            L = Linear_binary_code(n, generator_matrix, method='matrix', chunk_bits=2)
+            assert L.size() == B.size()
+            assert set(L.iter_codewords()) == B.codewords and L.expand() == B
+            assert L.find_bit_sum_counts() == B.find_bit_sum_counts()
+            assert L.total_bit_sum() == B.total_bit_sum()
+            assert L.bit_sums_across_digits() == B.bit_sums_across_digits()
+            assert L.packed() == B.packed()
+            # all the pairs, each once (the chunk pairs are streamed rather than taken from a full codeword list)
+            pairs = [frozenset(pair) for pair in L._iter_codeword_pairs()]
+            assert len(pairs) == len(set(pairs)) == B.size()*(B.size()-1)/2
+            assert set(pairs) == set(frozenset(pair) for pair in B._iter_codeword_pairs())
+            for codeword in B.codewords:     assert codeword in L
+            if n<=9:
+                for value in range(2**n):   assert (Binary_codeword(value,n) in L) == (Binary_codeword(value,n) in B)
+            for (low,high) in [(0,-1),(1,3),(2,2)]:
+                assert L.choose_codewords_by_bit_sum(low,high) == B.choose_codewords_by_bit_sum(low,high)
+            # random selections should have the right size and come from the code
+            for N in [0,1,B.size()/2,B.size()]:
+                assert len(L.give_N_codewords_random(N)) == N and L.give_N_codewords_random(N).issubset(B.codewords)
+                for take_high in [False,True]:
+                    chosen = L.give_N_codewords_by_bit_sum(N,take_high)
+                    assert len(chosen) == N and chosen.issubset(B.codewords)
+            self.assertRaises(BinaryCodeError, L.give_N_codewords_random, B.size()+1)
+            # removing the all-zero codeword (always there in a linear code) and one other codeword
+            assert L.remove_extreme_codeword(bit=0) == 1 and L.remove_extreme_codeword(bit=0) == 0
+            B.remove_extreme_codeword(bit=0)
+            other_codeword = max(B.codewords)
+            L.remove(other_codeword)
+            B.remove(other_codeword)
+            assert L.size() == B.size() and set(L.iter_codewords()) == B.codewords
+            assert other_codeword not in L and Binary_codeword(0,n) not in L
+            assert L.find_bit_sum_counts() == B.find_bit_sum_counts()
+            assert len(L.give_N_codewords_random(B.size())) == B.size()
+            self.assertRaises(BinaryCodeError, L.remove, other_codeword)
+            self.assertRaises(BinaryCodeError, L.choose_codewords_by_bit_sum, 0, -1, replace_self=True)
+
+    def test__weight_enumerator_and_distance_histogram(self):
+        # MacWilliams: the transform of the transform gives back the original enumerator
+        assert MacWilliams_transform([1,0,0,1], 3) == [1,0,3,0]
+        assert MacWilliams_transform([1,0,3,0], 3) == [1,0,0,1]
+        for (k,n) in [(1,3),(3,3),(4,7),(6,9),(2,9),(60,66)]:
+            generator_matrix = self._random_generator_matrix(k,n,full_rank=True)
+            L = Linear_binary_code(n, generator_matrix, method='matrix', chunk_bits=4)
+            if k<=10:
+                B = Binary_code(n, generator_matrix, method='matrix')
+                expected_weights = [dict(B.find_bit_sum_counts()).get(w,0) for w in range(n+1)]
+                expected_distances = B.packed().Hamming_distance_histogram()
+                assert B.weight_enumerator() == expected_weights
+                assert B.Hamming_distance_histogram() == expected_distances
+                assert L.weight_enumerator() == expected_weights
+                assert L.Hamming_distance_histogram() == expected_distances
+                assert L.find_Hamming_distance_range() == B.packed().find_Hamming_distance_range()
+            # for k>n-k, the enumerator is calculated from the dual code
+            assert sum(L.weight_enumerator()) == L.size() and L.weight_enumerator()[0] == 1
+            assert sum(L.Hamming_distance_histogram()) == L.size()*(L.size()-1)//2
+            if 2*k<n:   assert MacWilliams_transform(L.weight_enumerator(), n) \
+                                == span_weight_histogram(L.parity_check_rows, n)
+            # after removing a codeword the code isn't linear, so it's done the normal way
+            if k<=10:
+                L.remove(max(L.iter_codewords()))
+                B = L.expand()
+                assert L.weight_enumerator() == [dict(B.find_bit_sum_counts()).get(w,0) for w in range(n+1)]
+                assert L.Hamming_distance_histogram() == B.packed().Hamming_distance_histogram()
+
+    def test__syndrome_membership_in_Binary_code(self):
+        for (k,n) in [(1,3),(4,7),(5,9),(3,70),(2,130)]:
+            generator_matrix = self._random_generator_matrix(k,n,full_rank=True)
+            B = Binary_code(n, generator_matrix, method='matrix')
+            B_list = Binary_code(n, B.codewords)
+            H = B.parity_check_matrix()
+            assert H.shape == (n-k, n)
+            assert not (dot(H, generator_matrix.T) % 2).any()
+            self.assertRaises(BinaryCodeError, B_list.parity_check_matrix)
+            test_codewords = list(B.codewords) + [Binary_codeword(random.getrandbits(n),n) for i in range(100)]
+            test_codewords += [Binary_codeword(0,n+1), Binary_codeword(1,1)]
+            assert B.contains_many(test_codewords) == B_list.contains_many(test_codewords)
+            # removing codewords and re-adding them keeps the code linear; adding other codewords doesn't
+            B.remove_extreme_codeword(bit=0)
+            B_list.remove_extreme_codeword(bit=0)
+            removed_codeword = max(B.codewords)
+            B.remove(removed_codeword)
+            B_list.remove(removed_codeword)
+            assert B.contains_many(test_codewords) == B_list.contains_many(test_codewords)
+            assert B.contains_many([removed_codeword, Binary_codeword(0,n)]) == [False, False]
+            B.add(removed_codeword)
+            assert B.parity_check_matrix().shape == (n-k, n) and B.contains_many([removed_codeword]) == [True]
+            full_code = Binary_code(n, generator_matrix, method='matrix')
+            new_codeword = (x for x in test_codewords if x.length==n and x not in full_code).next()
+            B.add(new_codeword)
+            self.assertRaises(BinaryCodeError, B.parity_check_matrix)
+            assert B.contains_many([new_codeword]) == [True]
+        # conflict counts for codes with and without the syndrome membership check should be the same
+        for i in range(3):
+            B = Binary_code(6, self._random_generator_matrix(3,6), method='matrix')
+            B_list = Binary_code(6, B.codewords)
+            for remove_zero in [False,True]:
+                if remove_zero:
+                    B.remove_extreme_codeword(bit=0)
+                    B_list.remove_extreme_codeword(bit=0)
+                for SC in [True,False]:
+                    assert B.clonality_count_conflicts(0,SC,return_conflict_details=True,quiet=True) == \
+                            B_list.clonality_count_conflicts(0,SC,return_conflict_details=True,quiet=True)
+
+    def test__clonality_functions_match_Binary_code(self):
+        for i in range(3):
+            generator_matrix = self._random_generator_matrix(3,6)
+            for N_changes in [0,1,(1,0),(0,1),(1,2)]:
+                # (remove_all_zero_codeword in clonality_grow_no_conflict_subset below changes the code, so reset it)
+                B = Binary_code(6, generator_matrix, method='matrix')
+                L = Linear_binary_code(6, generator_matrix, method='matrix', chunk_bits=1)
+                for SC in [True,False]:
+                    assert L.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True) == \
+                            B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True)
+                    assert L.clonality_conflict_check(N_changes,SC,quiet=True) == \
+                            B.clonality_conflict_check(N_changes,SC,quiet=True)
+                subset = L.clonality_grow_no_conflict_subset(N_changes, remove_all_zero_codeword=True, quiet=True)
+                assert Binary_code(6,subset).clonality_conflict_check(N_changes,quiet=True) == False
+            # the conflict cache is keyed on the generator and the removed codewords, so the code is never expanded for it
+            L = Linear_binary_code(6, generator_matrix, method='matrix', chunk_bits=1)
+            counts = L.clonality_count_conflicts(1, quiet=True)
+            assert L.clonality_count_conflicts(1, quiet=True) == counts and len(L._conflict_cache) == 1
+            assert L.clonality_conflict_check(1, quiet=True) == any(counts.keys())
+            assert L._packed_cache is None
+            # so is the search for the first conflict
+            L.clear_conflict_cache()
+            for N_changes in [0,1,(1,0),(0,1),(1,2)]:
+                for SC in [True,False]:
+                    assert L.clonality_conflict_check(N_changes,SC,quiet=True) == \
+                            L.expand().clonality_conflict_check(N_changes,SC,quiet=True)
+            assert L._packed_cache is None
+            L.remove(list(L.iter_codewords())[1])
+            assert L.clonality_count_conflicts(1, quiet=True) == L.expand().clonality_count_conflicts(1, quiet=True)
+
+
+class Testing__Neighbor_index(unittest.TestCase):
+    """ Testing Neighbor_index radius queries against the full mutation expansion. """
+
+    def test__queries_match_expansion(self):
+        for (length, N_codewords) in [(1,2), (4,10), (10,50), (70,5)]:
+            codewords = set([Binary_codeword(random.getrandbits(length),length) for i in range(N_codewords)])
+            query_codewords = list(codewords) + [Binary_codeword(random.getrandbits(length),length) for i in range(20)]
+            # (make some queries close to the codewords, otherwise long random ones won't be close to anything)
+            query_codewords += [C ^ Binary_codeword(1|4,length) for C in codewords if length>=3]
+            for N_changes in [0,1,2,3,(0,0),(1,0),(0,2),(2,1)]:
+                if length>10 and _N_changes_radius(N_changes)>2:  continue
+                expanded = expand_by_all_mutations_dict(codewords, N_changes)
+                for N_substrings in [None,1,2,4]:
+                    index = Neighbor_index(codewords, length, 3, N_substrings)
+                    for X in query_codewords:
+                        assert index.query(X, N_changes) == expanded.get(X, set())
+        index = Neighbor_index(codewords, length, 2)
+        self.assertRaises(BinaryCodeError, index.query, X, 3)
+        self.assertRaises(BinaryCodeError, index.query, X, (2,1))
+        assert index.query(X, -1) == set()
+
+
 class Testing__Binary_code__clonality_conflict_functions(unittest.TestCase):
     """ Tests clonality_count_conflicts, clonality_conflict_check, clonality_obvious_no_conflict_subset, 
     clonality_grow_no_conflict_subset (all those functions are related in more or less trivial ways).
     Each test function here tests all the functions listed in parallel - easiest that way."""
 
+    def _random_code_with_conflicts(self, length, N, N_forced):
+        """ Return a Binary_code with N random codewords (fewer if some are the same), plus the A|C results 
+        of up to N_forced pairs of them, so that there are some conflicts for sure. """
+        B = Binary_code(length, set([random.getrandbits(length) for i in range(N)]))
+        codewords = list(B.codewords)
+        for (A,C) in zip(codewords, codewords[1:N_forced+1]):   B.add(A|C)
+        return B
+
     def test__empty_code_gives_no_conflicts(self):
         """ Empty codes should return no conflicts with all option combinations."""
         A = Binary_code(3,[])
@@ -1396,6 +4960,441 @@ class Testing__Binary_code__clonality_conflict_functions(unittest.TestCase):
                     assert len(code.clonality_grow_no_conflict_subset(N_changes,count_self_conflicts=False,
                                more_random=more_random,N_repeats=N_repeats, quiet=True, starting_subset=set([b111]))) == 2
 
+    def test__vectorized_zero_change_conflicts(self):
+        for length in [1,3,6,10,64]:
+            for N_codewords in [0,1,2,20,60]:
+                B = self._random_code_with_conflicts(length, N_codewords, 3)
+                for SC in [True,False]:
+                    expected = B.clonality_count_conflicts(0,SC,return_conflict_details=True,quiet=True,vectorized=False)
+                    for tile_size in [1,3,512]:
+                        assert B.clonality_count_conflicts(0,SC,return_conflict_details=True,quiet=True,
+                                                           tile_size=tile_size) == expected
+                        assert B.clonality_count_conflicts((0,0),SC,quiet=True,tile_size=tile_size) == expected[0]
+
+    def test__parallel_conflict_counting(self):
+        for length in [6,70]:
+            B = self._random_code_with_conflicts(length, 25, 3)
+            for N_changes in [0,1,(0,2)]:
+                for SC in [True,False]:
+                    expected = B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True)
+                    for (N_processes, rows_per_job) in [(2,None),(3,1)]:
+                        assert B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True, 
+                                   N_processes=N_processes, rows_per_job=rows_per_job, use_cache=False) == expected
+
+    def test__parallel_conflict_worker_state_is_picklable(self):
+        # what a spawned worker would get: the state goes through pickle, and the worker makes its own finder
+        import pickle, multiprocessing.sharedctypes
+        B = Binary_code(8, set([random.getrandbits(8) for i in range(30)]))
+        codeword_list, packed = B._sorted_codewords_and_packed()
+        for N_changes in [1,(1,2)]:
+            state = {'length': 8, 'N_allowed_changes': N_changes, 'use_neighbor_index': False, 
+                     'target_weights': B._clonality_weight_pruning(N_changes)[1], 
+                     'count_self_conflicts': False, 'return_conflicts': True, 'tile_size': 512}
+            shared_words = multiprocessing.sharedctypes.RawArray('c', packed.words.nbytes)
+            numpy.frombuffer(shared_words, dtype=numpy.uint64)[:] = packed.words.reshape(-1)
+            _init_conflict_worker(shared_words, packed.words.shape, pickle.loads(pickle.dumps(state)))
+            counts, conflicts = _clonality_conflicts_job((0, len(codeword_list)))
+            expected_counts, expected_details = B.clonality_count_conflicts(N_changes, return_conflict_details=True, 
+                                                                            quiet=True, use_cache=False)
+            assert invert_dict_tolists(dict(zip(codeword_list, counts.tolist()))) == expected_counts
+            assert len(conflicts) == len(expected_details)
+
+    def test__conflict_graph_matches_details(self):
+        for length in [5,70]:
+            B = self._random_code_with_conflicts(length, 20, 3)
+            for N_changes in [0,1,(0,2)]:
+                for SC in [True,False]:
+                    for N_processes in [1,2]:
+                        counts, details, graph = B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True, 
+                                              return_conflict_graph=True, quiet=True, N_processes=N_processes)
+                        assert graph.details() == details
+                        assert len(graph) == len(details)
+                        assert B.clonality_count_conflicts(N_changes, SC, quiet=True, N_processes=N_processes, 
+                                                           return_conflict_graph=True)[1].details() == details
+                        graph_counts = dict(zip(graph.codewords, graph.conflict_counts().tolist()))
+                        assert invert_dict_tolists(graph_counts) == counts
+                        # the CSR adjacency lists every triple each codeword is part of
+                        for (i,codeword) in enumerate(graph.codewords):
+                            triples = graph.triples_involving(i)
+                            assert all(i in (graph.A_indices[t],graph.B_indices[t],graph.C_indices[t]) for t in triples)
+                            assert len(triples) == sum([len(C_set) if codeword in AB_set else int(codeword in C_set) 
+                                                        for (AB_set,_,C_set,_,_) in details])
+                        # blocked counts say which codewords would complete a conflict with a subset
+                        in_subset = numpy.array([random.random()<0.3 for _ in graph.codewords], dtype=bool)
+                        blocked, N_subset_conflicts = graph.blocked_counts(in_subset)
+                        assert (N_subset_conflicts > 0) == any(graph.has_conflict_with_subset(i, in_subset) 
+                                                               for i in numpy.flatnonzero(in_subset))
+                        for i in numpy.flatnonzero(~in_subset):
+                            assert (blocked[i] > 0) == graph.has_conflict_with_subset(i, in_subset)
+
+    def test__conflict_sinks(self):
+        import tempfile, shutil
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for length in [5,70]:
+                B = self._random_code_with_conflicts(length, 15, 3)
+                for N_changes in [0,1,(0,2)]:
+                    for (SC,N_processes) in [(True,1),(False,1),(True,2)]:
+                        counts, details = B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True, 
+                                                                      quiet=True)
+                        tsv_file, record_file = os.path.join(tmpdir,'conflicts.tsv'), os.path.join(tmpdir,'conflicts.bin')
+                        with Conflict_TSV_writer(tsv_file, buffer_lines=3) as tsv_sink:
+                            with Conflict_record_file_writer(record_file, length, N_changes, chunk_words=5) as sink:
+                                for conflict_sink in (tsv_sink, sink):
+                                    assert B.clonality_count_conflicts(N_changes, SC, quiet=True, 
+                                               N_processes=N_processes, conflict_sink=conflict_sink) == counts
+                        assert tsv_sink.N_conflicts == sink.N_conflicts == len(details)
+                        assert set(read_conflict_file(tsv_file)) == details
+                        for chunk_words in [1,7,1000]:
+                            assert list(read_conflict_file(record_file, chunk_words)) == list(read_conflict_file(record_file))
+                            assert set(read_conflict_file(record_file, chunk_words)) == details
+                        # a truncated record file is noticed when reading
+                        if details:
+                            data = open(record_file,'rb').read()
+                            open(record_file,'wb').write(data[:-8])
+                            self.assertRaises(BinaryCodeError, list, read_conflict_file(record_file))
+                        # conflicts with the wrong N_allowed_changes can't be written to a record file
+                        if details:
+                            with Conflict_record_file_writer(record_file, length, 3) as sink:
+                                self.assertRaises(BinaryCodeError, sink.add, list(details)[0])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test__conflict_check_matches_count(self):
+        for length in [3,6,70]:
+            for i in range(4):
+                B = Binary_code(length, set([random.getrandbits(length) for i in range(random.choice([2,5,12]))]))
+                for N_changes in [0,(0,0),1,2,(1,0),(0,1),(2,1)]:
+                    if length>10 and N_changes in [2,(2,1)]:    continue
+                    for SC in [True,False]:
+                        counts, details = B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True)
+                        has_conflict, witness = B.clonality_conflict_check(N_changes,SC,quiet=True,return_witness=True)
+                        assert has_conflict == (counts.keys() not in ([0],[])) == bool(details)
+                        assert B.clonality_conflict_check(N_changes,SC,quiet=True) == has_conflict
+                        assert (witness is None) or (witness in details)
+
+    def test__clonality_distance_histogram(self):
+        for (length, sizes) in [(6,[2,6,14]), (9,[2,6,14]), (12,[40]), (70,[2,6,14,40])]:
+            B = self._random_code_with_conflicts(length, random.choice(sizes), 2)
+            for SC in [True,False]:
+                # compare to brute force (with more codewords, most pair/codeword comparisons are skipped by weight)
+                expected = [Counter(), Counter(), Counter()]
+                for (A,C) in itertools.combinations(B.codewords, 2):
+                    others = [X for X in B.codewords if SC or X not in (A,C)]
+                    changes = [bit_change_count(X, A|C)[::-1] for X in others]     # (1->0, 0->1) changes
+                    expected[0][min([sum(x) for x in changes]) if changes else None] += 1
+                    expected[1][min([a for (a,b) in changes if b==0]+[length+1])] += 1
+                    expected[2][min([b for (a,b) in changes if a==0]+[length+1])] += 1
+                expected = [dict([(d if d<=length else None, N) for (d,N) in counts.items()]) for counts in expected]
+                for (pairs_per_chunk, tile_size) in [(1,1), (5,3), (4096,512)]:
+                    histograms = B.clonality_distance_histogram(SC, quiet=True, pairs_per_chunk=pairs_per_chunk,
+                                                                tile_size=tile_size)
+                    assert list(histograms) == expected
+                # the histograms give the conflict checks for all N_allowed_changes at once
+                lowest = [min([d for d in histogram if d is not None] or [length+1]) for histogram in histograms]
+                for r in range(3):
+                    assert B.clonality_conflict_check(r, SC, quiet=True) == (lowest[0] <= r)
+                    assert B.clonality_conflict_check((r,0), SC, quiet=True) == (lowest[1] <= r)
+                    assert B.clonality_conflict_check((0,r), SC, quiet=True) == (lowest[2] <= r)
+                N_pairs = B.size()*(B.size()-1)/2
+                worst_pairs = B.clonality_distance_histogram(SC, quiet=True, N_worst_pairs=4, pairs_per_chunk=3)[3]
+                assert len(worst_pairs) == min(4, N_pairs)
+                assert [d for (_,_,_,d) in worst_pairs] == sorted([d for (d,N) in histograms[0].items()
+                                                                   for i in range(N)], key=lambda d: (d is None, d))[:4]
+                for (pair, result, C, distance) in worst_pairs:
+                    if C is not None:   assert Hamming_distance(result, C) == distance and (SC or C not in pair)
+
+    def test__weight_pruning_gives_same_conflicts(self):
+        for length in [6,9]:
+            B_full = Binary_code(length, set([random.getrandbits(length) for i in range(25)]))
+            # constant-weight, narrow weight band, and random codes
+            for (low,high) in [(3,3),(3,4),(0,-1)]:
+                B = Binary_code(length, B_full.choose_codewords_by_bit_sum(low,high))
+                for N_changes in [1,2,(1,0),(0,1),(2,1),(0,2)]:
+                    for SC in [True,False]:
+                        # brute force, without any pruning
+                        expected = set()
+                        def is_close(X, result):
+                            (zero_to_one, one_to_zero) = bit_change_count(X, result)
+                            if isinstance(N_changes,int):   return zero_to_one + one_to_zero <= N_changes
+                            else:                           return one_to_zero <= N_changes[0] and zero_to_one <= N_changes[1]
+                        for (A,C) in itertools.combinations(B.codewords, 2):
+                            close = set([X for X in B.codewords if is_close(X, A|C)])
+                            if close-set([A,C]):    expected.add((frozenset([A,C]), A|C, frozenset(close-set([A,C])),
+                                                                  '', N_changes))
+                            elif close and SC:      expected.add((frozenset([A,C]), A|C, frozenset(close),
+                                                                  'self', N_changes))
+                        assert B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True, quiet=True,
+                                                           use_cache=False)[1] == expected
+        # in a constant-weight code, A|B is always heavier than all the codewords
+        B = Binary_code(6, ['110000','011000','001100','000011'])
+        assert not any(B._clonality_weight_pruning((2,0))[0]) and not any(B._clonality_weight_pruning((2,0))[1])
+        assert B._clonality_weight_pruning((0,1)) == ([False]*3+[True]+[False]*3, [False]*2+[True]*2+[False]*3)
+
+    def test__max_safe_N_allowed_changes(self):
+        for (length, max_radius) in [(6,None),(9,None),(9,3),(70,2)]:
+            for N in [1,4,10]:
+                B = Binary_code(length, set([random.getrandbits(length) for i in range(N)]))
+                for SC in [True,False]:
+                    max_N_changes, safe_frontier = B.clonality_max_safe_N_allowed_changes(SC, quiet=True,
+                                                                                         max_radius=max_radius)
+                    radius = length if max_radius is None else max_radius
+                    # compare to checking each N_allowed_changes separately
+                    safe = dict([((a,b), not B.clonality_conflict_check((a,b), SC, quiet=True))
+                                 for a in range(radius+1) for b in range(radius+1-a)])
+                    expected_N = max([-1]+[r for r in range(radius+1) if not B.clonality_conflict_check(r,SC,quiet=True)])
+                    assert max_N_changes == (expected_N if expected_N>=0 else None)
+                    assert safe_frontier == sorted([(a,b) for ((a,b),is_safe) in safe.items() if is_safe
+                                                    and not safe.get((a+1,b)) and not safe.get((a,b+1))])
+                    # same as the lowest distance from the clonality distance histogram, unless that's over the limit
+                    distances = [d for d in B.clonality_distance_histogram(SC, quiet=True)[0] if d is not None]
+                    if distances and min(distances) <= radius:
+                        assert min(distances) == (-1 if max_N_changes is None else max_N_changes) + 1
+        # with no codeword pairs at all, everything is safe
+        assert Binary_code(4, ['1010']).clonality_max_safe_N_allowed_changes() == (4, [(0,4),(1,3),(2,2),(3,1),(4,0)])
+
+    def test__conflict_cell_searches(self):
+        for length in [6,9,12]:
+            for N in [2,5,20]:
+                B = Binary_code(length, set([random.getrandbits(length) for i in range(N)]))
+                words = B.packed().words
+                # the pair result table is the same however it's split into chunks
+                tables = [_clonality_pair_result_table(words, pairs_per_chunk) for pairs_per_chunk in [1,7,2**20]]
+                for table in tables[1:]:
+                    assert all([(x==y).all() for (x,y) in zip(table, tables[0])])
+                for SC in [True,False]:
+                    # comparing pairs to codewords directly gives the same cells as looking at all the mutations
+                    cell_search = _Clonality_change_cell_search(words, length, SC)
+                    expected = _minimal_cells([(a,b) for a in range(length+1) for b in range(length+1-a)
+                                               if cell_search.has_conflict(a,b)])
+                    assert clonality_conflict_cells_packed(words, length, SC) == expected
+                    assert clonality_conflict_cells_packed(words, length, SC, pairs_per_chunk=3, tile_size=2) == expected
+                    assert clonality_conflict_cells_packed(words, length, SC, 2) == [(a,b) for (a,b) in expected if a+b<=2]
+                    assert clonality_conflict_cells_packed(words, length, SC, known_cells=expected[:1]) == expected
+
+    def test__conflict_cache(self):
+        for length in [6,70]:
+            B = self._random_code_with_conflicts(length, 15, 3)
+            codewords = list(B.codewords)
+            for N_changes in [0,(0,1)]:
+                for SC in [True,False]:
+                    expected = B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True, quiet=True,
+                                                           use_cache=False)
+                    # the first call fills the cache, the second one uses it - same results either way
+                    for i in range(2):
+                        counts, details, graph = B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True,
+                                                                             return_conflict_graph=True, quiet=True)
+                        assert (counts, details) == expected
+                        assert B._cached_conflicts(B._conflict_cache_key(N_changes, SC))[1] is graph
+                        assert B.clonality_conflict_check(N_changes, SC, quiet=True) == bool(details)
+                    # changing the returned counts doesn't change the cached ones
+                    counts.clear()
+                    assert B.clonality_count_conflicts(N_changes, SC, quiet=True) == expected[0]
+            assert len(B._conflict_cache) == 4
+            # calls that don't ask for a graph only cache the counts, and calls that need a graph don't use those
+            B.clear_conflict_cache()
+            expected = B.clonality_count_conflicts(1, return_conflict_details=True, quiet=True, use_cache=False)
+            assert B.clonality_count_conflicts(1, quiet=True) == expected[0]
+            assert B._cached_conflicts(B._conflict_cache_key(1, False))[1] is None
+            assert B.clonality_count_conflicts(1, return_conflict_details=True, quiet=True) == expected
+            assert B.clonality_conflict_check(1, quiet=True) == bool(expected[1])
+            counts, graph = B.clonality_count_conflicts(1, return_conflict_graph=True, quiet=True)
+            assert counts == expected[0] and graph.details() == expected[1]
+            assert B._cached_conflicts(B._conflict_cache_key(1, False))[1] is graph
+            # changing the code in any way clears the cache (or makes the old entries unused)
+            B.remove(codewords[0])
+            assert len(B._conflict_cache) == 0
+            B.clonality_count_conflicts(quiet=True)
+            B.add(codewords[0])
+            assert len(B._conflict_cache) == 0
+            B.clonality_count_conflicts(quiet=True)
+            B.remove_extreme_codeword(1)
+            B.add('1'*length)
+            assert len(B._conflict_cache) == 0
+            B.codewords = set(codewords[:5])
+            assert B.clonality_count_conflicts(return_conflict_details=True, quiet=True) \
+                    == B.clonality_count_conflicts(return_conflict_details=True, quiet=True, use_cache=False)
+            # over the memory limit, the least recently used results are dropped; with a limit of 0, nothing is cached
+            for N_changes in [1,0,2]:   B.clonality_count_conflicts(N_changes, quiet=True)
+            sizes = dict((key[1], cached[2]) for (key, cached) in B._conflict_cache.items())
+            B.conflict_cache_max_MB = (sizes[0] + sizes[2])/2.**20
+            B.clear_conflict_cache()
+            B.clonality_count_conflicts(1, quiet=True)
+            B.clonality_count_conflicts(0, quiet=True)
+            B.clonality_count_conflicts(2, quiet=True)
+            assert B._conflict_cache.keys() == [B._conflict_cache_key(0,False), B._conflict_cache_key(2,False)]
+            B.conflict_cache_max_MB = 0
+            B.clear_conflict_cache()
+            B.clonality_count_conflicts(quiet=True)
+            assert len(B._conflict_cache) == 0
+            # with the cache off (or not used), the codewords aren't even fingerprinted
+            packed = B._sorted_codewords_and_packed()[1]
+            packed.fingerprint = None
+            B.clonality_count_conflicts(1, quiet=True)
+            B.clonality_conflict_check(1, quiet=True)
+            B.conflict_cache_max_MB = 1
+            B.clonality_count_conflicts(1, quiet=True, use_cache=False)
+            B.clonality_conflict_check(1, quiet=True)
+            del packed.fingerprint
+
+    def test__conflict_search_only_done_once(self):
+        for length in [6,70]:
+            for N_changes in [1,(0,1)]:
+                B = self._random_code_with_conflicts(length, 15, 3)
+                # each conflict search (full or stopping at the first conflict) makes one close-codeword finder
+                N_searches = [0]
+                original_finder = B._close_codeword_finder
+                def counting_finder(*args, **kwargs):
+                    N_searches[0] += 1
+                    return original_finder(*args, **kwargs)
+                B._close_codeword_finder = counting_finder
+                subset = B.clonality_obvious_no_conflict_subset(N_changes, quiet=True)
+                has_conflict = B.clonality_conflict_check(N_changes, quiet=True)
+                grown_subset = B.clonality_grow_no_conflict_subset(N_changes, quiet=True)
+                assert N_searches[0] == 1
+                assert has_conflict == (subset != B.codewords)
+                assert subset.issubset(grown_subset)
+                del B._close_codeword_finder
+
+    def test__incremental_conflict_tracking(self):
+        for length in [4,7]:
+            for N_changes in [0,1,(1,0),(0,1),(2,1)]:
+                for SC in [True,False]:
+                    B = Binary_code(length, set([random.getrandbits(length) for i in range(6)]))
+                    tracker = B.enable_conflict_tracking(N_changes, SC)
+                    for i in range(12):
+                        codeword = Binary_codeword(random.getrandbits(length), length)
+                        if codeword in B and random.random()<0.7:
+                            changed_conflicts = tracker.conflicts_if_removed(codeword)
+                            old_conflicts = tracker.conflict_details()
+                            B.remove(codeword)
+                            assert not tracker.conflicts_involving(codeword)
+                            assert (old_conflicts - changed_conflicts).issubset(tracker.conflict_details())
+                        else:
+                            expected_conflicts = tracker.conflicts_if_added(codeword)
+                            B.add(codeword)
+                            assert tracker.conflicts_involving(codeword) == expected_conflicts
+                        counts, details = B.clonality_count_conflicts(N_changes, SC, return_conflict_details=True, 
+                                                                      quiet=True)
+                        assert tracker.conflict_counts() == counts
+                        assert tracker.conflict_details() == details
+                        assert tracker.has_conflicts() == bool(details)
+                    # replacing the codeword set directly makes the tracker recalculate everything
+                    B.codewords = set(list(B.codewords)[:3])
+                    assert tracker.conflict_details() == B.clonality_count_conflicts(N_changes, SC, 
+                                                                    return_conflict_details=True, quiet=True)[1]
+        self.assertRaises(BinaryCodeError, Linear_binary_code(3,[[1,1,0]]).enable_conflict_tracking)
+
+    def test__conflict_tracking_update_cost(self):
+        # adding a codeword looks up the close codewords for the N new pairs, and for the existing pairs only if
+        #  their A|B is close to the new codeword - so for a typical codeword that's linear in the code size
+        for (length, N_changes) in [(30,(1,1)), (70,1)]:
+            for N in [50,200]:
+                B = Binary_code(length, set([random.getrandbits(length) for i in range(N)]))
+                tracker = B.enable_conflict_tracking(N_changes)
+                lookups = [0]
+                def counting_close_codewords(clonality_result, extra_codeword=None,
+                                             original=tracker._close_codewords):
+                    lookups[0] += 1
+                    return original(clonality_result, extra_codeword)
+                tracker._close_codewords = counting_close_codewords
+                codeword = Binary_codeword(''.join(random.sample('1'*(length//2) + '0'*(length-length//2), length)))
+                B.add(codeword)
+                assert B.size()-1 <= lookups[0] <= 1.1*B.size()
+                # codewords with most bits set can be close to a lot of the existing pairs - results still match
+                B.add('1'*length)
+                assert tracker.conflict_details() == B.clonality_count_conflicts(N_changes, return_conflict_details=True,
+                                                                                 quiet=True, use_cache=False)[1]
+
+    def test__neighbor_index_gives_same_conflicts(self):
+        for length in [3,6,10]:
+            B = Binary_code(length, set([random.getrandbits(length) for i in range(12)]))
+            for N_changes in [1,2,(1,0),(0,1),(2,1)]:
+                for SC in [True,False]:
+                    assert B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True) == \
+                        B.clonality_count_conflicts(N_changes,SC,return_conflict_details=True,quiet=True, 
+                                                    use_neighbor_index=True)
+
+    def test__seeded_parallel_repeats(self):
+        assert repeat_seeds(7, 5) == repeat_seeds(7, 5) != repeat_seeds(8, 5)
+        B = Binary_code(10, set([random.getrandbits(10) for i in range(80)]))
+        L = Linear_binary_code(8, [[1,0,0,0,1,1,0,1],[0,1,0,0,1,0,1,1],[0,0,1,0,0,1,1,1],[0,0,0,1,1,1,1,0]])
+        for seed in [0,12345]:
+            # the results only depend on the seed, not on the number of processes or the global random state
+            for N_changes in [0,(0,1)]:
+                random.seed(seed+1)
+                expected = B.clonality_grow_no_conflict_subset(N_changes, N_repeats=12, return_repeat_summary=True, 
+                                                               seed=seed, quiet=True)
+                for N_processes in [1,2,3]:
+                    random.seed(seed+N_processes)
+                    assert B.clonality_grow_no_conflict_subset(N_changes, N_repeats=12, return_repeat_summary=True, 
+                                                           seed=seed, N_processes=N_processes, quiet=True) == expected
+                assert Binary_code(10, expected[0]).clonality_count_conflicts(N_changes, quiet=True).keys() == [0]
+            for code in [B,L]:
+                expected = code.give_N_codewords_even_distribution(5, N_tries=20, return_repeat_summary=True, seed=seed)
+                for N_processes in [2,3]:
+                    assert code.give_N_codewords_even_distribution(5, N_tries=20, return_repeat_summary=True, 
+                                                                   seed=seed, N_processes=N_processes) == expected
+        # with N_processes>1 and no seed, the seed comes from the random module
+        random.seed(3)
+        expected = B.clonality_grow_no_conflict_subset(0, N_repeats=8, return_repeat_summary=True, N_processes=2)
+        random.seed(3)
+        assert B.clonality_grow_no_conflict_subset(0, N_repeats=8, return_repeat_summary=True, N_processes=3) == expected
+
+    def test__local_search_subset(self):
+        for (length,N_changes) in [(8,0),(8,1),(9,(0,1)),(70,0)]:
+            B = self._random_code_with_conflicts(length, 60, 9)
+            for SC in [True,False]:
+                subset, improvements = B.clonality_local_search_subset(N_changes, count_self_conflicts=SC, 
+                                 time_limit=None, max_iterations=300, seed=5, quiet=True, return_search_summary=True)
+                # (checking against the conflicts of the whole code - with self-conflicts and N_changes>0, the subset 
+                #  on its own can have new self-conflicts, when A|B was close to both A and another codeword C)
+                graph = B.clonality_count_conflicts(N_changes, SC, quiet=True, return_conflict_graph=True)[1]
+                assert graph.blocked_counts(graph.subset_mask(subset))[1] == 0
+                assert subset <= B.codewords and len(subset) == improvements[-1][2]
+                # it starts with the greedy result and only keeps improvements
+                assert [x[2] for x in improvements] == sorted(set([x[2] for x in improvements]))
+                assert B.clonality_local_search_subset(N_changes, count_self_conflicts=SC, time_limit=None, 
+                                                       max_iterations=300, seed=5, quiet=True) == subset
+                # starting_subset codewords are always kept
+                starting_subset = set(random.sample(sorted(subset), 3))
+                assert starting_subset <= B.clonality_local_search_subset(N_changes, starting_subset=starting_subset, 
+                                           count_self_conflicts=SC, time_limit=1, max_iterations=100, quiet=True)
+                # it stops as soon as the target size is reached
+                subset, improvements = B.clonality_local_search_subset(N_changes, count_self_conflicts=SC, 
+                                             target_size=2, time_limit=5, quiet=True, return_search_summary=True)
+                assert len(subset) >= 2 and improvements[-1][0] == 0
+        self.assertRaises(BinaryCodeError, B.clonality_local_search_subset, 0, time_limit=None, quiet=True)
+        self.assertRaises(BinaryCodeError, B.clonality_local_search_subset, 0, starting_subset=B.codewords, 
+                          time_limit=1, quiet=True)
+
+    def test__exact_no_conflict_subset(self):
+        for (length,N_codewords) in [(4,8),(5,10),(6,12)]:
+            B = Binary_code(length, set([random.getrandbits(length) for i in range(N_codewords)]))
+            for N_changes in [0,1,(0,1)]:
+                for SC in [False,True]:
+                    subset, (is_optimal, upper_bound, N_nodes) = B.clonality_exact_no_conflict_subset(N_changes, 
+                                  count_self_conflicts=SC, local_search_moves=0, quiet=True, return_search_summary=True)
+                    # compare to the biggest conflict-free subset found by trying all subsets, biggest first
+                    graph = B.clonality_count_conflicts(N_changes, SC, quiet=True, return_conflict_graph=True)[1]
+                    assert graph.blocked_counts(graph.subset_mask(subset))[1] == 0
+                    for size in range(B.size(),-1,-1):
+                        if any([graph.blocked_counts(graph.subset_mask(S))[1]==0 
+                                for S in itertools.combinations(graph.codewords,size)]):    break
+                    assert is_optimal and len(subset) == upper_bound == size
+                    assert len(subset) >= len(B.clonality_grow_no_conflict_subset(N_changes, count_self_conflicts=SC, 
+                                                                                  N_repeats=5, quiet=True))
+                    # starting_subset codewords are always kept (and can make the best subset smaller)
+                    starting_subset = set(random.sample(sorted(subset), min(2,len(subset))))
+                    subset_2 = B.clonality_exact_no_conflict_subset(N_changes, count_self_conflicts=SC, quiet=True, 
+                                                                    starting_subset=starting_subset)
+                    assert starting_subset <= subset_2 and len(subset_2) <= len(subset)
+        # stopping early gives a subset and an upper bound, which may or may not be the same
+        B = Binary_code(8, set([random.getrandbits(8) for i in range(60)]))
+        subset, (is_optimal, upper_bound, N_nodes) = B.clonality_exact_no_conflict_subset(0, node_limit=3, 
+                                       N_greedy_repeats=1, local_search_moves=0, quiet=True, return_search_summary=True)
+        assert N_nodes <= 3 and upper_bound >= len(subset) and is_optimal == (upper_bound == len(subset))
+
     def test__clonality_grow_no_conflict_subset(self):
         """ Extra clonality_grow_no_conflict_subset checks with larger real codes - doesn't check the results compared
         to ones calculated by hand, just makes sure they're internally consistent."""
@@ -19,6 +19,8 @@ USAGE:  robotic_plate_transfer.py [options] outfile_base_name
 # standard libraries
 import sys, os
 import unittest
+import hashlib
+import tempfile
 from collections import defaultdict, Counter
 import itertools
 from math import ceil
@@ -477,6 +479,19 @@ class Testing__assign_codewords(unittest.TestCase):
             self.assertRaises(PlateTransferError, assign_codewords, 4,1,self.B_without_00,take_high=h,quiet=True)
             self.assertRaises(PlateTransferError, assign_codewords, 4,3,self.B_without_00,take_high=h,quiet=True)
 
+    def test__lazy_linear_code(self):
+        """ A Linear_binary_code should work just like the equivalent fully generated Binary_code. """
+        generator_matrix = [[1,0,0,1,1],[0,1,0,1,0],[0,0,1,0,1]]
+        for h in [True,False]:
+            L = binary_code_utilities.Linear_binary_code(5,generator_matrix)
+            B = binary_code_utilities.Binary_code(5,generator_matrix,method='matrix')
+            codewords = assign_codewords(4,5,L,take_high=h,quiet=True)
+            assert len(codewords) == 4 and codewords == sorted(codewords)
+            assert set(codewords).issubset(B.codewords) and binary_code_utilities.Binary_codeword('00000') not in codewords
+            # with all 7 nonzero codewords taken, the result is always the same
+            assert assign_codewords(7,5,L,take_high=h,quiet=True) == sorted(B.codewords - set([binary_code_utilities.Binary_codeword('00000')]))
+            self.assertRaises(PlateTransferError, assign_codewords, 8,5,L,take_high=h,quiet=True)
+
 
 class Testing__make_Biomek_file_commands(unittest.TestCase):
     """ Unit-tests for the make_Biomek_file_commands function. """
@@ -549,9 +564,81 @@ class Testing__split_command_list_to_max_commands(unittest.TestCase):
         assert split_command_list_to_max_commands(['a','b','c','d'], 4) == [['a','b','c','d']]
 
 
+class Testing__code_cache(unittest.TestCase):
+    """ Unit-tests for the parsed-code cache (get_binary_code with a cache_dir). """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmpdir, 'cache')
+        self.listfile = os.path.join(self.tmpdir, 'code_list')
+        self.matrixfile = os.path.join(self.tmpdir, 'code_matrix')
+        open(self.listfile,'w').write('011\n101\n110\n')
+        open(self.matrixfile,'w').write('10011\n01010\n00101\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmpdir)
+
+    def _cache_files(self):
+        return sorted(f for f in os.listdir(self.cache_dir) if f.endswith(CODE_CACHE_SUFFIX))
+
+    def test__cached_code_matches_original(self):
+        B_list = get_binary_code(3, listfile=self.listfile)
+        B_matrix = get_binary_code(5, matrixfile=self.matrixfile)
+        # first run fills the cache, second one reads from it - the result should be the same both times
+        for i in range(2):
+            assert get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir) == B_list
+            assert get_binary_code(5, matrixfile=self.matrixfile, cache_dir=self.cache_dir) == B_matrix
+            assert len(self._cache_files()) == 2
+        # changing the file gives a new cache entry
+        open(self.listfile,'w').write('011\n101\n')
+        assert get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir).size() == 2
+        assert len(self._cache_files()) == 3
+        # a damaged cache entry is replaced
+        cache_file = os.path.join(self.cache_dir, code_cache_key(self.listfile, 'listfile', 3) + CODE_CACHE_SUFFIX)
+        open(cache_file,'w').write('garbage')
+        assert get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir, quiet=True).size() == 2
+        assert get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir).size() == 2
+        assert clear_code_cache(self.cache_dir) == 3 and self._cache_files() == []
+
+    def test__cache_eviction(self):
+        get_binary_code(5, matrixfile=self.matrixfile, cache_dir=self.cache_dir)
+        get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir)
+        assert len(self._cache_files()) == 2
+        # with a 0 size limit, everything gets evicted
+        evict_code_cache_entries(self.cache_dir, 0)
+        assert self._cache_files() == []
+        # the least recently used entry is removed first
+        get_binary_code(5, matrixfile=self.matrixfile, cache_dir=self.cache_dir)
+        get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir)
+        matrix_cache_file = code_cache_key(self.matrixfile, 'matrixfile', 5) + CODE_CACHE_SUFFIX
+        list_cache_file = code_cache_key(self.listfile, 'listfile', 3) + CODE_CACHE_SUFFIX
+        os.utime(os.path.join(self.cache_dir, matrix_cache_file), (1,1))
+        os.utime(os.path.join(self.cache_dir, list_cache_file), (2,2))
+        # using the matrix entry makes it the most recently used one
+        get_binary_code(5, matrixfile=self.matrixfile, cache_dir=self.cache_dir)
+        size_MB = os.path.getsize(os.path.join(self.cache_dir, matrix_cache_file)) / float(2**20)
+        evict_code_cache_entries(self.cache_dir, size_MB)
+        assert self._cache_files() == [matrix_cache_file]
+
+    def test__failed_cache_write_leaves_no_files(self):
+        def failing_write(binary_code, outfile):
+            open(outfile,'w').write('partial')
+            raise IOError("disk full")
+        original_write = binary_code_utilities.Binary_code.write_code_to_binary_file
+        binary_code_utilities.Binary_code.write_code_to_binary_file = failing_write
+        try:
+            assert get_binary_code(3, listfile=self.listfile, cache_dir=self.cache_dir, quiet=True).size() == 3
+        finally:
+            binary_code_utilities.Binary_code.write_code_to_binary_file = original_write
+        assert os.listdir(self.cache_dir) == []
+
+
 def do_test_run():
     """ Test run: run script on test infile, compare output to reference file."""
     parser = define_option_parser()
+    # test runs shouldn't write to the user's code cache directory
+    parser.set_defaults(no_code_cache=True)
     if not os.access("./error-correcting_codes",os.F_OK):
         print "Error: there is not error-correcting_codes folder in this directory - can't run tests."
         return 1
@@ -769,8 +856,82 @@ def split_command_list_to_max_commands(Biomek_file_commands, max_lines=300):
 
 ### Input/output functions - no need/ability to unit-test, all the complicated functionality should be elsewhere.
 
-def get_binary_code(length,listfile=None,matrixfile=None):
-    """ Given a listfile or matrixfile name (but not both!), return the generated binary code."""
+### Parsed-code cache: the expanded codes are kept in the binary code file format (see binary_code_utilities), 
+#  named by a hash of the code file path, size, mtime and contents, plus the method and codeword length.
+
+DEFAULT_CODE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'robotic_plate_transfer')
+DEFAULT_CODE_CACHE_MAX_MB = 256
+CODE_CACHE_SUFFIX = '.bincode'
+
+def code_cache_key(infile, method, length):
+    """ Return the cache entry name for the code file: a hash of its path, size, mtime and contents, method and length."""
+    file_stat = os.stat(infile)
+    content_hash = hashlib.sha1(open(infile,'rb').read()).hexdigest()
+    key_data = (os.path.abspath(infile), file_stat.st_size, file_stat.st_mtime, content_hash, method, int(length))
+    return hashlib.sha1(repr(key_data)).hexdigest()
+
+def clear_code_cache(cache_dir=DEFAULT_CODE_CACHE_DIR):
+    """ Remove all the entries from the parsed-code cache; return the number of removed entries. """
+    if not os.path.isdir(cache_dir):    return 0
+    cache_files = [os.path.join(cache_dir,f) for f in os.listdir(cache_dir) if f.endswith(CODE_CACHE_SUFFIX)]
+    for cache_file in cache_files:
+        os.remove(cache_file)
+    return len(cache_files)
+
+def evict_code_cache_entries(cache_dir, max_size_MB=DEFAULT_CODE_CACHE_MAX_MB):
+    """ Remove the least recently used cache entries (by mtime - it's updated on each use) until the total size 
+    of the cache is under max_size_MB. """
+    cache_files = [os.path.join(cache_dir,f) for f in os.listdir(cache_dir) if f.endswith(CODE_CACHE_SUFFIX)]
+    cache_files = sorted([(os.path.getmtime(f), os.path.getsize(f), f) for f in cache_files])
+    total_size = sum(size for (_,size,_) in cache_files)
+    for (_, size, cache_file) in cache_files:
+        if total_size <= max_size_MB*2**20:     break
+        os.remove(cache_file)
+        total_size -= size
+
+def get_cached_binary_code(length, infile, method, cache_dir=DEFAULT_CODE_CACHE_DIR, 
+                           max_size_MB=DEFAULT_CODE_CACHE_MAX_MB, quiet=False):
+    """ Return the binary code from infile (read with the given method, as for Binary_code), using the parsed-code cache.
+
+    If there's a matching cache entry, load the code from it (and mark it as recently used); 
+     if there's none, or it's damaged, read the code from infile and save it to the cache, evicting old entries if needed.
+    Problems with the cache directory only give a warning (unless quiet is True) - the code is just read from infile.
+    """
+    cache_file = os.path.join(cache_dir, code_cache_key(infile, method, length) + CODE_CACHE_SUFFIX)
+    if os.path.exists(cache_file):
+        try:
+            binary_code = binary_code_utilities.Binary_code(length=length, val=cache_file, method='binaryfile')
+            os.utime(cache_file, None)
+            return binary_code
+        except (binary_code_utilities.BinaryCodeError, IOError, OSError):
+            if not quiet:   print "Warning: code cache file %s is damaged - removing it."%cache_file
+            try:                os.remove(cache_file)
+            except OSError:     pass
+    binary_code = binary_code_utilities.Binary_code(length=length, val=infile, method=method)
+    tmp_filename = None
+    try:
+        if not os.path.isdir(cache_dir):    os.makedirs(cache_dir)
+        # write to a temporary file and rename it, so other runs never see a half-written cache file
+        tmp_file = tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False)
+        tmp_file.close()
+        tmp_filename = tmp_file.name
+        binary_code.write_code_to_binary_file(tmp_filename)
+        os.rename(tmp_filename, cache_file)
+        tmp_filename = None
+        evict_code_cache_entries(cache_dir, max_size_MB)
+    except (IOError, OSError), e:
+        if not quiet:   print "Warning: couldn't save code to cache directory %s (%s)."%(cache_dir, e)
+    finally:
+        # if writing or renaming failed, don't leave the temporary file behind
+        if tmp_filename is not None:
+            try:                os.remove(tmp_filename)
+            except OSError:     pass
+    return binary_code
+
+def get_binary_code(length,listfile=None,matrixfile=None,cache_dir=None,max_cache_size_MB=DEFAULT_CODE_CACHE_MAX_MB,
+                    quiet=False):
+    """ Given a listfile or matrixfile name (but not both!), return the generated binary code.
+    If cache_dir is given, use the parsed-code cache there (see get_cached_binary_code). """
     if not (listfile or matrixfile):
         raise PlateTransferError("You must provide either a listfile or a matrixfile to generate a binary code!")
     if listfile and matrixfile:
@@ -781,6 +942,8 @@ def get_binary_code(length,listfile=None,matrixfile=None):
     elif matrixfile:
         method = 'matrixfile'
         infile = matrixfile
+    if cache_dir:
+        return get_cached_binary_code(length, infile, method, cache_dir, max_cache_size_MB, quiet)
     binary_code = binary_code_utilities.Binary_code(length=length, val=infile, method=method)
     return binary_code
 
@@ -962,6 +1125,17 @@ def define_option_parser():
                       help="File containing the binary code to use for the pooling (as a list of codewords).")
     parser.add_option('-C','--binary_code_generator_file', metavar='FILE', 
                       help="File containing the binary code to use for the pooling (as a generator matrix).")
+    parser.add_option('--code_cache_dir', default=DEFAULT_CODE_CACHE_DIR, metavar='DIR', 
+                      help="Directory for the parsed-code cache: codes read from -c/-C files are saved there in a "
+                      + "fast-loading binary format and reused as long as the file doesn't change (default %default).")
+    parser.add_option('--code_cache_max_MB', type='int', default=DEFAULT_CODE_CACHE_MAX_MB, metavar='N', 
+                      help="Maximum total size of the parsed-code cache; least recently used entries are removed "
+                      + "when it's exceeded (default %default).")
+    parser.add_option('--no_code_cache', action='store_true', default=False, 
+                      help="Don't use the parsed-code cache: always read the -c/-C file directly (default False).")
+    parser.add_option('--clear_code_cache', action='store_true', default=False, 
+                      help="Remove all entries from the parsed-code cache before running (if no other arguments are "
+                      + "given, just clear the cache and exit) (default False).")
     parser.add_option('-M','--add_mirror_pooling_files', action='store_true', default=False, 
                       help="In addition to the normal Biomek file, also make files with commands for a 'mirrored' set: " 
                       + "if sample A is in pool B in the normal set it isn't in the mirrored set, and vice versa.")
@@ -1048,7 +1222,9 @@ def run_main_function(parser,options,args):
     (main_outfile, outfiles_Biomek, outfiles_Biomek_mirror) = outfiles
     # assign codewords to samples
     binary_code = get_binary_code(options.number_of_pools, 
-                                  options.binary_code_list_file, options.binary_code_generator_file)
+                                  options.binary_code_list_file, options.binary_code_generator_file, 
+                                  cache_dir=(None if options.no_code_cache else options.code_cache_dir), 
+                                  max_cache_size_MB=options.code_cache_max_MB, quiet=options.quiet)
     sample_codewords = assign_codewords(options.number_of_samples, options.number_of_pools, binary_code, 
                                         quiet=options.quiet)
     # generate plate names from strings if they weren't given as lists
@@ -1119,5 +1295,10 @@ if __name__=='__main__':
         test_result = do_test_run()
         sys.exit(test_result)
 
+    if options.clear_code_cache:
+        N_removed = clear_code_cache(options.code_cache_dir)
+        if not options.quiet:   print("Removed %s entries from the code cache in %s."%(N_removed, options.code_cache_dir))
+        if not args:            sys.exit(0)
+
     # If it's not a test run, just run the main functionality
     run_main_function(parser,options,args)